@@ -0,0 +1,184 @@
+import hashlib
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+from django.views.decorators.http import require_GET
+
+from .cards import attach_genres
+from .genres import genre_registry
+from .models import Listing, Bid, ArchivedListing, ArchivedBid
+from .pagination import MergedListings, keyset_page
+
+# JSON read API, version 1. Every response carries an ETag (and a Last-Modified where the data has a
+# modification time) and answers a matching conditional GET with an empty 304, skipping
+# serialization; listing data is validated by each listing's `version`. Closed listings moved to
+# the archive (auctions.archive) are served as before, from the archive tables.
+
+MAX_PAGE_SIZE = 100
+
+SUMMARY_FIELDS = ['listing_id', 'title', 'starting_bid', 'current_price', 'bid_count', 'status', 'date',
+                  'ends_at', 'modified', 'version', 'thumbnail', 'owner__username']
+# an archived listing's `modified` is when it was archived
+ARCHIVED_SUMMARY_FIELDS = [field if field != 'modified' else 'archived' for field in SUMMARY_FIELDS if field != 'status']
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def conditional(request, etag, last_modified, payload):
+    """Build a JsonResponse from `payload()`, or a 304 if the client's copy is still current."""
+    etag = quote_etag(etag)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(payload())
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # clients may keep responses but have to revalidate them, which is what the 304s are for
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def file_url(field):
+    return field.url if field else None
+
+
+def listing_summary(listing):
+    return {
+        'id': listing.listing_id,
+        'title': listing.title,
+        'starting_bid': listing.starting_bid,
+        'current_price': listing.current_price,
+        'bid_count': listing.bid_count,
+        'active': listing.status,
+        'owner': listing.owner.username,
+        'created': listing.date,
+        'ends_at': listing.ends_at,
+        'modified': listing.modified,
+        'version': listing.version,
+        'thumbnail': file_url(listing.thumbnail),
+    }
+
+
+def listing_detail(listing):
+    return {
+        **listing_summary(listing),
+        'description': listing.description,
+        'highest_bidder': listing.highest_bidder.username if listing.highest_bidder else None,
+        'image': file_url(listing.image),
+        'image_webp': file_url(listing.image_webp),
+        'genres': [genre.slug for genre in listing.card_genres],
+        'bids': reverse('api_listing_bids', args=[listing.listing_id]),
+    }
+
+
+def summaries(queryset):
+    fields = ARCHIVED_SUMMARY_FIELDS if queryset.model is ArchivedListing else SUMMARY_FIELDS
+    return queryset.select_related('owner').only(*fields)
+
+
+# newest-first page of listings (from any of `querysets`) behind a ?cursor=, validated by the ids
+# and versions on the page
+def listing_page(request, *querysets):
+    try:
+        limit = min(int(request.GET.get('limit', settings.LISTINGS_PER_PAGE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return error('limit must be a number.', 400)
+    if limit < 1:
+        return error('limit must be positive.', 400)
+
+    queryset = MergedListings(*(summaries(queryset) for queryset in querysets))
+    page = keyset_page(queryset, request.GET.get('cursor'), limit)
+
+    next_url = None
+    if page.has_next():
+        next_url = f"{request.path}?{urlencode({**request.GET.dict(), 'cursor': page.next_cursor})}"
+    state = ','.join(f'{listing.listing_id}:{listing.version}' for listing in page) + f'|{page.next_cursor}'
+    last_modified = max((listing.modified for listing in page), default=None)
+
+    return conditional(request, hashlib.sha1(state.encode()).hexdigest(), last_modified, lambda: {
+        'results': [listing_summary(listing) for listing in page],
+        'next': next_url,
+    })
+
+
+# ?status=active (default), inactive or all; ?genre=<slug>; ?limit=; ?cursor=
+@require_GET
+def listings(request):
+    status = request.GET.get('status', 'active')
+    queryset = {'active': Listing.objects.active(), 'inactive': Listing.objects.inactive(),
+                'all': Listing.objects.all()}.get(status)
+    if queryset is None:
+        return error('status must be one of active, inactive or all.', 400)
+    # closed listings may have moved to the archive
+    archived = ArchivedListing.objects.all() if status != 'active' else None
+
+    if 'genre' in request.GET:
+        genre = genre_registry.by_slug(request.GET['genre'])
+        if genre is None:
+            return error('Unknown genre.', 404)
+        queryset = queryset.filter(genres=genre.id)
+        archived = archived.in_genre(genre.id) if archived is not None else None
+    if archived is None:
+        return listing_page(request, queryset)
+    return listing_page(request, queryset, archived)
+
+
+@require_GET
+def listing(request, listing_id):
+    try:
+        listing = Listing.objects.select_related('owner', 'highest_bidder').get(pk=listing_id)
+    except Listing.DoesNotExist:
+        try:
+            listing = ArchivedListing.objects.select_related('owner', 'highest_bidder').get(pk=listing_id)
+        except ArchivedListing.DoesNotExist:
+            return error('Listing not found.', 404)
+
+    def payload():
+        attach_genres([listing])
+        return listing_detail(listing)
+
+    # genre names come from the registry, so its contents are part of the validator
+    etag = f'{listing.listing_id}-{listing.version}-{genre_registry.digest()}'
+    return conditional(request, etag, listing.modified, payload)
+
+
+# the latest MAX_PAGE_SIZE bids of the listing's bid log, highest (and so newest) first; every
+# bid moves the listing's version
+@require_GET
+def listing_bids(request, listing_id):
+    bid_log = Bid.objects
+    try:
+        listing = Listing.objects.only('version', 'modified').get(pk=listing_id)
+    except Listing.DoesNotExist:
+        try:
+            listing = ArchivedListing.objects.only('version', 'archived').get(pk=listing_id)
+        except ArchivedListing.DoesNotExist:
+            return error('Listing not found.', 404)
+        bid_log = ArchivedBid.objects
+
+    def payload():
+        bids = bid_log.filter(listing=listing_id).select_related('bidder').order_by('-bid')[:MAX_PAGE_SIZE]
+        return {'results': [{'bidder': bid.bidder.username, 'amount': bid.bid, 'placed': bid.created} for bid in bids]}
+
+    return conditional(request, f'bids-{listing.listing_id}-{listing.version}', listing.modified, payload)
+
+
+@require_GET
+def watchlist(request):
+    if not request.user.is_authenticated:
+        return error('Authentication required.', 401)
+    return listing_page(request, request.user.watchlist.all())
+
+
+@require_GET
+def genres(request):
+    return conditional(request, f'genres-{genre_registry.digest()}', None, lambda: {
+        'results': [{'id': genre.id, 'name': genre.name, 'slug': genre.slug} for genre in genre_registry.all()],
+    })
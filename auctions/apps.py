@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401 (registers the checks)
+
+        post_migrate.connect(signals.reinstall_search_triggers, sender=self)
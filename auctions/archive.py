@@ -0,0 +1,93 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .auth import forget_user
+from .bidbook import bid_books
+from .models import User, Listing, Bid, Comment, ArchivedListing, ArchivedBid, ArchivedComment
+from .pagecache import purge
+from .pagination import analyze_tables
+from .watchlist import Watch
+
+# Closed listings are moved out of the listing, bid and comment tables once they have been closed
+# for ARCHIVE_AFTER seconds, so those tables and their indexes only grow with the open auctions
+# and the recently closed ones. The inactive grid and an archived listing's page read the
+# archive tables; nothing writes to them after the move.
+
+COPIED_FIELDS = ['listing_id', 'owner_id', 'title', 'description', 'starting_bid', 'image', 'thumbnail',
+                 'thumbnail_webp', 'image_webp', 'date', 'ends_at', 'current_price', 'bid_count',
+                 'highest_bidder_id', 'version']
+
+
+def archive_batch(listing_ids, now, batch_size=5000):
+    """Move those of `listing_ids` that are closed to the archive tables, with their bids and
+    comments, in one transaction. Returns how many were moved."""
+    with transaction.atomic():
+        listings = list(Listing.objects.inactive().filter(pk__in=listing_ids).values(*COPIED_FIELDS))
+        listing_ids = [listing['listing_id'] for listing in listings]
+        if not listing_ids:
+            return 0
+
+        genre_ids = defaultdict(list)
+        for listing_id, genre_id in Listing.genres.through.objects.filter(listing__in=listing_ids).values_list('listing_id', 'genre_id'):
+            genre_ids[listing_id].append(genre_id)
+        ArchivedListing.objects.bulk_create(
+            ArchivedListing(genre_ids=genre_ids[listing['listing_id']], archived=now, **listing) for listing in listings
+        )
+        bids = Bid.objects.filter(listing__in=listing_ids).values_list('listing_id', 'bidder_id', 'bid', 'created')
+        ArchivedBid.objects.bulk_create(
+            (ArchivedBid(listing_id=listing_id, bidder_id=bidder_id, bid=amount, created=created)
+             for listing_id, bidder_id, amount, created in bids.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+        comments = Comment.objects.filter(listing__in=listing_ids).values_list('listing_id', 'commenter_id', 'comment', 'created')
+        ArchivedComment.objects.bulk_create(
+            (ArchivedComment(listing_id=listing_id, commenter_id=commenter_id, comment=comment, created=created)
+             for listing_id, commenter_id, comment, created in comments.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+
+        # the listings leave their watchers' watchlists, and the counters follow
+        removed = Counter(Watch.objects.filter(listing__in=listing_ids).values_list('user_id', flat=True))
+        by_count = defaultdict(list)
+        for user_id, count in removed.items():
+            by_count[count].append(user_id)
+        for count, user_ids in by_count.items():
+            # never below zero, should a counter have drifted (recount_watchlists puts it right)
+            User.objects.filter(pk__in=user_ids).update(watchlist_count=Greatest(F('watchlist_count') - count, Value(0)))
+        for user_id in removed:
+            forget_user(user_id)
+
+        # unhooked first, so the bids go without the listings cascading back to them
+        Listing.objects.filter(pk__in=listing_ids).update(highest_bid=None)
+        Bid.objects.filter(listing__in=listing_ids).delete()
+        # takes the comments, price buckets, genre and watchlist links and image jobs with it
+        Listing.objects.filter(pk__in=listing_ids).delete()
+        purge('grids', *(f'listing:{listing_id}' for listing_id in listing_ids))
+    return len(listing_ids)
+
+
+def archive_closed(now=None, batch_size=100):
+    """Archive every listing closed for at least ARCHIVE_AFTER seconds, a batch of listings per
+    transaction. Returns how many were archived."""
+    now = now or timezone.now()
+    # closing a listing is its last change, so `modified` is when it closed
+    cutoff = now - timedelta(seconds=settings.ARCHIVE_AFTER)
+    # a bid book listing closed by its owner has its book written first, but the log is checked
+    # rather than trusted: its bids must reach the bid table before they can be archived
+    closed = Listing.objects.inactive().filter(modified__lte=cutoff).exclude(bid_book=True, pk__in=bid_books.unflushed())
+    archived = 0
+    while True:
+        listing_ids = list(closed.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not listing_ids:
+            break
+        archived += archive_batch(listing_ids, now)
+    if archived:
+        # the admin changelists estimate these tables' sizes from their statistics
+        analyze_tables(Listing, Bid, Comment, ArchivedListing)
+    return archived
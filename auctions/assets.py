@@ -0,0 +1,191 @@
+import gzip
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are written
+    brotli = None
+
+# Static and media delivery. collectstatic writes content-hashed copies of the static files, plus
+# pre-compressed .br/.gz variants of the text ones, and serve_static hands out the best variant
+# the client accepts; a hashed name never changes content, so browsers may keep it for a year
+# without asking again. Media (uploads and their image variants) is served with ranges and
+# revalidation for MEDIA_MAX_AGE. A front-end server can take either URL prefix over unchanged.
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html')
+
+# preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# ManifestStaticFilesStorage puts the first 12 hex digits of the MD5 before the extension
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^.]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def compress(content):
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    # a variant that saves little only costs a file and a stat
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content) * 0.9}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes .gz (and, with brotli installed, .br) variants of every
+    compressible hashed file, once, at collectstatic time."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            for suffix, data in compress(content).items():
+                with open(self.path(name + suffix), 'wb') as variant:
+                    variant.write(data)
+
+
+def accepted_variant(request, fullpath):
+    """The pre-compressed variant of `fullpath` to send, as (path, encoding, stat result), or None."""
+    accepted = {coding.split(';')[0].strip() for coding in request.headers.get('Accept-Encoding', '').split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted:
+            try:
+                return fullpath + suffix, encoding, os.stat(fullpath + suffix)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+    return None
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(first, last) byte positions of a single `bytes=` range, or None to send the whole file,
+    which is also the answer to multi-range and malformed requests."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # a suffix: the last N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+def read_range(file, first, length):
+    try:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def serve_file(request, fullpath, cache_control, precompressed=False):
+    """Serve a file with validators, Range support and, if `precompressed`, the best .br/.gz
+    variant the client accepts. Ranges always address the uncompressed file."""
+    if fullpath is None:
+        raise Http404
+    range_header = request.headers.get('Range') if request.method == 'GET' else None
+    variant = accepted_variant(request, fullpath) if precompressed and not range_header else None
+    if variant:
+        path, encoding, stats = variant
+    else:
+        path, encoding = fullpath, None
+        try:
+            stats = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise Http404
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404
+
+    # each variant is its own representation, with its own validator
+    etag = f'"{stats.st_mtime_ns:x}-{stats.st_size:x}{"-" + encoding if encoding else ""}"'
+    last_modified = int(stats.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+        # a range from an older copy (If-Range no longer matching) gets the whole new file
+        current = request.headers.get('If-Range', etag) in (etag, http_date(last_modified))
+        try:
+            file_range = parse_range(range_header, stats.st_size) if range_header and current else None
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stats.st_size}'
+        else:
+            if file_range is not None:
+                first, last = file_range
+                response = StreamingHttpResponse(read_range(open(path, 'rb'), first, last - first + 1),
+                                                 status=206, content_type=content_type)
+                response['Content-Range'] = f'bytes {first}-{last}/{stats.st_size}'
+                response['Content-Length'] = last - first + 1
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=content_type,
+                                        filename=os.path.basename(fullpath))
+                if encoding:
+                    response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    if precompressed:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def resolve(root, path):
+    try:
+        return safe_join(root, path)
+    except SuspiciousFileOperation:
+        return None
+
+
+# STATIC_URL: the collected files, or in development straight from the app directories
+@require_safe
+def serve_static(request, path):
+    if settings.DEBUG:
+        fullpath = finders.find(path)
+    else:
+        fullpath = resolve(settings.STATIC_ROOT, path)
+    cache_control = IMMUTABLE if HASHED_NAME.search(path) else 'no-cache'
+    return serve_file(request, fullpath, cache_control, precompressed=True)
+
+
+# MEDIA_URL: uploads and their variants. Stored names are never reused for new content, but uploads
+# can be deleted, so they are revalidated after MEDIA_MAX_AGE rather than kept forever
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, resolve(settings.MEDIA_ROOT, path), f'public, max-age={settings.MEDIA_MAX_AGE}')
@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+from django.utils.functional import empty
+from django.utils.http import urlencode
+
+from . import views
+from .bidbook import bid_books
+from .bidding import aprice_chart
+from .cards import render_cards
+from .comments import acomment_page
+from .forms import BidForm, CommentForm
+from .genres import genre_registry
+from .models import Listing, ArchivedListing
+from .pagecache import cache_anonymous_page
+from .pagination import MergedListings, apaginate_listings
+from .replicas import read_from_replica
+from .search import search_listings
+from .watchlist import ais_watching, awatched_ids
+
+# Async versions of the read views, routed in place of the ones in auctions.views when
+# ASYNC_READ_VIEWS is on (the default under commerce.asgi). Rows come through the async ORM; work
+# with no async interface (the lazy request.user, raw FTS queries, the card cache) goes to a thread
+# in as few hops as possible. Templates render on the event loop and must not query, so everything
+# a page shows is fetched before it renders.
+
+
+async def get_user(request):
+    """request.user, loaded with the session off the event loop on first use."""
+    user = request.user
+    if user._wrapped is empty:
+        await sync_to_async(user._setup)()
+    return user
+
+
+# a listing grid, with its cards rendered (and the viewer's watched badges placed) ahead of the template
+async def render_grid(request, template, page, context):
+    user = await get_user(request)
+    listings = page.object_list
+    ids = [listing.listing_id for listing in listings]
+    watched = set(ids) if context.get('all_watched') else await awatched_ids(user, ids)
+    cards = await sync_to_async(render_cards)(listings, watched)
+    return render(request, template, {'listings': listings, 'page': page, 'cards': cards, **context})
+
+
+# index page
+@cache_anonymous_page('grids')
+@read_from_replica
+async def index(request):
+    page = await apaginate_listings(request, Listing.objects.active().for_cards())
+    return await render_grid(request, "auctions/index.html", page, {'title': 'Active Listings'})
+
+
+# inactive listings page: the closed listings, then those moved to the archive (auctions.archive)
+@cache_anonymous_page('grids')
+@read_from_replica
+async def inactive(request):
+    page = await apaginate_listings(request, MergedListings(Listing.objects.inactive().for_cards(),
+                                                            ArchivedListing.objects.select_related('owner')))
+    return await render_grid(request, "auctions/inactive.html", page, {'title': 'Inactive Listings'})
+
+
+# listing item information; bids, watchlist changes, closing and comments stay on the sync view
+@cache_anonymous_page('listing:{listing_id}')
+@read_from_replica
+async def listing(request, listing_id):
+    if request.method != 'GET':
+        return await sync_to_async(views.listing)(request, listing_id)
+
+    user = await get_user(request)
+    try:
+        # aget runs the whole query in one hop, prefetch included
+        listing = await Listing.objects.for_cards().prefetch_related('genres').aget(pk=listing_id)
+    except Listing.DoesNotExist:
+        # archived, or not there at all
+        return await sync_to_async(views.archived_listing)(request, listing_id)
+    bid_books.show(listing)
+
+    context = {'listing': listing, 'comments': await acomment_page(listing_id), 'price_chart': await aprice_chart(listing),
+               'live_events': settings.LISTING_EVENTS}
+    if user.is_authenticated:
+        context.update(bid_form=BidForm(), comment_form=CommentForm(),
+                       watching=await ais_watching(user, listing_id))
+    return render(request, "auctions/listing.html", context)
+
+
+# watchlist page; login_required only wraps async views from Django 5.0
+async def watchlist(request):
+    user = await get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    page = await apaginate_listings(request, user.watchlist.for_cards())
+    return await render_grid(request, "auctions/watchlist.html", page, {'title': 'Watchlist', 'all_watched': True})
+
+
+# search by category (genres) and/or keyword (?q=)
+@cache_anonymous_page('grids')
+@read_from_replica
+async def search(request, slug=None):
+    genre = await genre_registry.aby_slug(slug) if slug is not None else None
+    query = request.GET.get('q', '').strip()
+
+    if genre is None and slug is not None:
+        messages.error(request, 'Sorry this category/genre does not exist in the database. Please select the below options.')
+    elif query:
+        # FTS5 is queried with raw SQL, which has no async interface
+        page = await sync_to_async(search_listings)(query, genre, request.GET.get('page'))
+        return await render_grid(request, "auctions/index.html", page, {
+            'page_query': urlencode({'q': query}) + '&',
+            'query': query,
+            'facets': page.facets,
+            'title': f'Results for "{query}"' + (f' in {genre}' if genre else '')
+        })
+    elif genre is not None:
+        page = await apaginate_listings(request, MergedListings(Listing.objects.for_cards().filter(genres=genre.id),
+                                                                ArchivedListing.objects.select_related('owner').in_genre(genre.id)))
+        return await render_grid(request, "auctions/index.html", page, {'title': genre.name})
+
+    return render(request, "auctions/search.html", {
+        'genres': await genre_registry.aall()
+    })
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import caches
+from django.db import transaction
+
+# AuthenticationMiddleware loads the signed-in user by primary key on every request. With
+# USER_CACHE, CachedModelBackend keeps those rows in the USER_CACHE_ALIAS cache (shared between
+# workers, see auctions.checks), so that with a cached session store (SESSION_BACKEND) a
+# signed-in request needs no more queries than an anonymous one. Saves and deletes of a user (auctions.signals) and the counter updates in
+# auctions.watchlist drop the cached copy; USER_CACHE_TIMEOUT bounds how long a change made
+# any other way (a queryset update, a raw SQL fix) goes unseen.
+
+
+def user_cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def forget_user(user_id, using='default'):
+    """Drop a user's cached row now and again once the change commits, so a request that
+    reloaded it while the transaction was open cannot keep the old one."""
+    user_cache().delete(user_key(user_id))
+    transaction.on_commit(lambda: user_cache().delete(user_key(user_id)), using=using)
+
+
+def forget_all_users():
+    """After bulk updates to the user table."""
+    user_cache().clear()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request get_user() is served from the user cache."""
+
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache().set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 at PASSWORD_HASH_ITERATIONS rounds. Each hash records its own count, so
+    changing the setting keeps every stored password valid, and check_password() re-hashes a
+    password at the new count the next time its user signs in."""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
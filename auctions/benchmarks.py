@@ -0,0 +1,208 @@
+import contextlib
+import io
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .bidding import rebuild_bid_buckets
+from .models import User, Listing, Genre, Bid, Comment
+from .watchlist import Watch, recount_watchlists
+
+WORDS = (
+    'legend zelda mario kart pokemon diamond pearl sonic metroid halo gears souls dark elden ring '
+    'final fantasy dragon quest kingdom hearts minecraft tetris pacman street fighter mortal kombat '
+    'smash bros animal crossing splatoon kirby donkey kong fire emblem persona yakuza hitman portal '
+    'half life doom quake wolfenstein fallout skyrim oblivion witcher cyberpunk bioshock mass effect '
+    'starcraft warcraft diablo overwatch tomb raider uncharted crash bandicoot spyro ratchet clank '
+    'sealed boxed cartridge disc complete manual mint used scratched collector limited edition rare '
+    'original classic retro import japanese european bundle console handheld controller steelbook'
+).split()
+
+# catalogue reference numbers give the synthetic data some rare, selective search terms
+REFERENCES = 1_000_000
+
+GENRES = ['Action', 'Adventure', 'Fighting', 'Platformer', 'Puzzle', 'Racing', 'RPG', 'Shooter', 'Sports', 'Strategy']
+
+
+@contextlib.contextmanager
+def benchmark_database(keepdb=False):
+    """Run the block against a freshly migrated test database, the way the test runner does, so
+    benchmarks never touch the development data."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_catalogue(listings, users=50, genres=len(GENRES), batch_size=5000, seed=0, open_share=0.8):
+    """Bulk-insert a synthetic catalogue: users, genres, and `listings` listings with one to three
+    genres each, `open_share` of them open. Closed listings ended in the past month; open ones end
+    between a day ago and a week from now, so some are waiting to be swept. Returns the created
+    users."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(None)
+    with transaction.atomic():
+        owners = User.objects.bulk_create(
+            User(username=f'seller{i}', email=f'seller{i}@example.com', password=password) for i in range(users)
+        )
+        names = GENRES[:genres] if genres <= len(GENRES) else [f'Genre {i}' for i in range(genres)]
+        genre_ids = [genre.id for genre in Genre.objects.bulk_create(Genre(name=name, slug=slugify(name)) for name in names)]
+
+    through = Listing.genres.through
+    for start in range(0, listings, batch_size):
+        with transaction.atomic():
+            batch = Listing.objects.bulk_create(
+                Listing(
+                    owner=rng.choice(owners),
+                    title=phrase(rng, rng.randint(2, 5)).title(),
+                    description=f'{phrase(rng, rng.randint(8, 20))} ref{rng.randrange(REFERENCES)}',
+                    starting_bid=rng.randint(100, 9999) / 100,
+                    status=status,
+                    ends_at=now + timedelta(hours=rng.uniform(-24, 24 * 7) if status else -rng.uniform(0, 24 * 30)),
+                )
+                for status in (rng.random() < open_share for _ in range(min(batch_size, listings - start)))
+            )
+            through.objects.bulk_create(
+                through(listing_id=listing.listing_id, genre_id=genre_id)
+                for listing in batch
+                for genre_id in rng.sample(genre_ids, rng.randint(1, min(3, len(genre_ids))))
+            )
+    return owners
+
+
+def seed_activity(users, bids=0, comments=0, watches=0, batch_size=5000, seed=0):
+    """Bulk-insert activity on a seeded catalogue from `users`: bids on open listings over the past
+    week (rising on each listing, as place_bid() only accepts higher bids), comments and watchlist
+    entries, then bring the listings' bid summaries, price buckets and watch counters in line with
+    them."""
+    rng = random.Random(seed)
+    open_listings = list(Listing.objects.active().values_list('listing_id', 'starting_bid'))
+    listing_ids = list(Listing.objects.values_list('listing_id', flat=True))
+    user_ids = [user.pk for user in users]
+
+    def pairs(count, candidates):
+        chosen = set()
+        for _ in range(count * 2):
+            if len(chosen) >= count:
+                break
+            chosen.add((rng.choice(user_ids), rng.choice(candidates)))
+        return chosen
+
+    def insert(model, rows):
+        rows = list(rows)
+        for start in range(0, len(rows), batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(rows[start:start + batch_size])
+
+    if bids and open_listings:
+        max_bid = Bid._meta.get_field('bid')
+        ceiling = 10 ** (max_bid.max_digits - max_bid.decimal_places) - 1
+        now = timezone.now()
+        by_listing = defaultdict(list)
+        for user_id, (listing_id, starting_bid) in pairs(bids, open_listings):
+            by_listing[listing_id].append((min(ceiling, round(float(starting_bid) + rng.uniform(0, 100), 2)), user_id))
+
+        def listing_log(listing_id, placed):
+            times = sorted(now - timedelta(hours=rng.uniform(0, 24 * 7)) for _ in placed)
+            for (amount, user_id), created in zip(sorted(placed), times):
+                yield Bid(bidder_id=user_id, listing_id=listing_id, bid=amount, created=created)
+
+        insert(Bid, (bid for listing_id, placed in by_listing.items() for bid in listing_log(listing_id, placed)))
+        call_command('reconcile_bids', stdout=io.StringIO())
+        rebuild_bid_buckets(batch_size)
+    if comments and listing_ids:
+        insert(Comment, (Comment(commenter_id=rng.choice(user_ids), listing_id=rng.choice(listing_ids),
+                                 comment=phrase(rng, rng.randint(3, 15)).capitalize())
+                         for _ in range(comments)))
+    if watches and listing_ids:
+        insert(Watch, (Watch(user_id=user_id, listing_id=listing_id) for user_id, listing_id in pairs(watches, listing_ids)))
+        recount_watchlists()
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples) * 1000,
+        'p50': percentile(samples, 50) * 1000,
+        'p95': percentile(samples, 95) * 1000,
+        'p99': percentile(samples, 99) * 1000,
+    }
+
+
+def time_calls(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_load(scenarios, seconds):
+    """Run scenarios side by side for `seconds` and collect their latencies and errors.
+
+    `scenarios` maps a name to (threads, make_worker). Each thread calls make_worker(rng) once and
+    then calls the returned function, one request per call, until time runs out; anything it raises
+    counts as an error. Returns {name: (latency samples in seconds, Counter of errors)}.
+    """
+    results = {name: ([], Counter()) for name in scenarios}
+    lock = threading.Lock()
+    start = threading.Barrier(sum(threads for threads, _ in scenarios.values()) + 1)
+
+    def run(name, make_worker, seed):
+        samples, errors = [], Counter()
+        try:
+            try:
+                request = make_worker(random.Random(seed))
+            except BaseException:
+                start.abort()
+                raise
+            start.wait()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                try:
+                    request()
+                except Exception as error:
+                    errors[f'{type(error).__name__}: {error}'[:100]] += 1
+                else:
+                    samples.append(time.perf_counter() - began)
+        finally:
+            connection.close()
+        with lock:
+            results[name][0].extend(samples)
+            results[name][1].update(errors)
+
+    workers = [
+        threading.Thread(target=run, args=(name, make_worker, f'{name}{n}'))
+        for name, (threads, make_worker) in scenarios.items()
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    for worker in workers:
+        worker.join()
+    return results
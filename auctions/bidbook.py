@@ -0,0 +1,408 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .bidding import BidError, add_to_bucket, bucket_start, parse_amount, place_bid
+from .events import publish_listing_event
+from .models import Bid, BidBookCheckpoint, Listing, User
+from .pagecache import purge_listing
+
+logger = logging.getLogger(__name__)
+
+# Bid books, for listings marked `bid_book` that expect more bids than one row can take one
+# read-modify-write at a time. A book holds a listing's bidding state in memory and accepts or
+# rejects each bid against it under the book's lock, so a listing's bids are decided one after the
+# other without touching the database. Accepted bids are appended to a write-ahead file (BidLog)
+# before they are acknowledged, and a flusher thread writes them to Bid/Listing/BidBucket in one
+# transaction every BID_BOOK_FLUSH_INTERVAL seconds, moving the log's checkpoint in the same
+# transaction; after a crash the records past the checkpoint are replayed on the next start.
+#
+# The books of a listing only agree with each other inside one process. The log file is locked by
+# the process that opens it, and every other process refuses bids on these listings while it is
+# held (a bid taken there would be invisible to the books), so a deployment with several workers
+# should route bid book listings' bids to one of them. Pages loaded between a bid and its flush are
+# brought up to date with show().
+
+
+class LoggedBid(NamedTuple):
+    seq: int
+    listing_id: int
+    bidder_id: int
+    amount: Decimal
+    created: datetime
+
+
+def encode(record):
+    return json.dumps({
+        'seq': record.seq, 'listing': record.listing_id, 'bidder': record.bidder_id,
+        'amount': str(record.amount), 'created': record.created.isoformat(),
+    }).encode() + b'\n'
+
+
+def read_records(path):
+    """The records in a log file; a line torn by a crash while appending ends it."""
+    records = []
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return records
+    with file:
+        for line in file:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                break
+            records.append(LoggedBid(data['seq'], data['listing'], data['bidder'], Decimal(data['amount']),
+                                     datetime.fromisoformat(data['created'])))
+    return records
+
+
+class BidLog:
+    """The write-ahead file: a JSON line per accepted bid, appended (and with BID_BOOK_FSYNC,
+    fsynced) before the bid is acknowledged. Records are dropped from it once they are written."""
+
+    def __init__(self, path, fsync):
+        self.path, self.fsync = path, fsync
+        # held for the life of the log: no other process may append to or replay the file
+        self.lock_file = open(path + '.lock', 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        self.seq = 0
+        # appended, not yet written to the database, in log order
+        self.pending = []
+
+    def read(self):
+        return read_records(self.path)
+
+    def append(self, listing_id, bidder_id, amount, created):
+        with self.lock:
+            record = LoggedBid(self.seq + 1, listing_id, bidder_id, amount, created)
+            self.file.write(encode(record))
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.seq = record.seq
+            self.pending.append(record)
+            return record
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.pending)
+
+    def drop_through(self, seq):
+        """Forget the records up to `seq`, which are in the database now, and remove them from the file."""
+        with self.lock:
+            self.pending = [record for record in self.pending if record.seq > seq]
+            if not self.pending:
+                self.file.truncate(0)
+                return
+            # the rest have to survive a crash during the rewrite
+            temporary = self.path + '.tmp'
+            with open(temporary, 'wb') as file:
+                file.writelines(encode(record) for record in self.pending)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            self.file.close()
+            self.file = open(self.path, 'ab')
+
+    def set_aside(self, records):
+        """Keep accepted records that cannot be written (their listing or bidder is gone, or the
+        price moved past them) in the `.unwritten` file next to the log, for someone to look at."""
+        with open(self.path + '.unwritten', 'ab') as file:
+            file.writelines(encode(record) for record in records)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self):
+        self.file.close()
+        self.lock_file.close()
+
+
+class BidBook:
+    """A listing's bidding state while its bids go through a book."""
+
+    def __init__(self, listing, bidders):
+        self.lock = threading.Lock()
+        self.open = listing.status
+        self.ends_at = listing.ends_at
+        self.starting_bid = listing.starting_bid
+        self.price = listing.current_price
+        self.highest_bidder = listing.highest_bidder
+        self.bid_count = listing.bid_count
+        # who has bid already, for place_bid()'s `created`
+        self.bidders = bidders
+
+    @classmethod
+    def load(cls, listing_id):
+        try:
+            listing = Listing.objects.select_related('highest_bidder').get(pk=listing_id)
+        except Listing.DoesNotExist:
+            raise BidError('This listing is closed to new bids.')
+        return cls(listing, set(Bid.objects.filter(listing=listing_id).values_list('bidder', flat=True).distinct()))
+
+
+def write_bids(listing_id, records):
+    """Append a run of one listing's accepted bids to the Bid log and move its summary and buckets.
+    Returns the records refused instead: those not above the price the listing already has, which a
+    bid taken outside the book can have raised, since every bid in the log has to beat the last."""
+    price = Listing.objects.select_for_update().filter(pk=listing_id).values_list('current_price', flat=True).get()
+    refused = [record for record in records if price is not None and record.amount <= price]
+    records = [record for record in records if price is None or record.amount > price]
+    if not records:
+        return refused
+    bids = Bid.objects.bulk_create(
+        Bid(listing_id=listing_id, bidder_id=record.bidder_id, bid=record.amount, created=record.created)
+        for record in records
+    )
+    last = bids[-1]
+    counted = {'bid_count': F('bid_count') + len(bids)}
+    # a bid taken by the direct path meanwhile (in another process) may already be higher
+    outbids = Q(current_price__isnull=True) | Q(current_price__lt=last.bid)
+    if not Listing.objects.filter(outbids, pk=listing_id).touch(
+            current_price=last.bid, highest_bidder_id=last.bidder_id, highest_bid=last, **counted):
+        Listing.objects.filter(pk=listing_id).touch(**counted)
+    for _, run in groupby(bids, key=lambda bid: bucket_start(bid.created)):
+        run = list(run)
+        add_to_bucket(listing_id, run[-1].bid, run[-1].created, bids=len(run), low=run[0].bid)
+    purge_listing(listing_id)
+    return refused
+
+
+class BidBooks:
+    """This process's bid books and the log they share; use the `bid_books` instance below."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.books = {}
+        self.log = None
+        self.started = False
+        self.stopping = False
+        self.flusher = None
+        self.exit_hook = False
+        # while another process holds the log: when to try for it again
+        self.retry_at = None
+
+    def must_start(self):
+        return not self.started or (self.retry_at is not None and time.monotonic() >= self.retry_at)
+
+    def available(self):
+        """Whether bids on bid book listings go through books in this process. The first call opens
+        and replays the log and starts the flusher; False if BID_BOOK_WAL is unset or another
+        process holds the log, which is tried for again every BID_BOOK_RETRY_INTERVAL seconds."""
+        if self.must_start():
+            with self.lock:
+                if self.must_start():
+                    self.start()
+        return self.log is not None
+
+    def held_elsewhere(self):
+        """Whether another process held the log when this one last tried for it."""
+        return self.log is None and self.retry_at is not None
+
+    def start(self):
+        path = settings.BID_BOOK_WAL
+        if path:
+            try:
+                log = BidLog(path, settings.BID_BOOK_FSYNC)
+            except BlockingIOError:
+                if self.retry_at is None:
+                    logger.warning("%s is held by another process; bids on bid book listings are refused here", path)
+                self.retry_at = time.monotonic() + settings.BID_BOOK_RETRY_INTERVAL
+            else:
+                self.retry_at = None
+                try:
+                    self.recover(log)
+                except BaseException:
+                    log.close()
+                    raise
+                self.log = log
+                if settings.BID_BOOK_FLUSH_INTERVAL:
+                    self.flusher = threading.Thread(target=self.run_flusher, name='bid-book-flusher', daemon=True)
+                    self.flusher.start()
+                if not self.exit_hook:
+                    atexit.register(self.flush)
+                    self.exit_hook = True
+        self.started = True
+
+    def recover(self, log):
+        """Write the records a previous process appended but did not get into the database."""
+        checkpoint = BidBookCheckpoint.objects.filter(log=log.path).values_list('seq', flat=True).first() or 0
+        records = log.read()
+        log.seq = max([checkpoint, *(record.seq for record in records)])
+        log.pending = [record for record in records if record.seq > checkpoint]
+        if log.pending:
+            logger.warning("Replaying %d bids from %s", len(log.pending), log.path)
+            self.write(log, log.pending)
+        log.drop_through(log.seq)
+
+    def unflushed(self):
+        """Ids of the listings with accepted bids not yet in the database, whichever process's books
+        took them; closing or archiving such a listing would go without its last bids. When no
+        process holds the log, what a stopped or crashed holder left in it is written here first."""
+        path = settings.BID_BOOK_WAL
+        if not path:
+            return set()
+        if self.log is not None:
+            return {record.listing_id for record in self.log.snapshot()}
+        try:
+            log = BidLog(path, settings.BID_BOOK_FSYNC)
+        except BlockingIOError:
+            # records leave the holder's file only once they are written
+            return {record.listing_id for record in read_records(path)}
+        try:
+            self.recover(log)
+        finally:
+            log.close()
+        return set()
+
+    def stop(self, flush=True):
+        """Stop the flusher, close the log and forget every book; without `flush`, what is still
+        pending is left to the log, as after a crash."""
+        with self.lock:
+            self.stopping = True
+            self.wake.set()
+            if self.flusher is not None:
+                self.flusher.join()
+            if self.log is not None:
+                if flush:
+                    self.flush()
+                self.log.close()
+            self.books, self.log, self.flusher, self.retry_at = {}, None, None, None
+            self.started = self.stopping = False
+            self.wake.clear()
+
+    def book(self, listing_id):
+        book = self.books.get(listing_id)
+        if book is None:
+            with self.lock:
+                book = self.books.get(listing_id)
+                if book is None:
+                    book = self.books[listing_id] = BidBook.load(listing_id)
+        return book
+
+    def place(self, listing_id, bidder, amount):
+        """Accept or reject a bid against the listing's book; the same contract as place_bid(),
+        except that the bid reaches the database with the next flush."""
+        amount = parse_amount(amount)
+        book = self.book(listing_id)
+        now = timezone.now()
+        with book.lock:
+            if not book.open or (book.ends_at is not None and book.ends_at <= now):
+                raise BidError('This listing is closed to new bids.')
+            if amount < book.starting_bid if book.price is None else amount <= book.price:
+                raise BidError(f'Unable to update highest bid. ${amount:.2f} is not higher than starting bid or current highest bid')
+            # durable before it is acknowledged
+            self.log.append(listing_id, bidder.pk, amount, now)
+            created = bidder.pk not in book.bidders
+            book.bidders.add(bidder.pk)
+            book.price, book.highest_bidder, book.bid_count = amount, bidder, book.bid_count + 1
+        if len(self.log.pending) >= settings.BID_BOOK_BATCH_SIZE:
+            self.wake.set()
+        # the listing page shows the book; grids catch up when the flush purges them
+        purge_listing(listing_id, grids=False)
+        publish_listing_event(listing_id, 'bid', amount=f'{amount:.2f}', bidder=bidder.username, new_bidder=created)
+        return amount, created
+
+    def show(self, listing):
+        """Bring a listing loaded from the database up to its book, whose latest bids may not be written yet."""
+        book = self.books.get(listing.listing_id)
+        if book is not None:
+            with book.lock:
+                if book.bid_count > listing.bid_count:
+                    listing.current_price, listing.bid_count = book.price, book.bid_count
+                    listing.highest_bidder = book.highest_bidder
+
+    def retire(self, listing_id):
+        """Stop a listing's book before the listing is closed, and write the bids it accepted."""
+        book = self.books.get(listing_id)
+        if book is not None:
+            with book.lock:
+                book.open = False
+            self.flush()
+
+    def flush(self):
+        """Write every accepted bid not yet in the database, in one transaction. Returns how many."""
+        with self.flush_lock:
+            log = self.log
+            records = log.snapshot() if log is not None else []
+            if not records:
+                return 0
+            self.write(log, records)
+            log.drop_through(records[-1].seq)
+            return len(records)
+
+    def write(self, log, records):
+        runs = defaultdict(list)
+        for record in records:
+            runs[record.listing_id].append(record)
+        refused, orphaned = [], []
+        with transaction.atomic():
+            # bids on a listing or by a user deleted since would fail the whole batch
+            listing_ids = set(Listing.objects.filter(pk__in=runs).values_list('pk', flat=True))
+            bidder_ids = set(User.objects.filter(pk__in={record.bidder_id for record in records}).values_list('pk', flat=True))
+            for listing_id, run in runs.items():
+                orphaned += [record for record in run if listing_id not in listing_ids or record.bidder_id not in bidder_ids]
+                run = [record for record in run if listing_id in listing_ids and record.bidder_id in bidder_ids]
+                if run:
+                    refused += write_bids(listing_id, run)
+            # out of the log once the checkpoint moves past them, so kept aside first
+            if refused or orphaned:
+                log.set_aside(sorted(refused + orphaned))
+            BidBookCheckpoint.objects.update_or_create(log=log.path, defaults={'seq': records[-1].seq})
+        for record in orphaned:
+            logger.error("Bid book record %d (listing %d, bidder %d, $%s) has no listing or bidder to be written to; "
+                         "kept in %s.unwritten", record.seq, record.listing_id, record.bidder_id, record.amount, log.path)
+        for record in refused:
+            logger.error("Bid book record %d (listing %d, bidder %d, $%s) is not above the listing's price and was "
+                         "not written; kept in %s.unwritten", record.seq, record.listing_id, record.bidder_id,
+                         record.amount, log.path)
+            # the book was behind the database: it is loaded again on the next bid
+            self.books.pop(record.listing_id, None)
+
+    def run_flusher(self):
+        while not self.stopping:
+            self.wake.wait(settings.BID_BOOK_FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the records stay pending, and in the log, for the next round
+                logger.exception("Writing bid book records failed")
+            finally:
+                close_old_connections()
+
+
+bid_books = BidBooks()
+
+
+def submit_bid(listing, bidder, amount):
+    """Place a bid on a loaded listing, through its bid book if it has one in this process. Raises
+    BidError for a bid book listing whose books another process holds."""
+    if listing.bid_book:
+        if bid_books.available():
+            return bid_books.place(listing.listing_id, bidder, amount)
+        if bid_books.held_elsewhere():
+            raise BidError('Bids on this listing are being taken elsewhere right now. Please try again.')
+    return place_bid(listing.listing_id, bidder, amount)
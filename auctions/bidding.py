@@ -0,0 +1,144 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Listing, Bid, BidBucket
+from .events import publish_listing_event
+from .pagecache import purge_listing
+
+CENT = Decimal('0.01')
+
+
+class BidError(Exception):
+    """A rejected bid; the message is meant to be shown to the bidder."""
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value).strip()).quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError):
+        raise BidError(f'"{value}" is not a valid bid amount.')
+
+    max_digits = Bid._meta.get_field('bid').max_digits
+    if not amount.is_finite() or amount <= 0 or len(amount.as_tuple().digits) > max_digits:
+        raise BidError(f'${amount:.2f} is not a valid bid amount.')
+    return amount
+
+
+def place_bid(listing_id, bidder, amount):
+    """Place `bidder`'s bid on a listing in a single transaction.
+
+    The bid is appended to the Bid log, and the listing's current_price, highest_bidder and
+    bid_count and its price bucket are kept in step with it. Returns a (bid amount, created) pair,
+    `created` being whether this is the bidder's first bid on the listing, or raises BidError if
+    the listing is closed or past its end time, or if the amount does not beat the starting bid
+    (first bid) or the current highest bid.
+    """
+    amount = parse_amount(amount)
+
+    with transaction.atomic():
+        # Guarded write: matches only while the listing is open and `amount` beats the current
+        # price, and moves the price in the same statement. Databases with row locks re-check the
+        # condition after waiting on a concurrent bid, and on SQLite this first write takes the
+        # database write lock, so no other bid can land between this check and the writes below.
+        outbids = Q(current_price__isnull=True, starting_bid__lte=amount) | Q(current_price__lt=amount)
+        claimed = Listing.objects.biddable().filter(outbids, pk=listing_id).touch(
+            current_price=amount, highest_bidder=bidder)
+        if not claimed:
+            if not Listing.objects.biddable().filter(pk=listing_id).exists():
+                raise BidError('This listing is closed to new bids.')
+            raise BidError(f'Unable to update highest bid. ${amount:.2f} is not higher than starting bid or current highest bid')
+
+        created = not Bid.objects.filter(bidder=bidder, listing=listing_id).exists()
+        bid = Bid.objects.create(bidder=bidder, listing_id=listing_id, bid=amount)
+        Listing.objects.filter(pk=listing_id).update(highest_bid=bid, bid_count=F('bid_count') + 1)
+        add_to_bucket(listing_id, amount, bid.created)
+
+        purge_listing(listing_id)
+        # streamed to open listing pages once the bid is durable
+        transaction.on_commit(lambda: publish_listing_event(
+            listing_id, 'bid', amount=f'{amount:.2f}', bidder=bidder.username, new_bidder=created))
+
+    return amount, created
+
+
+def bucket_start(moment):
+    seconds = moment.timestamp()
+    return datetime.fromtimestamp(seconds - seconds % settings.BID_BUCKET_SECONDS, dt_timezone.utc)
+
+
+# place_bid holds the listing's write lock here, and every accepted bid beats the last, so the
+# new amount is the bucket's high. A batch of `bids` landing in the same bucket (auctions.bidbook)
+# passes its first amount as `low`.
+def add_to_bucket(listing_id, amount, moment, bids=1, low=None):
+    start = bucket_start(moment)
+    if not BidBucket.objects.filter(listing=listing_id, start=start).update(bids=F('bids') + bids, high=amount):
+        BidBucket.objects.create(listing_id=listing_id, start=start, bids=bids, low=low or amount, high=amount)
+
+
+def rebuild_bid_buckets(batch_size=5000):
+    """Recompute every listing's price buckets from the bid log, after loads that bypass place_bid()."""
+    def flush(buckets):
+        BidBucket.objects.bulk_create(buckets.values(), batch_size=batch_size)
+        buckets.clear()
+
+    with transaction.atomic():
+        BidBucket.objects.all().delete()
+        buckets = {}
+        rows = Bid.objects.order_by('listing', 'created').values_list('listing', 'bid', 'created')
+        for listing_id, amount, created in rows.iterator(chunk_size=batch_size):
+            key = (listing_id, bucket_start(created))
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= batch_size:
+                    flush(buckets)
+                buckets[key] = BidBucket(listing_id=listing_id, start=key[1], bids=1, low=amount, high=amount)
+            else:
+                bucket.bids += 1
+                bucket.low, bucket.high = min(bucket.low, amount), max(bucket.high, amount)
+        flush(buckets)
+
+
+class PriceChart:
+    """A listing's latest price buckets, oldest first, with the points of a line through their highs
+    on a 100 x 40 canvas for an inline SVG."""
+
+    WIDTH, HEIGHT = 100, 40
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.low = min(bucket.low for bucket in buckets)
+        self.high = max(bucket.high for bucket in buckets)
+        self.bids = sum(bucket.bids for bucket in buckets)
+        self.since = buckets[0].start
+
+    @property
+    def points(self):
+        spread = self.high - self.low or 1
+        heights = [self.HEIGHT - float((bucket.high - self.low) / spread) * self.HEIGHT for bucket in self.buckets]
+        if len(heights) == 1:
+            heights *= 2  # a level line across the canvas
+        step = self.WIDTH / (len(heights) - 1)
+        return ' '.join(f'{n * step:.1f},{height:.1f}' for n, height in enumerate(heights))
+
+
+def chart_buckets(listing):
+    return BidBucket.objects.filter(listing=listing.listing_id).order_by('-start')[:settings.BID_CHART_BUCKETS]
+
+
+def price_chart(listing):
+    """The listing's price chart, or None before its first bid (without a query)."""
+    if not listing.bid_count:
+        return None
+    buckets = list(chart_buckets(listing))[::-1]
+    return PriceChart(buckets) if buckets else None
+
+
+async def aprice_chart(listing):
+    if not listing.bid_count:
+        return None
+    buckets = [bucket async for bucket in chart_buckets(listing)][::-1]
+    return PriceChart(buckets) if buckets else None
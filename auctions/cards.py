@@ -0,0 +1,86 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+
+from .genres import genre_registry
+from .models import Listing
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def card_cache():
+    return caches[settings.CARD_CACHE_ALIAS]
+
+
+# A listing's version moves on every write that changes its card (bid, close, edit), and the genre
+# registry's digest on every genre change, so a changed card simply never finds the old rendering;
+# stale entries age out with the cache timeout. The digest comes from the genres themselves, so
+# processes sharing the card cache agree on it.
+def card_key(listing, genres_digest):
+    return f'listing-card:{listing.listing_id}:{listing.version}:{genres_digest}'
+
+
+# card footers take genre names from the registry, so only the link table is read
+def attach_genres(listings):
+    genre_ids = defaultdict(list)
+    # archived listings carry their genre ids
+    live = [listing.listing_id for listing in listings if isinstance(listing, Listing)]
+    if live:
+        links = Listing.genres.through.objects.filter(listing__in=live)
+        for listing_id, genre_id in links.values_list('listing_id', 'genre_id'):
+            genre_ids[listing_id].append(genre_id)
+
+    for listing in listings:
+        ids = genre_ids[listing.listing_id] if isinstance(listing, Listing) else listing.genre_ids
+        genres = (genre_registry.by_id(genre_id) for genre_id in ids)
+        listing.card_genres = sorted(filter(None, genres), key=lambda genre: genre.name)
+
+
+# cached cards are shared by every visitor, so the per-user watchlist badge goes into a slot left
+# in the fragment as it is served
+WATCHED_SLOT = '<!-- watched -->'
+WATCHED_BADGE = '<span class="badge bg-secondary">Watchlist</span>'
+
+
+def render_cards(listings, watched=()):
+    """Return the rendered card HTML for each listing, reusing cached fragments where possible and
+    badging the listings whose ids are in `watched`."""
+    listings = list(listings)
+    cache = card_cache()
+    genres_digest = genre_registry.digest()
+    keys = [card_key(listing, genres_digest) for listing in listings]
+    cached = cache.get_many(keys)
+
+    misses = [listing for key, listing in zip(keys, listings) if key not in cached]
+    if misses:
+        attach_genres(misses)
+
+    fresh = {}
+    cards = []
+    for key, listing in zip(keys, listings):
+        if key not in cached:
+            fresh[key] = cached[key] = render_to_string('auctions/card.html', {'listing': listing})
+        badge = WATCHED_BADGE if listing.listing_id in watched else ''
+        cards.append(cached[key].replace(WATCHED_SLOT, badge, 1))
+    if fresh:
+        cache.set_many(fresh)
+
+    with _stats_lock:
+        _stats['hits'] += len(keys) - len(fresh)
+        _stats['misses'] += len(fresh)
+    return cards
+
+
+def card_stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+
+
+def reset_card_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# cache backends whose entries live in one process: evicting a session or user there leaves every
+# other worker's copy in place
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+CACHED_SESSION_ENGINES = {
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+}
+
+
+@register(Tags.caches)
+def check_auth_caches(app_configs, **kwargs):
+    """Cached sessions and users have to live in a cache every worker shares, or a sign-out,
+    password change or deactivation only reaches the worker that handled it."""
+    stores = []
+    if settings.SESSION_ENGINE in CACHED_SESSION_ENGINES:
+        stores.append(('auctions.E001', 'SESSION_BACKEND', 'sessions', settings.SESSION_CACHE_ALIAS))
+    if 'auctions.auth.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS:
+        stores.append(('auctions.E002', 'USER_CACHE', 'signed-in users', settings.USER_CACHE_ALIAS))
+
+    errors = []
+    for check_id, setting, what, alias in stores:
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Error(
+                f"{setting} keeps {what} in the {alias!r} cache, whose backend ({backend}) is private to each process.",
+                hint="Set SHARED_CACHE_URL to a shared Redis server, or turn the cached store off.",
+                id=check_id,
+            ))
+    return errors
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .bidbook import bid_books
+from .events import publish_listing_event
+from .models import Listing
+from .pagecache import purge
+
+
+def close_batch(listing_ids, now):
+    """Close those of `listing_ids` that are still open and expired with one UPDATE. Their
+    highest_bidder stays as the auction's winner. Returns how many were closed."""
+    with transaction.atomic():
+        # the UPDATE comes first so that no bid can land on these listings between it and reading
+        # the winners (bids also refuse listings past their end time)
+        closed = Listing.objects.expired(now).filter(pk__in=listing_ids).touch(status=False)
+        winners = list(Listing.objects.filter(pk__in=listing_ids, status=False)
+                       .values_list('pk', 'highest_bidder__username'))
+        purge('grids', *(f'listing:{listing_id}' for listing_id, _ in winners))
+        transaction.on_commit(lambda: [publish_listing_event(listing_id, 'close', winner=winner)
+                                       for listing_id, winner in winners])
+    return closed
+
+
+def close_expired(now=None, batch_size=1000):
+    """Close every open listing whose end time has passed, oldest first, a batch per transaction.
+
+    Candidates are read from the partial index on open listings' end times, so a sweep costs the
+    number of expired listings rather than the size of the table. Returns how many were closed.
+    """
+    now = now or timezone.now()
+    # books stop taking bids at the end time; what this process's books accepted before it is
+    # written first, so the winners read below are final
+    bid_books.flush()
+    # bid book listings whose books (maybe another process's) still hold bids wait for the next
+    # sweep, as do those just past their end time, whose last bid may still be on its way to the log
+    expired = Listing.objects.expired(now).exclude(
+        Q(bid_book=True) & (Q(pk__in=bid_books.unflushed())
+                            | Q(ends_at__gt=now - timedelta(seconds=settings.BID_BOOK_CLOSE_DELAY)))
+    )
+    closed = 0
+    while True:
+        listing_ids = list(expired.order_by('ends_at').values_list('pk', flat=True)[:batch_size])
+        if not listing_ids:
+            return closed
+        closed += close_batch(listing_ids, now)
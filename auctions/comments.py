@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+from .pagination import KeysetPage, decode_cursor, encode_position
+
+
+def comment_query(listing_id, cursor, per_page):
+    comments = (Comment.objects.filter(listing=listing_id).select_related('commenter')
+                .order_by('-created', '-id'))
+
+    position = decode_cursor(cursor) if cursor else None
+    cursor = cursor if position is not None else None
+    if position is not None:
+        created, comment_id = position
+        comments = comments.filter(Q(created__lt=created) | Q(created=created, id__lt=comment_id))
+    return comments[:per_page + 1], cursor
+
+
+def comment_result(rows, cursor, per_page):
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        return KeysetPage(rows[:per_page], cursor, encode_position(last.created, last.id))
+    return KeysetPage(rows, cursor)
+
+
+def comment_page(listing_id, cursor=None, per_page=None):
+    """A listing's comments newest first, with their commenters, in one query on the
+    (listing, created) index; `cursor` continues from the last comment of the previous page."""
+    per_page = per_page or settings.COMMENTS_PER_PAGE
+    rows, cursor = comment_query(listing_id, cursor, per_page)
+    return comment_result(list(rows), cursor, per_page)
+
+
+async def acomment_page(listing_id, cursor=None, per_page=None):
+    per_page = per_page or settings.COMMENTS_PER_PAGE
+    rows, cursor = comment_query(listing_id, cursor, per_page)
+    return comment_result([comment async for comment in rows], cursor, per_page)
@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    """One listener's bounded queue of events for a listing. A listener that falls behind loses its
+    oldest events rather than holding up the publisher."""
+
+    def __init__(self, broker, listing_id, maxsize):
+        self.broker = broker
+        self.listing_id = listing_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        # runs on the subscriber's event loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans listing events out to the subscribers connected to this process.
+
+    Any broker with the same publish()/subscribe() interface can replace it through
+    settings.LISTING_EVENT_BROKER, e.g. one backed by a local message broker so that events reach
+    subscribers held by other worker processes.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._ids = itertools.count(1)
+
+    def subscribe(self, listing_id):
+        """Start listening to a listing; must be called from the subscriber's event loop."""
+        subscription = Subscription(self, listing_id, self.queue_size)
+        with self._lock:
+            self._subscriptions[listing_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.listing_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.listing_id]
+
+    def subscriber_count(self, listing_id):
+        with self._lock:
+            return len(self._subscriptions.get(listing_id, ()))
+
+    def publish(self, listing_id, event):
+        """Deliver an event to every subscriber of the listing; safe to call from any thread."""
+        event = {'id': next(self._ids), **event}
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(listing_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # the subscriber's loop has shut down
+                self.unsubscribe(subscription)
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.LISTING_EVENT_BROKER)()
+        return _broker
+
+
+def publish_listing_event(listing_id, kind, **data):
+    get_broker().publish(listing_id, {'event': kind, 'listing_id': listing_id, **data})
+
+
+def format_event(event):
+    """Server-Sent Events wire format."""
+    data = {key: value for key, value in event.items() if key not in ('id', 'event')}
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -1,19 +1,39 @@
 from django import forms
+from django.utils import timezone
 
+from .genres import genre_registry
 from .models import Listing, Bid, Comment
 
+def genre_choices():
+    return genre_registry.choices()
+
+class GenreChoiceField(forms.TypedMultipleChoiceField):
+    """Genre ids offered and validated from the in-process genre registry rather than a queryset."""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('coerce', int)
+        kwargs.setdefault('choices', genre_choices)
+        super().__init__(**kwargs)
+
 class NewListingForm(forms.ModelForm):
+    genres = GenreChoiceField(label="Genre(s)", widget=forms.SelectMultiple(attrs={'class': 'form-select form-select-sm',
+                                                                                   'required': True}))
+
     class Meta: 
         model = Listing
-        fields = ['title', 'description', 'starting_bid', 'image', 'genres']
+        fields = ['title', 'description', 'starting_bid', 'image', 'ends_at', 'genres']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.TextInput(attrs={'class': 'form-control'}),
             'starting_bid': forms.NumberInput(attrs={'class': 'form-control'}),
             'image': forms.FileInput(attrs={'class': 'form-control'}),
-            'genres': forms.SelectMultiple(attrs={'class': 'form-select form-select-sm',
-                                                  'required': True})  
+            'ends_at': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
         }
+
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data['ends_at']
+        if ends_at is not None and ends_at <= timezone.now():
+            raise forms.ValidationError('The end time must be in the future.')
+        return ends_at
         
 class BidForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Genre
+
+
+STAMP_KEY = 'genre-registry-stamp'
+
+
+class GenreRegistry:
+    """In-process snapshot of the Genre table, which almost never changes.
+
+    Loaded with one query on first use and dropped whenever a Genre is saved or deleted (see
+    auctions.signals), so in steady state resolving a slug, id or the full list costs no queries.
+    Other processes learn of the change through a stamp in the shared GENRE_CACHE_ALIAS cache,
+    which each one compares with its snapshot's at most every GENRE_REGISTRY_CHECK_INTERVAL
+    seconds. `digest()` identifies the genres, in every process alike, for caches holding anything
+    rendered from genre names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked = 0.0
+
+    @staticmethod
+    def _cache():
+        return caches[settings.GENRE_CACHE_ALIAS]
+
+    def _shared_stamp(self):
+        cache = self._cache()
+        # a stamp the cache lost is replaced, which every process then takes for a change
+        cache.add(STAMP_KEY, uuid.uuid4().hex, None)
+        return cache.get(STAMP_KEY)
+
+    def _load(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked >= settings.GENRE_REGISTRY_CHECK_INTERVAL:
+            self._checked = time.monotonic()
+            if self._shared_stamp() != snapshot['stamp']:
+                with self._lock:
+                    if self._snapshot is snapshot:
+                        self._snapshot = None
+                snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    # read before the rows, so a change committed in between reloads again
+                    stamp = self._shared_stamp()
+                    self._checked = time.monotonic()
+                    genres = list(Genre.objects.order_by('name'))
+                    self._snapshot = {
+                        'stamp': stamp,
+                        'all': genres,
+                        'by_id': {genre.id: genre for genre in genres},
+                        'by_slug': {genre.slug: genre for genre in genres if genre.slug},
+                        'digest': hashlib.sha1(repr([(genre.id, genre.name, genre.slug) for genre in genres]).encode()).hexdigest()[:12],
+                    }
+                snapshot = self._snapshot
+        return snapshot
+
+    async def _aload(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = await sync_to_async(self._load)()
+        return snapshot
+
+    def all(self):
+        return self._load()['all']
+
+    def by_slug(self, slug):
+        return self._load()['by_slug'].get(slug)
+
+    # for async views, which may not query from the event loop: the snapshot is loaded off it
+    async def aall(self):
+        return (await self._aload())['all']
+
+    async def aby_slug(self, slug):
+        return (await self._aload())['by_slug'].get(slug)
+
+    def by_id(self, genre_id):
+        return self._load()['by_id'].get(genre_id)
+
+    # identifies the snapshot's contents, the same in every process
+    def digest(self):
+        return self._load()['digest']
+
+    def choices(self):
+        return [(genre.id, genre.name) for genre in self.all()]
+
+    def invalidate(self):
+        """Drop the snapshot here, and in every other process on its next check."""
+        with self._lock:
+            self._snapshot = None
+        self._cache().set(STAMP_KEY, uuid.uuid4().hex, None)
+
+
+genre_registry = GenreRegistry()
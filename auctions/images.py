@@ -0,0 +1,130 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .models import Listing, ImageJob
+from .pagecache import purge_listing
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def encode(image, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(listing):
+    """Render the listing's image variants and store them; returns {field name: stored name}."""
+    with listing.image.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail(settings.LISTING_THUMBNAIL_SIZE)
+    stem = os.path.splitext(os.path.basename(listing.image.name))[0]
+    renditions = {
+        'thumbnail': (f'{stem}_thumb.jpg', encode(thumbnail.convert('RGB'), 'JPEG', quality=82, optimize=True)),
+        'thumbnail_webp': (f'{stem}_thumb.webp', encode(thumbnail, 'WEBP', quality=80)),
+        'image_webp': (f'{stem}.webp', encode(image, 'WEBP', quality=85)),
+    }
+
+    stored = {}
+    for field_name, (name, content) in renditions.items():
+        field = Listing._meta.get_field(field_name)
+        stored[field_name] = field.storage.save(field.generate_filename(listing, name), content)
+    return stored
+
+
+def process_job(job_id):
+    """Run one queued job. Returns True once the listing has its variants (or no longer needs them)."""
+    claimed = ImageJob.objects.filter(pk=job_id, status=ImageJob.PENDING).update(
+        status=ImageJob.RUNNING, attempts=F('attempts') + 1)
+    if not claimed:
+        return False
+    job = ImageJob.objects.select_related('listing').get(pk=job_id)
+
+    if job.listing.image:
+        try:
+            variants = make_variants(job.listing)
+        except Exception as error:
+            logger.exception("Generating image variants for listing %s failed", job.listing_id)
+            status = ImageJob.FAILED if job.attempts >= MAX_ATTEMPTS else ImageJob.PENDING
+            ImageJob.objects.filter(pk=job_id).update(status=status, error=str(error))
+            return False
+        with transaction.atomic():
+            Listing.objects.filter(pk=job.listing_id).touch(**variants)
+            purge_listing(job.listing_id)
+            job.delete()
+    else:
+        job.delete()
+    return True
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-variants')
+        return _executor
+
+
+def drain():
+    """Run queued jobs, oldest first, until none is pending. A job that fails goes back on the queue
+    until it runs out of attempts, so it is retried by a later pass."""
+    while True:
+        job_ids = list(pending_jobs().values_list('pk', flat=True)[:100])
+        if not job_ids:
+            return
+        for job_id in job_ids:
+            process_job(job_id)
+
+
+def run_in_background(job_id=None):
+    """Hand a job to the in-process pool, or with no job, everything queued."""
+    def run():
+        try:
+            # a failed job is queued again (unless out of attempts), with whatever else is waiting
+            if job_id is None or not process_job(job_id):
+                drain()
+        except Exception:
+            logger.exception("Running image jobs failed")
+        finally:
+            close_old_connections()
+
+    executor().submit(run)
+
+
+def start_image_workers():
+    """Start the pool on the jobs already queued: retries, backfills and jobs left by a restart.
+    The server entry points (commerce.wsgi, commerce.asgi) call it."""
+    if settings.IMAGE_WORKERS:
+        run_in_background()
+
+
+def enqueue_image_job(listing):
+    """Queue variant generation for a listing's (new) image. The job row is the durable record;
+    when IMAGE_WORKERS is set it is also handed to the in-process pool once the upload commits, and
+    the pool drains the rest of the queue when the server starts. Without workers,
+    `manage.py process_images` runs the queue."""
+    job = ImageJob.objects.create(listing=listing)
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: run_in_background(job.pk))
+    return job
+
+
+def pending_jobs():
+    return ImageJob.objects.filter(status=ImageJob.PENDING).order_by('created')
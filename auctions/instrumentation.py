@@ -0,0 +1,154 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from .benchmarks import percentile
+
+logger = logging.getLogger(__name__)
+
+# timings of the request being handled, if instrumentation is on
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'query_count', 'query_time', 'render_time', 'rendering', 'keep_sql')
+
+    def __init__(self, keep_sql):
+        self.queries = []
+        self.query_count = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        self.rendering = False
+        self.keep_sql = keep_sql
+
+    # a connection execute_wrapper
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if self.keep_sql:
+                self.queries.append((elapsed, sql))
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        # templates rendered from inside another (listing cards) count towards the outer one
+        if timings is None or timings.rendering:
+            return super().render(context, request)
+        timings.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.render_time += time.perf_counter() - start
+            timings.rendering = False
+
+
+class TimedTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for PerformanceMiddleware. Without an
+    instrumented request in progress it adds one context variable lookup per render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class RequestStats:
+    """Rolling window of the latest request samples per view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=settings.PERF_WINDOW))
+
+    def add(self, view, sample):
+        with self._lock:
+            self._samples[view].append(sample)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """Per view: request count in the window, p50/p95/p99 wall time, mean query count and p95
+        query, render time and mean response size (times in ms)."""
+        with self._lock:
+            samples = {view: list(window) for view, window in self._samples.items()}
+        rows = []
+        for view, window in sorted(samples.items()):
+            walls, counts, query_times, render_times, sizes = zip(*window)
+            sizes = [size for size in sizes if size is not None]
+            rows.append({
+                'view': view,
+                'requests': len(window),
+                'p50': percentile(walls, 50) * 1000,
+                'p95': percentile(walls, 95) * 1000,
+                'p99': percentile(walls, 99) * 1000,
+                'queries': sum(counts) / len(counts),
+                'query_p95': percentile(query_times, 95) * 1000,
+                'render_p95': percentile(render_times, 95) * 1000,
+                'size': sum(sizes) / len(sizes) if sizes else None,
+            })
+        return rows
+
+
+request_stats = RequestStats()
+
+
+class PerformanceMiddleware:
+    """Time each request: wall time, database queries and their time, template rendering and
+    response size. Samples feed `request_stats` (see the stats/requests page), go out in a
+    Server-Timing header, and requests slower than PERF_SLOW_REQUEST_MS are logged with their SQL.
+
+    Only installed when PERF_INSTRUMENTATION is on; otherwise Django drops it from the chain.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_ms = settings.PERF_SLOW_REQUEST_MS
+        timings = RequestTimings(keep_sql=slow_ms is not None)
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        wall = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        request_stats.add(view, (wall, timings.query_count, timings.query_time, timings.render_time, size))
+
+        response['Server-Timing'] = (f'app;dur={wall * 1000:.1f}, '
+                                     f'db;dur={timings.query_time * 1000:.1f};desc="{timings.query_count} queries", '
+                                     f'render;dur={timings.render_time * 1000:.1f}')
+
+        if slow_ms is not None and wall * 1000 >= slow_ms:
+            queries = '\n'.join(f'  {elapsed * 1000:8.2f} ms  {sql}' for elapsed, sql in timings.queries)
+            logger.warning("Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, render %.0f ms\n%s",
+                           request.method, request.path, view, wall * 1000, timings.query_count,
+                           timings.query_time * 1000, timings.render_time * 1000, queries)
+        return response
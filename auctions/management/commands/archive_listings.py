@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.archive import archive_closed
+
+
+class Command(BaseCommand):
+    help = "Move listings closed for at least ARCHIVE_AFTER seconds, with their bids and comments, to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Listings moved per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep archiving instead of exiting after one pass.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            archived = archive_closed(batch_size=batch_size)
+            if archived or not loop:
+                self.stdout.write(self.style.SUCCESS(f"Archived {archived} closed listings."))
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,201 @@
+import asyncio
+import importlib.util
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from auctions.benchmarks import WORDS, benchmark_database, seed_activity, seed_catalogue, summarize
+from auctions.models import Listing, Genre, User
+
+# server modes: the value of ASYNC_READ_VIEWS each uvicorn server runs with
+MODES = {'sync': '0', 'async': '1'}
+
+
+def request_paths(rng, listing_ids, slugs, count):
+    """A mix of read traffic: grid pages, categories, keyword searches, listing pages and the watchlist."""
+    paths = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.35:
+            paths.append(f"{reverse('index')}?page={rng.randint(1, 5)}")
+        elif roll < 0.55:
+            paths.append(reverse('search', args=[rng.choice(slugs)]))
+        elif roll < 0.7:
+            paths.append(f"{reverse('search')}?q={rng.choice(WORDS)}")
+        elif roll < 0.95:
+            paths.append(reverse('listing', args=[rng.choice(listing_ids)]))
+        else:
+            paths.append(reverse('watchlist'))
+    return paths
+
+
+async def fetch(reader, writer, path, cookie):
+    """One GET over a kept-alive HTTP/1.1 connection; returns the status code and whether the
+    server keeps the connection open."""
+    headers = f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'
+    if cookie:
+        headers += f'Cookie: {cookie}\r\n'
+    writer.write(f'{headers}\r\n'.encode())
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length, chunked, keep_alive = 0, False, True
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+        elif name == 'connection' and value.lower() == 'close':
+            keep_alive = False
+    if chunked:
+        while size := int((await reader.readline()).strip(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    else:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def run_clients(port, paths, cookies, concurrency, seconds):
+    """Keep `concurrency` connections busy with requests for `seconds`; returns latencies and errors."""
+    samples, errors = [], Counter()
+    deadline = time.perf_counter() + seconds
+
+    async def client(n):
+        rng = random.Random(n)
+        cookie = cookies[n % len(cookies)] if cookies else None
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                try:
+                    status, keep_alive = await fetch(reader, writer, rng.choice(paths), cookie)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+                    errors[type(error).__name__] += 1
+                    status, keep_alive = None, False
+                if not keep_alive:
+                    writer.close()
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                if status is None:
+                    continue
+                if status >= 400:
+                    errors[f'HTTP {status}'] += 1
+                else:
+                    samples.append(time.perf_counter() - began)
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return samples, errors
+
+
+def wait_for_port(port, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError(f"uvicorn exited with status {server.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"uvicorn did not start listening on port {port}")
+
+
+class Command(BaseCommand):
+    help = ("Serve a generated dataset with uvicorn, once with the sync read views and once with their "
+            "async versions (ASYNC_READ_VIEWS) at the same worker count, and report throughput and "
+            "latency of read traffic at each concurrency level.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--listings', type=int, default=20_000)
+        parser.add_argument('--workers', type=int, default=2, help="uvicorn worker processes per server.")
+        parser.add_argument('--concurrency', default='1,16,64', help="Comma-separated numbers of concurrent connections.")
+        parser.add_argument('--seconds', type=float, default=10, help="Measured time per concurrency level.")
+        parser.add_argument('--warmup', type=float, default=2, help="Unmeasured time before each server's first level.")
+        parser.add_argument('--anonymous', action='store_true',
+                            help="Send the requests signed out, i.e. mostly served by the page cache.")
+        parser.add_argument('--modes', default=','.join(MODES), help="Comma-separated subset of sync,async.")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the seeded benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("uvicorn is not installed (pip install uvicorn).")
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        if set(modes) - set(MODES):
+            raise CommandError(f"Unknown modes: {', '.join(sorted(set(modes) - set(MODES)))}")
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        with benchmark_database(keepdb=options['keepdb']):
+            if not Listing.objects.exists():
+                self.stdout.write(f"Seeding {options['listings']} listings...")
+                users = seed_catalogue(options['listings'], users=options['users'], seed=options['seed'])
+                seed_activity(users, bids=options['listings'], comments=options['listings'],
+                              watches=options['users'] * 10, seed=options['seed'])
+            rng = random.Random(options['seed'])
+            paths = request_paths(rng, list(Listing.objects.values_list('listing_id', flat=True)),
+                                  list(Genre.objects.values_list('slug', flat=True)), 1000)
+            cookies = [] if options['anonymous'] else self.session_cookies(User.objects.order_by('pk')[:50])
+            # the servers are separate processes, so they are pointed at the benchmark database by name
+            database = connection.settings_dict['NAME']
+            connection.close()
+
+            results = {}
+            for mode in modes:
+                results[mode] = self.run_server(mode, database, paths, cookies, levels, options)
+
+        self.stdout.write(f"workers={options['workers']} profile={settings.DATABASE_PROFILE} "
+                          f"{'anonymous' if options['anonymous'] else 'signed in'}")
+        self.stdout.write(f"{'mode':<6} {'conns':>6} {'requests':>9} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}  (ms)")
+        for mode, rows in results.items():
+            for level, (samples, errors) in rows.items():
+                stats = summarize(samples) if samples else {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0}
+                self.stdout.write(f"{mode:<6} {level:>6} {stats['count']:>9} {stats['count'] / options['seconds']:>8.1f} "
+                                  f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f} {sum(errors.values()):>7}")
+                for error, count in errors.most_common(3):
+                    self.stdout.write(f"    {count} x {error}")
+
+    @staticmethod
+    def session_cookies(users):
+        cookies = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}')
+        return cookies
+
+    def run_server(self, mode, database, paths, cookies, levels, options):
+        env = {**os.environ, 'ASYNC_READ_VIEWS': MODES[mode], 'PERF_INSTRUMENTATION': '0'}
+        env['POSTGRES_DB' if connection.vendor == 'postgresql' else 'SQLITE_PATH'] = database
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'commerce.asgi:application', '--port', str(options['port']),
+             '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        try:
+            wait_for_port(options['port'], server)
+            self.stdout.write(f"{mode}: warming up...")
+            asyncio.run(run_clients(options['port'], paths, cookies, max(levels), options['warmup']))
+            rows = {}
+            for level in levels:
+                self.stdout.write(f"{mode}: {level} connections for {options['seconds']:g}s...")
+                rows[level] = asyncio.run(run_clients(options['port'], paths, cookies, level, options['seconds']))
+            return rows
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.utils.http import http_date
+from django.views import static
+
+from auctions import assets
+from auctions.benchmarks import summarize, time_calls
+
+STYLESHEET = 'auctions/styles.css'
+
+
+def consume(response):
+    """Send the response body nowhere, as a server would send it to the client; returns its size."""
+    size = sum(len(chunk) for chunk in response)
+    response.close()
+    return size
+
+
+class Command(BaseCommand):
+    help = ("Compare serving static and media files through django.views.static.serve (what static() "
+            "routes to) with auctions.assets: whole files, revalidations, ranges and compressed "
+            "stylesheets, reporting requests per second, latency and bytes sent per response.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per case and server.")
+        parser.add_argument('--image-kb', type=int, default=1024, help="Size of the media file served.")
+
+    def handle(self, *args, requests, image_kb, **options):
+        workdir = tempfile.mkdtemp()
+        try:
+            media_root = os.path.join(workdir, 'media')
+            os.makedirs(media_root)
+            with open(os.path.join(media_root, 'photo.jpg'), 'wb') as file:
+                file.write(os.urandom(image_kb * 1024))
+
+            static_settings = override_settings(
+                DEBUG=False, MEDIA_ROOT=media_root, STATIC_ROOT=os.path.join(workdir, 'static'),
+                STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'auctions.assets.CompressedManifestStaticFilesStorage'}},
+            )
+            with static_settings:
+                call_command('collectstatic', interactive=False, verbosity=0)
+                self.run_cases(requests, media_root)
+        finally:
+            shutil.rmtree(workdir)
+
+    def run_cases(self, requests, media_root):
+        factory = RequestFactory()
+        hashed_css = staticfiles_storage.stored_name(STYLESHEET)
+        photo_modified = http_date(os.stat(os.path.join(media_root, 'photo.jpg')).st_mtime)
+
+        def media_with_static(**headers):
+            return lambda: static.serve(factory.get('/media/photo.jpg', **headers), 'photo.jpg', document_root=media_root)
+
+        def media_with_assets(**headers):
+            return lambda: assets.serve_media(factory.get('/media/photo.jpg', **headers), 'photo.jpg')
+
+        # (case, {server: request}); static() only ever had the unhashed source to serve
+        cases = [
+            ('image', {'static()': media_with_static(), 'assets': media_with_assets()}),
+            ('image 304', {'static()': media_with_static(HTTP_IF_MODIFIED_SINCE=photo_modified),
+                           'assets': media_with_assets(HTTP_IF_MODIFIED_SINCE=photo_modified)}),
+            ('image range', {'static()': media_with_static(HTTP_RANGE='bytes=0-65535'),
+                             'assets': media_with_assets(HTTP_RANGE='bytes=0-65535')}),
+            ('stylesheet', {
+                'static()': lambda: static.serve(factory.get(f'/static/{STYLESHEET}', HTTP_ACCEPT_ENCODING='gzip, br'),
+                                                 STYLESHEET, document_root=settings.STATIC_ROOT),
+                'assets': lambda: assets.serve_static(factory.get(f'/static/{hashed_css}', HTTP_ACCEPT_ENCODING='gzip, br'),
+                                                      hashed_css),
+            }),
+        ]
+
+        self.stdout.write(f"{'case':<12} {'server':<9} {'req/s':>9} {'p50':>8} {'p95':>8} {'bytes':>9}  status, cache-control")
+        for case, servers in cases:
+            for server, request in servers.items():
+                sizes = []
+                samples = time_calls(lambda: sizes.append(consume(request())), [()] * requests)
+                stats = summarize(samples)
+                sample = request()
+                consume(sample)
+                self.stdout.write(f"{case:<12} {server:<9} {requests / sum(samples):>9.0f} {stats['p50']:>8.3f} "
+                                  f"{stats['p95']:>8.3f} {sizes[-1]:>9}  {sample.status_code}, "
+                                  f"{sample.get('Cache-Control', '-')}")
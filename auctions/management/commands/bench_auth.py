@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from auctions.auth import forget_all_users
+from auctions.benchmarks import benchmark_database, seed_catalogue, summarize, time_calls
+
+USER_BACKENDS = {
+    'cached': 'auctions.auth.CachedModelBackend',
+    'db': 'django.contrib.auth.backends.ModelBackend',
+}
+
+# the anonymous page cache would answer the anonymous requests without running the view
+NO_PAGE_CACHE = {**settings.CACHES, settings.PAGE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = ("Time password hashing (a registration) and checking (a sign-in) at each PBKDF2 iteration "
+            "count, then the cost of a signed-in request next to an anonymous one for every session "
+            "store, with and without the user cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', default='100000,260000,600000,1000000',
+                            help="Comma-separated PBKDF2 iteration counts to time.")
+        parser.add_argument('--hashes', type=int, default=20, help="Passwords hashed and checked per count.")
+        parser.add_argument('--sessions', default=','.join(settings.SESSION_ENGINES),
+                            help="Comma-separated SESSION_BACKEND values to compare.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per session store, user cache and client.")
+        parser.add_argument('--listings', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        sessions = [name.strip() for name in options['sessions'].split(',') if name.strip()]
+        if set(sessions) - set(settings.SESSION_ENGINES):
+            raise CommandError(f"Unknown session stores: {', '.join(sorted(set(sessions) - set(settings.SESSION_ENGINES)))}")
+
+        self.stdout.write(f"{'iterations':>10} {'hash p50':>9} {'check p50':>10}  (ms, {options['hashes']} passwords)")
+        for iterations in (int(count) for count in options['iterations'].split(',')):
+            with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+                passwords = [(f'correct horse {n}',) for n in range(options['hashes'])]
+                encoded = [make_password(password) for password, in passwords]
+                hashing = summarize(time_calls(make_password, passwords))
+                checking = summarize(time_calls(check_password, [(password, hashed) for (password,), hashed in zip(passwords, encoded)]))
+            self.stdout.write(f"{iterations:>10} {hashing['p50']:>9.1f} {checking['p50']:>10.1f}")
+
+        with benchmark_database():
+            user = seed_catalogue(options['listings'], users=10)[0]
+            self.stdout.write(f"\n{'sessions':<15} {'users':<7} {'client':<10} {'p50':>8} {'p95':>8} {'queries':>8}  "
+                              f"(ms, {options['requests']} requests of the index page)")
+            for session in sessions:
+                for user_backend, backend_path in USER_BACKENDS.items():
+                    with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[session],
+                                           AUTHENTICATION_BACKENDS=[backend_path], CACHES=NO_PAGE_CACHE):
+                        forget_all_users()
+                        signed_in = Client(HTTP_HOST='localhost')
+                        signed_in.force_login(user)
+                        for client_name, client in (('anonymous', Client(HTTP_HOST='localhost')), ('signed in', signed_in)):
+                            stats, queries = self.measure(client, options['requests'])
+                            self.stdout.write(f"{session:<15} {user_backend:<7} {client_name:<10} {stats['p50']:>8.2f} "
+                                              f"{stats['p95']:>8.2f} {queries:>8}")
+
+    @staticmethod
+    def measure(client, requests):
+        """Latency of GETs of the index page after a warm-up one, and the queries of the last."""
+        url = reverse('index')
+        client.get(url)
+        samples = time_calls(client.get, [(url,)] * requests)
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        return summarize(samples), len(queries)
@@ -0,0 +1,65 @@
+import itertools
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from auctions.benchmarks import benchmark_database, run_load, seed_catalogue, summarize
+from auctions.bidbook import bid_books, submit_bid
+from auctions.models import Bid, Listing
+
+# (path, listing.bid_book, BID_BOOK_FSYNC)
+PATHS = [('direct', False, True), ('book', True, True), ('book, no fsync', True, False)]
+
+
+class Command(BaseCommand):
+    help = ("Bid on one hot listing from many threads, through the direct path (place_bid) and through "
+            "a bid book, and report accepted bids per second, rejections and latency, checking that "
+            "every accepted bid reached the database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Concurrent bidders.")
+        parser.add_argument('--seconds', type=float, default=5, help="Measured time per path.")
+
+    def handle(self, *args, threads, seconds, **options):
+        workdir = tempfile.mkdtemp()
+        try:
+            with benchmark_database():
+                users = seed_catalogue(10, users=threads)
+                results = [self.run_path(name, book, fsync, users, threads, seconds, os.path.join(workdir, 'bids.wal'))
+                           for name, book, fsync in PATHS]
+        finally:
+            shutil.rmtree(workdir)
+
+        self.stdout.write(f"profile={settings.DATABASE_PROFILE} threads={threads} "
+                          f"flush interval={settings.BID_BOOK_FLUSH_INTERVAL}s")
+        self.stdout.write(f"{'path':<15} {'accepted':>9} {'bids/s':>8} {'rejected':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'written':>8}  (ms)")
+        for name, samples, errors, written in results:
+            stats = summarize(samples) if samples else {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0}
+            self.stdout.write(f"{name:<15} {stats['count']:>9} {stats['count'] / seconds:>8.0f} {sum(errors.values()):>9} "
+                              f"{stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['p99']:>8.2f} {written:>8}")
+            # rejections are outbid bids; anything else is a failure worth seeing
+            for error, count in [(error, count) for error, count in errors.most_common() if not error.startswith('BidError')][:3]:
+                self.stdout.write(f"    {count} x {error}")
+
+    def run_path(self, name, book, fsync, users, threads, seconds, wal):
+        self.stdout.write(f"{name}: {threads} bidders for {seconds:g}s...")
+        listing = Listing.objects.create(owner=users[0], title=f'Hot listing ({name})', description='Ending soon',
+                                         starting_bid=Decimal('1.00'), bid_book=book)
+        # rising amounts in cents; bidders racing each other still get some rejected for being outbid
+        amounts = itertools.count(100)
+        connection.close()
+
+        def bidder(rng):
+            user = rng.choice(users)
+            return lambda: submit_bid(listing, user, f'{next(amounts) / 100:.2f}')
+
+        with override_settings(BID_BOOK_WAL=wal, BID_BOOK_FSYNC=fsync):
+            samples, errors = run_load({name: (threads, bidder)}, seconds)[name]
+            bid_books.stop()
+        return name, samples, errors, Bid.objects.filter(listing=listing).count()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks import benchmark_database, seed_catalogue
+from auctions.closing import close_expired
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Benchmark the expiry sweep on a synthetic catalogue that is mostly closed listings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1_000_000)
+        parser.add_argument('--open-share', type=float, default=0.05, help="Share of the catalogue that is still open.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the seeded benchmark database between runs.")
+
+    def handle(self, *args, listings, open_share, batch_size, keepdb, **options):
+        with benchmark_database(keepdb=keepdb):
+            self.stdout.write(f"Seeding {listings} listings, {open_share:.0%} open...")
+            seed_catalogue(listings, open_share=open_share)
+
+            expired = Listing.objects.expired().order_by('ends_at').values_list('pk', flat=True)[:batch_size]
+            self.stdout.write(f"Sweep query plan:\n{expired.explain()}")
+            waiting = Listing.objects.expired().count()
+
+            start = time.perf_counter()
+            closed = close_expired(batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+
+            # with nothing left to close, a sweep should cost one index probe
+            start = time.perf_counter()
+            close_expired(batch_size=batch_size)
+            idle = time.perf_counter() - start
+
+        self.stdout.write(f"Expired and open: {waiting}; closed {closed} in {elapsed:.2f}s "
+                          f"({closed / elapsed:,.0f} listings/sec, batches of {batch_size})")
+        self.stdout.write(f"Idle sweep: {idle * 1000:.2f} ms")
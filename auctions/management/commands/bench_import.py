@@ -0,0 +1,57 @@
+import json
+import random
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils.text import slugify
+
+from auctions.benchmarks import GENRES, benchmark_database, phrase, seed_catalogue
+from auctions.forms import NewListingForm
+from auctions.genres import genre_registry
+
+
+class Command(BaseCommand):
+    help = "Benchmark import_listings on a synthetic JSON Lines catalogue against saving listings one form at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--single-rows', type=int, default=2000, help="Rows saved one at a time for comparison.")
+
+    def handle(self, *args, rows, batch_size, single_rows, **options):
+        rng = random.Random(0)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as source:
+            for _ in range(rows):
+                source.write(json.dumps({
+                    'title': phrase(rng, 3).title(),
+                    'description': phrase(rng, 12),
+                    'starting_bid': f'{rng.randint(100, 9999) / 100:.2f}',
+                    'genres': rng.sample(GENRES, rng.randint(1, 3)),
+                }) + '\n')
+            source.flush()
+
+            with benchmark_database():
+                seller = seed_catalogue(0, users=1)[0]
+
+                start = time.perf_counter()
+                call_command('import_listings', source.name, owner=seller.username, batch_size=batch_size, stdout=StringIO())
+                bulk_rate = rows / (time.perf_counter() - start)
+
+                # the per-listing path views.create takes: save the listing, then link its genres
+                with open(source.name) as lines:
+                    sample = [json.loads(next(lines)) for _ in range(min(single_rows, rows))]
+                start = time.perf_counter()
+                for row in sample:
+                    form = NewListingForm({**row, 'genres': [genre_registry.by_slug(slugify(name)).id for name in row['genres']]})
+                    form.is_valid()
+                    listing = form.save(commit=False)
+                    listing.owner = seller
+                    listing.save()
+                    form.save_m2m()
+                single_rate = len(sample) / (time.perf_counter() - start)
+
+        self.stdout.write(f"import_listings (batches of {batch_size}): {bulk_rate:>10,.0f} rows/sec over {rows} rows")
+        self.stdout.write(f"one listing at a time:               {single_rate:>10,.0f} rows/sec over {len(sample)} rows")
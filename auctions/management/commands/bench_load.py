@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from auctions.benchmarks import WORDS, benchmark_database, run_load, seed_catalogue, summarize
+from auctions.models import Listing
+
+
+def checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'HTTP {response.status_code}')
+
+
+class Command(BaseCommand):
+    help = ("Load-test bidding and browsing concurrently against the database profile selected by "
+            "DATABASE_PROFILE, and report throughput and latency per path.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=5000)
+        parser.add_argument('--bidders', type=int, default=4, help="Threads posting bids.")
+        parser.add_argument('--browsers', type=int, default=8, help="Threads reading grid, listing and search pages.")
+        parser.add_argument('--hot', type=int, default=20, help="Number of listings the bids are spread over.")
+        parser.add_argument('--seconds', type=float, default=15)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the seeded benchmark database between runs.")
+
+    def handle(self, *args, listings, bidders, browsers, hot, seconds, keepdb, **options):
+        with benchmark_database(keepdb=keepdb):
+            self.stdout.write(f"Seeding {listings} listings...")
+            owners = seed_catalogue(listings)
+            listing_ids = list(Listing.objects.biddable().values_list('pk', flat=True))
+            hot_ids = listing_ids[:hot]
+            journal = 'n/a'
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    journal = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            connection.close()
+
+            def bidder(rng):
+                client = Client(HTTP_HOST='localhost')
+                client.force_login(rng.choice(owners))
+
+                def post_bid():
+                    listing_id = rng.choice(hot_ids)
+                    checked(client.post(reverse('listing', args=[listing_id]),
+                                        {'bid_amount': 'Place Bid', 'bid': f'{rng.uniform(1, 999):.2f}'}))
+                return post_bid
+
+            def browser(rng):
+                client = Client(HTTP_HOST='localhost')
+
+                def get_page():
+                    roll = rng.random()
+                    if roll < 0.4:
+                        checked(client.get(reverse('index'), {'page': rng.randint(1, 5)}))
+                    elif roll < 0.8:
+                        checked(client.get(reverse('listing', args=[rng.choice(listing_ids)])))
+                    else:
+                        checked(client.get(reverse('search'), {'q': rng.choice(WORDS)}))
+                return get_page
+
+            self.stdout.write(f"Running {bidders} bidders and {browsers} browsers for {seconds:g}s...")
+            results = run_load({'bid': (bidders, bidder), 'browse': (browsers, browser)}, seconds)
+
+        self.stdout.write(f"profile={settings.DATABASE_PROFILE} vendor={connection.vendor} journal={journal} "
+                          f"CONN_MAX_AGE={settings.CONN_MAX_AGE}")
+        self.stdout.write(f"{'path':<8} {'requests':>9} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}  (ms)")
+        for name, (samples, errors) in results.items():
+            stats = summarize(samples) if samples else {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0}
+            self.stdout.write(f"{name:<8} {stats['count']:>9} {stats['count'] / seconds:>8.1f} {stats['p50']:>8.1f} "
+                              f"{stats['p95']:>8.1f} {stats['p99']:>8.1f} {sum(errors.values()):>7}")
+            for error, count in errors.most_common(3):
+                self.stdout.write(f"    {count} x {error}")
@@ -0,0 +1,43 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks import REFERENCES, WORDS, benchmark_database, seed_catalogue, summarize, time_calls
+from auctions.search import fts_enabled, fts_listing_ids, icontains_listing_ids
+
+PER_PAGE = 24
+
+
+class Command(BaseCommand):
+    help = "Benchmark keyword search latency with the FTS5 index against a plain icontains scan on a synthetic catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the seeded benchmark database between runs.")
+
+    def handle(self, *args, listings, queries, keepdb, **options):
+        with benchmark_database(keepdb=keepdb):
+            if not fts_enabled():
+                self.stderr.write("This database has no FTS5 support; nothing to compare.")
+                return
+            self.stdout.write(f"Seeding {listings} listings...")
+            seed_catalogue(listings)
+
+            rng = random.Random(1)
+            workloads = {
+                'one word': lambda: [rng.choice(WORDS)],
+                'two words': lambda: rng.sample(WORDS, 2),
+                'reference': lambda: [f'ref{rng.randrange(REFERENCES)}'],
+                'no match': lambda: [f'{rng.choice(WORDS)}xyz'],
+            }
+            results = []
+            for workload, terms in workloads.items():
+                calls = [(terms(),) for _ in range(queries)]
+                for backend, listing_ids in (('fts5', fts_listing_ids), ('icontains', icontains_listing_ids)):
+                    samples = time_calls(lambda terms: listing_ids(terms, limit=PER_PAGE + 1), calls)
+                    results.append((workload, backend, summarize(samples)))
+
+        self.stdout.write(f"{'workload':<10} {'backend':<10} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms, {queries} queries each)")
+        for workload, backend, stats in results:
+            self.stdout.write(f"{workload:<10} {backend:<10} {stats['mean']:>9.2f} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}")
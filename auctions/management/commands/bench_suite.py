@@ -0,0 +1,208 @@
+import json
+import platform
+import random
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from auctions.benchmarks import WORDS, benchmark_database, percentile, seed_activity, seed_catalogue
+from auctions.models import Listing, Genre, User
+
+
+class Traffic:
+    """The seeded data the scenarios draw their requests from."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.listing_ids = list(Listing.objects.values_list('listing_id', flat=True))
+        self.open_ids = list(Listing.objects.biddable().values_list('listing_id', flat=True))
+        self.slugs = list(Genre.objects.values_list('slug', flat=True))
+        self.users = list(User.objects.order_by('pk'))
+
+    def client(self, logged_in):
+        client = Client(HTTP_HOST='localhost')
+        if logged_in:
+            client.force_login(self.rng.choice(self.users))
+        return client
+
+
+# Each scenario returns the next request as (method, path, data). Anything it needs to look up to
+# build the request happens here, outside the timed part.
+
+def browse(traffic):
+    return 'GET', reverse('index'), {'page': traffic.rng.randint(1, 10)}
+
+
+def category(traffic):
+    return 'GET', reverse('search', args=[traffic.rng.choice(traffic.slugs)]), {'page': traffic.rng.randint(1, 5)}
+
+
+def search(traffic):
+    return 'GET', reverse('search'), {'q': ' '.join(traffic.rng.sample(WORDS, traffic.rng.randint(1, 2)))}
+
+
+def detail(traffic):
+    return 'GET', reverse('listing', args=[traffic.rng.choice(traffic.listing_ids)]), {}
+
+
+def bid(traffic):
+    listing = Listing.objects.only('starting_bid', 'current_price').get(pk=traffic.rng.choice(traffic.open_ids))
+    amount = (listing.current_price or listing.starting_bid) + traffic.rng.choice([0, 1, 5])
+    return 'POST', reverse('listing', args=[listing.pk]), {'bid_amount': 'Place Bid', 'bid': f'{amount:.2f}'}
+
+
+def watchlist(traffic):
+    if traffic.rng.random() < 0.7:
+        return 'GET', reverse('watchlist'), {}
+    action = traffic.rng.choice(['add_watchlist', 'remove_watchlist'])
+    return 'POST', reverse('listing', args=[traffic.rng.choice(traffic.listing_ids)]), {action: action}
+
+
+def api(traffic):
+    return 'GET', reverse('api_listings'), {'limit': 24}
+
+
+# name: (scenario, whether its client is logged in)
+SCENARIOS = {
+    'browse': (browse, False),
+    'category': (category, False),
+    'search': (search, False),
+    'detail': (detail, False),
+    'detail-user': (detail, True),
+    'bid': (bid, True),
+    'watchlist': (watchlist, True),
+    'api': (api, False),
+}
+
+
+class Command(BaseCommand):
+    help = ("Run scripted browse/category/search/detail/bid/watchlist/API traffic through the test client on a "
+            "generated dataset and report latency percentiles and queries per request, optionally saving the "
+            "results and comparing them with an earlier run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--listings', type=int, default=20_000)
+        parser.add_argument('--genres', type=int, default=10)
+        parser.add_argument('--bids', type=int, default=20_000)
+        parser.add_argument('--comments', type=int, default=20_000)
+        parser.add_argument('--watches', type=int, default=5_000)
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per scenario first.")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated subset to run.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', metavar='PATH', help="Write the results as JSON.")
+        parser.add_argument('--compare', metavar='PATH', help="Compare with results saved by an earlier run.")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Percent p95 slowdown that counts as a regression when comparing.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the seeded benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        dataset = {key: options[key] for key in ('users', 'listings', 'genres', 'bids', 'comments', 'watches', 'seed')}
+        with benchmark_database(keepdb=options['keepdb']):
+            if not Listing.objects.exists():
+                self.stdout.write(f"Seeding {dataset}...")
+                users = seed_catalogue(options['listings'], users=options['users'], genres=options['genres'], seed=options['seed'])
+                seed_activity(users, bids=options['bids'], comments=options['comments'], watches=options['watches'],
+                              seed=options['seed'])
+            results = {name: self.run_scenario(name, options) for name in names}
+
+        report = {
+            'dataset': dataset,
+            'requests': options['requests'],
+            'environment': {'python': platform.python_version(), 'database': settings.DATABASE_PROFILE,
+                            'vendor': connection.vendor},
+            'finished': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'results': results,
+        }
+        self.print_results(results, baseline)
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Saved to {options['save']}")
+
+        if baseline is not None:
+            if baseline.get('dataset') != dataset:
+                self.stderr.write("Warning: the baseline was run on a different dataset.")
+            regressions = self.regressions(results, baseline['results'], options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING(f"Regression: {regression}"))
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+
+    def run_scenario(self, name, options):
+        scenario, logged_in = SCENARIOS[name]
+        traffic = Traffic(f"{options['seed']}-{name}")
+        client = traffic.client(logged_in)
+        queries = []
+
+        def count_query(execute, *args):
+            queries[-1] += 1
+            return execute(*args)
+
+        samples = []
+        for n in range(options['warmup'] + options['requests']):
+            method, path, data = scenario(traffic)
+            queries.append(0)
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                response = getattr(client, method.lower())(path, data)
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f"{name}: {method} {path} returned {response.status_code}")
+            if n >= options['warmup']:
+                samples.append(elapsed)
+            else:
+                queries.pop()
+
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples) * 1000,
+            'p50': percentile(samples, 50) * 1000,
+            'p95': percentile(samples, 95) * 1000,
+            'p99': percentile(samples, 99) * 1000,
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+        }
+
+    def print_results(self, results, baseline):
+        self.stdout.write(f"{'scenario':<12} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'max q':>6}  (ms)")
+        for name, stats in results.items():
+            line = (f"{name:<12} {stats['mean']:>8.2f} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['p99']:>8.2f} "
+                    f"{stats['queries_mean']:>8.1f} {stats['queries_max']:>6}")
+            before = (baseline or {}).get('results', {}).get(name)
+            if before:
+                line += f"   p95 {self.change(before['p95'], stats['p95'])}, queries {before['queries_mean']:.1f} -> {stats['queries_mean']:.1f}"
+            self.stdout.write(line)
+
+    @staticmethod
+    def change(before, after):
+        return f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+
+    @staticmethod
+    def regressions(results, baseline, threshold):
+        found = []
+        for name, stats in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if before['p95'] and (stats['p95'] - before['p95']) / before['p95'] * 100 > threshold:
+                found.append(f"{name} p95 {before['p95']:.2f} -> {stats['p95']:.2f} ms")
+            if stats['queries_max'] > before['queries_max']:
+                found.append(f"{name} queries per request {before['queries_max']} -> {stats['queries_max']}")
+        return found
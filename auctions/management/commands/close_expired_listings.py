@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.closing import close_expired
+
+
+class Command(BaseCommand):
+    help = "Close open listings whose end time has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Listings closed per UPDATE.")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping instead of exiting after one pass.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            closed = close_expired(batch_size=batch_size)
+            if closed or not loop:
+                self.stdout.write(self.style.SUCCESS(f"Closed {closed} expired listings."))
+            if not loop:
+                break
+            time.sleep(interval)
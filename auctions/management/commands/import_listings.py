@@ -0,0 +1,149 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from auctions.forms import NewListingForm
+from auctions.genres import genre_registry
+from auctions.models import User, Listing
+from auctions.pagecache import purge
+
+MAX_REPORTED_ERRORS = 20
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield error
+
+
+class ListingRowValidator:
+    """NewListingForm's rules for plain dicts: each form field's clean() followed by the model
+    field's validators, as ModelForm validation runs them, without building a form per row."""
+
+    FIELDS = ['title', 'description', 'starting_bid', 'genres']
+
+    def __init__(self):
+        form_fields = NewListingForm().fields
+        self.fields = [(name, form_fields[name], Listing._meta.get_field(name)) for name in self.FIELDS]
+
+    def clean(self, data):
+        cleaned, errors = {}, {}
+        for name, form_field, model_field in self.fields:
+            try:
+                cleaned[name] = form_field.clean(data.get(name))
+                if not model_field.many_to_many:
+                    model_field.run_validators(cleaned[name])
+            except ValidationError as error:
+                errors[name] = error.messages
+        return cleaned, errors
+
+
+def genre_tokens(value):
+    if isinstance(value, str):
+        value = value.replace(';', '|').split('|')
+    return [str(token).strip() for token in value or [] if str(token).strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import listings from a CSV or JSON Lines file with title, description, starting_bid, "
+        "genres (slugs or names, '|'-separated in CSV) and an optional owner username per row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON Lines file, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to csv for *.csv files, jsonl otherwise.")
+        parser.add_argument('--owner', help="Username that owns rows which do not name one.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Listings written per transaction.")
+
+    def handle(self, *args, path, format, owner, batch_size, **options):
+        fmt = format or ('csv' if path.endswith('.csv') else 'jsonl')
+        self.owners = {}
+        self.validator = ListingRowValidator()
+        self.default_owner = self.resolve_owner(owner) if owner else None
+        if owner and self.default_owner is None:
+            raise CommandError(f'No user named "{owner}".')
+
+        imported = skipped = 0
+        start = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            batch = []
+            for row_number, row in enumerate(read_rows(stream, fmt), 1):
+                listing, genre_ids, errors = self.build_listing(row)
+                if errors:
+                    skipped += 1
+                    if skipped <= MAX_REPORTED_ERRORS:
+                        self.stderr.write(f"row {row_number}: {errors}")
+                    continue
+                batch.append((listing, genre_ids))
+                if len(batch) >= batch_size:
+                    imported += self.write_batch(batch)
+                    batch = []
+            imported += self.write_batch(batch)
+        finally:
+            if imported:
+                purge('grids')
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} listings, skipped {skipped}, in {elapsed:.2f}s ({rate:,.0f} rows/sec)."
+        ))
+
+    def resolve_owner(self, username):
+        if username not in self.owners:
+            self.owners[username] = User.objects.filter(username=username).first()
+        return self.owners[username]
+
+    def build_listing(self, row):
+        """Validate one input row with the NewListingForm rules; returns (listing, genre ids, errors)."""
+        if not isinstance(row, dict):
+            return None, None, f"unreadable row ({row})"
+
+        owner = self.resolve_owner(row['owner']) if row.get('owner') else self.default_owner
+        if owner is None:
+            return None, None, f"unknown owner {row.get('owner')!r}" if row.get('owner') else "no owner (use --owner)"
+
+        genres = [genre_registry.by_slug(slugify(token)) for token in genre_tokens(row.get('genres'))]
+        if None in genres:
+            return None, None, f"unknown genre in {row.get('genres')!r}"
+
+        cleaned, errors = self.validator.clean({
+            'title': row.get('title'),
+            'description': row.get('description'),
+            'starting_bid': row.get('starting_bid'),
+            'genres': [genre.id for genre in genres],
+        })
+        if errors:
+            return None, None, '; '.join(f"{field}: {' '.join(messages)}" for field, messages in errors.items())
+
+        genre_ids = cleaned.pop('genres')
+        return Listing(owner=owner, **cleaned), genre_ids, None
+
+    def write_batch(self, batch):
+        if not batch:
+            return 0
+        through = Listing.genres.through
+        with transaction.atomic():
+            listings = Listing.objects.bulk_create([listing for listing, _ in batch])
+            through.objects.bulk_create(
+                through(listing_id=listing.listing_id, genre_id=genre_id)
+                for listing, (_, genre_ids) in zip(listings, batch)
+                for genre_id in genre_ids
+            )
+        return len(listings)
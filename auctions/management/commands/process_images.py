@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from auctions.images import enqueue_image_job, pending_jobs, process_job
+from auctions.models import Listing, ImageJob
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and WebP variants for queued listing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help="Queue listings that have an image but no variants yet.")
+        parser.add_argument('--recover', action='store_true', help="Requeue jobs left running by a worker that died.")
+        parser.add_argument('--retry-failed', action='store_true', help="Requeue jobs that ran out of attempts.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, backfill, recover, retry_failed, loop, interval, **options):
+        if backfill:
+            queued = (Listing.objects.exclude(Q(image='') | Q(image__isnull=True))
+                      .filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+                      .exclude(image_jobs__status__in=[ImageJob.PENDING, ImageJob.RUNNING]))
+            for listing in queued.only('pk'):
+                enqueue_image_job(listing)
+        if recover:
+            ImageJob.objects.filter(status=ImageJob.RUNNING).update(status=ImageJob.PENDING)
+        if retry_failed:
+            ImageJob.objects.filter(status=ImageJob.FAILED).update(status=ImageJob.PENDING, attempts=0)
+
+        done = failed = 0
+        while True:
+            job_ids = list(pending_jobs().values_list('pk', flat=True)[:100])
+            for job_id in job_ids:
+                if process_job(job_id):
+                    done += 1
+                else:
+                    failed += 1
+            if not job_ids:
+                if not loop:
+                    break
+                time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} image jobs, {failed} failed attempts."))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from auctions.models import Listing, Bid
+from auctions.pagecache import purge
+
+SUMMARY_FIELDS = ['highest_bid', 'current_price', 'highest_bidder', 'bid_count']
+
+
+class Command(BaseCommand):
+    help = "Backfill and reconcile the listing bid summary (current price, highest bidder, bid count) from the Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Listings checked per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted listings without fixing them.")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        top_bid = Bid.objects.filter(listing=OuterRef('pk')).order_by('-bid', '-pk')
+        bid_count = Bid.objects.filter(listing=OuterRef('pk')).values('listing').annotate(count=Count('pk')).values('count')
+        listings = Listing.objects.annotate(
+            true_highest_bid=Subquery(top_bid.values('pk')[:1]),
+            true_price=Subquery(top_bid.values('bid')[:1]),
+            true_bidder=Subquery(top_bid.values('bidder')[:1]),
+            true_count=Coalesce(Subquery(bid_count), 0),
+        ).only('listing_id', *SUMMARY_FIELDS).order_by('listing_id')
+
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(listings.filter(listing_id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].listing_id
+                checked += len(batch)
+
+                stale = []
+                for listing in batch:
+                    true_values = (listing.true_highest_bid, listing.true_price, listing.true_bidder, listing.true_count)
+                    if (listing.highest_bid_id, listing.current_price, listing.highest_bidder_id, listing.bid_count) != true_values:
+                        (listing.highest_bid_id, listing.current_price, listing.highest_bidder_id, listing.bid_count) = true_values
+                        stale.append(listing)
+                drifted += len(stale)
+                if stale and not dry_run:
+                    Listing.objects.bulk_update(stale, SUMMARY_FIELDS)
+                    # retire the cards and pages rendered from the drifted summary
+                    stale_ids = [listing.listing_id for listing in stale]
+                    Listing.objects.filter(pk__in=stale_ids).touch()
+                    purge('grids', *(f'listing:{listing_id}' for listing_id in stale_ids))
+
+        action = "would fix" if dry_run else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} listings, {action} {drifted}."))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from auctions.replicas import copy_sqlite
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database onto the replica file (SQLITE_REPLICA_PATH), standing in "
+            "for replication when running with DATABASE_REPLICA=1 locally.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep copying instead of exiting after one copy.")
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help="Seconds between copies with --loop, i.e. the replication lag to expect.")
+
+    def handle(self, *args, loop, interval, **options):
+        primary, replica = connections['default'], connections[settings.REPLICA_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("Only SQLite databases are copied; a PostgreSQL replica follows its primary by streaming replication.")
+        while True:
+            copy_sqlite(primary.settings_dict['NAME'], replica.settings_dict['NAME'])
+            if not loop:
+                self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}."))
+                break
+            time.sleep(interval)
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_bid_summary(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    top_bid = Bid.objects.filter(listing=OuterRef('pk')).order_by('-bid', '-pk')
+    bid_count = Bid.objects.filter(listing=OuterRef('pk')).values('listing').annotate(count=Count('pk')).values('count')
+    Listing.objects.update(
+        highest_bid=Subquery(top_bid.values('pk')[:1]),
+        current_price=Subquery(top_bid.values('bid')[:1]),
+        highest_bidder=Subquery(top_bid.values('bidder')[:1]),
+        bid_count=Coalesce(Subquery(bid_count), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auctions', '0011_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='highest_bidder',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='highest_bidder', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_summary, migrations.RunPython.noop),
+    ]
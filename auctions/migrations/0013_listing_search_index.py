@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from auctions.search import FTS_SCHEMA, FTS_TEARDOWN, FTS_TRIGGERS, fts_enabled
+
+
+def create_search_index(apps, schema_editor):
+    if fts_enabled(schema_editor.connection):
+        for statement in FTS_SCHEMA + FTS_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in FTS_TEARDOWN:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_listing_bid_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
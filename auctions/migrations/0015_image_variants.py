@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_listing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='media/variants'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='media/variants'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='media/variants'),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='auctions.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created'], name='imagejob_status_created_idx')],
+            },
+        ),
+    ]
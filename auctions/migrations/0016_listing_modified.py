@@ -0,0 +1,24 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_modified(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.update(modified=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_modified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_listing_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Ends at (Optional)'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', True)), fields=['ends_at'], name='listing_open_ends_at_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    User = apps.get_model('auctions', 'User')
+    Listing = apps.get_model('auctions', 'Listing')
+    Watch = User.watchlist.through
+
+    def count(**link):
+        field, = link
+        counts = Watch.objects.filter(**link).values(field).annotate(count=Count('*')).values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    User.objects.update(watchlist_count=count(user=OuterRef('pk')))
+    Listing.objects.update(watcher_count=count(listing=OuterRef('pk')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='watchlist_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='watcher_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0018_watchlist_counts'),
+    ]
+
+    operations = [
+        # existing comments get the migration time; ordering by id keeps them in posting order
+        migrations.AddField(
+            model_name='comment',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', '-created', '-id'], name='comment_listing_created_idx'),
+        ),
+    ]
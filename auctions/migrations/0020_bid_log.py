@@ -0,0 +1,56 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def bucket_existing_bids(apps, schema_editor):
+    # existing bids all carry the migration time, so each listing gets one bucket
+    Bid = apps.get_model('auctions', 'Bid')
+    BidBucket = apps.get_model('auctions', 'BidBucket')
+    now = django.utils.timezone.now().timestamp()
+    start = datetime.fromtimestamp(now - now % settings.BID_BUCKET_SECONDS, dt_timezone.utc)
+    summary = Bid.objects.values('listing').annotate(bids=Count('pk'), low=Min('bid'), high=Max('bid')).order_by()
+    BidBucket.objects.bulk_create(
+        (BidBucket(listing_id=row['listing'], start=start, bids=row['bids'], low=row['low'], high=row['high'])
+         for row in summary.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0019_comment_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid'], name='bid_listing_amount_idx'),
+        ),
+        migrations.CreateModel(
+            name='BidBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('bids', models.PositiveIntegerField(default=0)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_buckets', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bidbucket',
+            constraint=models.UniqueConstraint(fields=('listing', 'start'), name='bidbucket_listing_start_uniq'),
+        ),
+        migrations.RunPython(bucket_existing_bids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0020_bid_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_book',
+            field=models.BooleanField(default=False, help_text='Accept bids in memory and write them to the database in batches.'),
+        ),
+        migrations.CreateModel(
+            name='BidBookCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log', models.CharField(max_length=255, unique=True)),
+                ('seq', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
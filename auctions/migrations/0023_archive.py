@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0022_bid_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('listing_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=64)),
+                ('description', models.CharField(max_length=255)),
+                ('starting_bid', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='media')),
+                ('thumbnail', models.ImageField(blank=True, null=True, upload_to='media/variants')),
+                ('thumbnail_webp', models.ImageField(blank=True, null=True, upload_to='media/variants')),
+                ('image_webp', models.ImageField(blank=True, null=True, upload_to='media/variants')),
+                ('genre_ids', models.JSONField(default=list)),
+                ('date', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('current_price', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+                ('highest_bidder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_wins', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-date', '-listing_id'], name='archivedlisting_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bid', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('created', models.DateTimeField()),
+                ('bidder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.archivedlisting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', '-bid'], name='archivedbid_listing_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment', models.CharField(blank=True, max_length=255, null=True)),
+                ('created', models.DateTimeField()),
+                ('commenter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='auctions.archivedlisting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', '-created'], name='archivedcomment_listing_idx')],
+            },
+        ),
+    ]
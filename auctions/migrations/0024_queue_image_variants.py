@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Q
+
+
+# Listings uploaded before image variants existed (0015) have an image but no thumbnail; queue a
+# job for each, as `manage.py process_images --backfill` would. The image workers (IMAGE_WORKERS)
+# drain the queue when the server starts; without them, run `manage.py process_images`.
+def queue_image_jobs(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    ImageJob = apps.get_model('auctions', 'ImageJob')
+    listings = (Listing.objects.exclude(Q(image='') | Q(image__isnull=True))
+                .filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+                .exclude(image_jobs__status__in=['pending', 'running']))
+    ImageJob.objects.bulk_create(
+        (ImageJob(listing_id=listing_id) for listing_id in listings.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_image_jobs, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Q
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.urls import reverse
@@ -8,6 +10,8 @@ from django.urls import reverse
 # user model
 class User(AbstractUser):
     watchlist = models.ManyToManyField('Listing', blank=True, null=True)
+    # maintained by auctions.watchlist, for the navigation badge
+    watchlist_count = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return f"{self.username}"
@@ -24,6 +28,32 @@ class Genre(models.Model):
         return reverse("model_detail", kwargs={"slug": self.slug})
     
 
+class ListingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status=True)
+
+    def inactive(self):
+        return self.filter(status=False)
+
+    # open listings still taking bids: not closed and not past their end time
+    def biddable(self, now=None):
+        return self.active().filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now or timezone.now()))
+
+    # open listings past their end time, waiting for auctions.closing to close them
+    def expired(self, now=None):
+        return self.active().filter(ends_at__lte=now or timezone.now())
+
+    # a listing card's row in one query: the price comes from the denormalized bid summary columns,
+    # and auctions.cards resolves genres for the cards it actually has to render
+    def for_cards(self):
+        return self.select_related('owner')
+
+    # mark listings as changed (optionally updating `fields` in the same statement), retiring
+    # anything cached against their previous version
+    def touch(self, **fields):
+        return self.update(version=F('version') + 1, modified=timezone.now(), **fields)
+
+
 class Listing(models.Model):
     listing_id = models.AutoField(primary_key=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, default=None, related_name="owner")
@@ -32,25 +62,203 @@ class Listing(models.Model):
     starting_bid = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Starting Bid", validators=[MinValueValidator(Decimal('0.01'))])
     highest_bid = models.ForeignKey('Bid', on_delete=models.CASCADE, default=None, blank=True, null=True, related_name="highest_bid")
     image = models.ImageField(upload_to='media', default=None, blank=True, null=True, verbose_name="Image (Optional)")
+    # generated from `image` off the request path by auctions.images
+    thumbnail = models.ImageField(upload_to='media/variants', blank=True, null=True, editable=False)
+    thumbnail_webp = models.ImageField(upload_to='media/variants', blank=True, null=True, editable=False)
+    image_webp = models.ImageField(upload_to='media/variants', blank=True, null=True, editable=False)
     date = models.DateTimeField(auto_now_add=True)
     genres = models.ManyToManyField(Genre, verbose_name="Genre(s)")
     status = models.BooleanField(default=True)
+    # when bidding stops; the listing is then closed by auctions.closing. Blank listings stay open
+    # until their owner closes them
+    ends_at = models.DateTimeField(blank=True, null=True, verbose_name="Ends at (Optional)")
+    # bid summary maintained by auctions.bidding, so pages never have to read the Bid table
+    current_price = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True, editable=False)
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+    highest_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name="highest_bidder")
+    # take bids through an in-memory bid book (auctions.bidbook), for listings expecting a rush
+    bid_book = models.BooleanField(default=False, help_text="Accept bids in memory and write them to the database in batches.")
+    # maintained by auctions.watchlist
+    watcher_count = models.PositiveIntegerField(default=0, editable=False)
+    # bumped on every change; cached renderings of the listing are keyed on it
+    version = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        # serve the newest-first grids and their (date, listing_id) keyset cursors
+        indexes = [
+            models.Index(fields=['status', '-date', '-listing_id'], name='listing_status_date_idx'),
+            models.Index(fields=['-date', '-listing_id'], name='listing_date_idx'),
+            # partial: the expiry sweep only ever looks at open listings, so closed ones are not in it
+            models.Index(fields=['ends_at'], condition=Q(status=True), name='listing_open_ends_at_idx'),
+        ]
         
+    def save(self, *args, **kwargs):
+        # bumped in the database, so a save racing a bid's touch() still moves past the version it wrote
+        adding = self._state.adding
+        self.version = self.version + 1 if adding else F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'modified'}
+        super().save(*args, **kwargs)
+        if not adding:
+            self.refresh_from_db(fields=['version'])
+
     def __str__(self):
         return f"Listing ID: {self.listing_id} listed {self.title}"
 
+# persistent queue of listings whose image variants still have to be generated
+class ImageJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="image_jobs")
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created'], name='imagejob_status_created_idx')]
+
+    def __str__(self):
+        return f"Image job for listing {self.listing_id} ({self.status})"
+
+# An append-only log: every bid placed is a new row, never updated (see auctions.bidding).
 class Bid(models.Model):
     bidder = models.ForeignKey(User, on_delete=models.CASCADE, default=None)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, default=None)
     bid = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="", validators=[MinValueValidator(Decimal('0.01'))], default=None)
-    
+    # a default rather than auto_now_add, so loaded history keeps its own times
+    created = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # a listing's bids highest first, which is also newest first since every bid beats the last
+        indexes = [
+            models.Index(fields=['listing', '-bid'], name='bid_listing_amount_idx'),
+            # the admin's newest-first changelist and its date filter
+            models.Index(fields=['created'], name='bid_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.bidder} bids ${self.bid}"
 
+
+class BidBucket(models.Model):
+    """A listing's bids over one BID_BUCKET_SECONDS interval: how many, and the price range. Kept by
+    auctions.bidding as bids are placed, so a price chart reads a bounded number of buckets
+    however long the listing's bid history is."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bid_buckets')
+    start = models.DateTimeField()
+    bids = models.PositiveIntegerField(default=0)
+    low = models.DecimalField(max_digits=5, decimal_places=2)
+    high = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        # also serves a listing's latest buckets, read backwards
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'start'], name='bidbucket_listing_start_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} from {self.start}: {self.bids} bids, ${self.low}-${self.high}"
+
+class BidBookCheckpoint(models.Model):
+    """The last record of a bid book log (auctions.bidbook) that is in the database. It is moved in
+    the transaction that writes the records, so replaying the log after a crash skips exactly those."""
+    log = models.CharField(max_length=255, unique=True)
+    seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.log} through record {self.seq}"
+
+# Closed listings moved out of the hot tables by auctions.archive, with their bids and comments.
+# They keep their listing ids, so links still resolve, and are read-only from then on.
+class ArchivedListingQuerySet(models.QuerySet):
+
+    def in_genre(self, genre_id):
+        # SQLite has no JSON containment lookup; json_each reads the array there
+        if connections[self.db].vendor == 'sqlite':
+            return self.extra(where=['EXISTS (SELECT 1 FROM json_each("auctions_archivedlisting"."genre_ids") WHERE value = %s)'],
+                              params=[genre_id])
+        return self.filter(genre_ids__contains=[genre_id])
+
+class ArchivedListing(models.Model):
+    listing_id = models.IntegerField(primary_key=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_listings")
+    title = models.CharField(max_length=64)
+    description = models.CharField(max_length=255)
+    starting_bid = models.DecimalField(max_digits=5, decimal_places=2)
+    image = models.ImageField(upload_to='media', blank=True, null=True)
+    thumbnail = models.ImageField(upload_to='media/variants', blank=True, null=True)
+    thumbnail_webp = models.ImageField(upload_to='media/variants', blank=True, null=True)
+    image_webp = models.ImageField(upload_to='media/variants', blank=True, null=True)
+    # names come from the genre registry
+    genre_ids = models.JSONField(default=list)
+    date = models.DateTimeField()
+    ends_at = models.DateTimeField(blank=True, null=True)
+    current_price = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    highest_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name="archived_wins")
+    # carried over, so cached cards of the listing stay valid
+    version = models.PositiveIntegerField(default=0)
+    archived = models.DateTimeField(default=timezone.now)
+
+    objects = ArchivedListingQuerySet.as_manager()
+
+    # read like a closed Listing by the cards and templates
+    status = False
+
+    class Meta:
+        # the inactive grid and its (date, listing_id) keyset cursors
+        indexes = [models.Index(fields=['-date', '-listing_id'], name='archivedlisting_date_idx')]
+
+    # its last change
+    @property
+    def modified(self):
+        return self.archived
+
+    def __str__(self):
+        return f"Archived listing ID: {self.listing_id} listed {self.title}"
+
+class ArchivedBid(models.Model):
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="bids")
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE)
+    bid = models.DecimalField(max_digits=5, decimal_places=2)
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['listing', '-bid'], name='archivedbid_listing_idx')]
+
+    def __str__(self):
+        return f"{self.bidder} bid ${self.bid}"
+
+class ArchivedComment(models.Model):
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="comments")
+    commenter = models.ForeignKey(User, on_delete=models.CASCADE)
+    comment = models.CharField(max_length=255, blank=True, null=True)
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['listing', '-created'], name='archivedcomment_listing_idx')]
+
+    def __str__(self):
+        return f"User: {self.commenter} commented {self.comment}"
+
 class Comment(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, default=None)
     commenter = models.ForeignKey(User, on_delete=models.CASCADE, default=None)
     comment = models.CharField(max_length=255, blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # serves a listing's newest-first comment pages and their (created, id) cursors
+        indexes = [
+            models.Index(fields=['listing', '-created', '-id'], name='comment_listing_created_idx'),
+        ]
     
     def __str__(self):
         return f"User: {self.commenter} comments {self.comment}"
\ No newline at end of file
@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+# Whole-page cache for anonymous visitors, whose view of a page is the same for everyone.
+#
+# Every cached page depends on a few scopes: 'site' (everything, e.g. genre names), 'grids' (the
+# listing grids) or 'listing:<id>' (one listing's page). Purging a scope stores the time of the
+# purge under its generation key, and a page built before the latest purge of any of its scopes is
+# stale. Pages stay in the cache a little past going stale: for PAGE_CACHE_STALE seconds one
+# request re-renders a stale page while concurrent ones are served the stale copy, so a burst of
+# traffic on a page that was just purged costs one render.
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def generation_key(scope):
+    return f'pagegen:{scope}'
+
+
+def bump(scopes):
+    now = time.time()
+    page_cache().set_many({generation_key(scope): now for scope in scopes}, None)
+
+
+def purge(*scopes):
+    """Mark every page depending on `scopes` stale, now and again once the current transaction
+    commits, so a render that raced the transaction cannot keep the old data."""
+    bump(scopes)
+    transaction.on_commit(functools.partial(bump, scopes))
+
+
+def purge_listing(listing_id, grids=True):
+    """Purge a listing's page, and the grids its card appears on unless the change does not show there."""
+    purge(f'listing:{listing_id}', *(['grids'] if grids else []))
+
+
+def cache_anonymous_page(*scopes):
+    """Serve anonymous GETs of the decorated view from the page cache. `scopes` are formatted with
+    the view's keyword arguments, e.g. 'listing:{listing_id}'; 'site' is always included. Async
+    views are decorated the same way."""
+    def decorator(view):
+        def begin(request, kwargs):
+            if not cacheable(request):
+                return None, None
+            page = CachedPage(request, ['site', *(scope.format(**kwargs) for scope in scopes)])
+            return page, page.lookup()
+
+        if asyncio.iscoroutinefunction(view):
+            # the user, session and cache lookups are all blocking, so they share one thread hop
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                page, response = await sync_to_async(begin)(request, kwargs)
+                if page is None:
+                    return await view(request, *args, **kwargs)
+                if response is not None:
+                    return response
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    await sync_to_async(page.unlock)()
+                    raise
+                return await sync_to_async(page.store)(request, response)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page, response = begin(request, kwargs)
+            if page is None:
+                return view(request, *args, **kwargs)
+            if response is not None:
+                return response
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                page.unlock()
+                raise
+            return page.store(request, response)
+        return wrapper
+    return decorator
+
+
+def cacheable(request):
+    # pending flash messages are rendered into the page, so those requests bypass the cache
+    return request.method == 'GET' and not request.user.is_authenticated and not len(get_messages(request))
+
+
+class CachedPage:
+    """One request's trip through the page cache: `lookup()` returns the cached response to serve,
+    or None to render the page and hand the response to `store()`."""
+
+    def __init__(self, request, scopes):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        self.key, self.lock_key = f'page:{path}', f'pagelock:{path}'
+        self.scopes = scopes
+        self.locked = False
+        self.built = None
+
+    def lookup(self):
+        cache = page_cache()
+        generation_keys = [generation_key(scope) for scope in self.scopes]
+        found = cache.get_many([self.key, *generation_keys])
+        now = time.time()
+        missing = [scope_key for scope_key in generation_keys if scope_key not in found]
+        if missing:
+            # a generation the cache lost may have hidden a purge, so treat it as purged now
+            cache.set_many({scope_key: now for scope_key in missing}, None)
+        purged = max(found.get(scope_key, now) for scope_key in generation_keys)
+
+        entry = found.get(self.key)
+        if entry is not None:
+            stale_since = entry['expires'] if purged <= entry['built'] else min(entry['expires'], purged)
+            if now < stale_since:
+                return cached_response(entry, 'hit')
+            if now - stale_since <= settings.PAGE_CACHE_STALE:
+                self.locked = cache.add(self.lock_key, True, settings.PAGE_CACHE_STALE)
+                if not self.locked:
+                    return cached_response(entry, 'stale')
+
+        # stamped before rendering, so a purge during the render leaves this copy stale
+        self.built = time.time()
+        return None
+
+    def store(self, request, response):
+        self.unlock()
+        if (response.status_code == 200 and not response.streaming and not response.cookies
+                and not get_messages(request).added_new):
+            page_cache().set(self.key, {
+                'built': self.built,
+                'expires': self.built + settings.PAGE_CACHE_TIMEOUT,
+                'content': response.content,
+                'content_type': response['Content-Type'],
+            }, settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def unlock(self):
+        if self.locked:
+            page_cache().delete(self.lock_key)
+
+
+def cached_response(entry, state):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['X-Page-Cache'] = state
+    return response
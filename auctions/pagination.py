@@ -0,0 +1,232 @@
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    """A page of listings fetched by seeking past a (date, listing_id) cursor instead of an OFFSET,
+    so the cost of a page does not grow with how deep into the catalogue it is."""
+
+    keyset = True
+
+    def __init__(self, object_list, cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_other_pages(self):
+        return self.cursor is not None or self.has_next()
+
+
+def encode_position(moment, pk):
+    raw = f"{moment.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(listing):
+    return encode_position(listing.date, listing.listing_id)
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, listing_id = raw.split('|')
+        return datetime.fromisoformat(date), int(listing_id)
+    except ValueError:
+        return None
+
+
+def keyset_query(queryset, cursor, per_page):
+    """The rows to fetch for a keyset page, and the cursor if it was valid."""
+    position = decode_cursor(cursor) if cursor else None
+    cursor = cursor if position is not None else None
+    if position is not None:
+        date, listing_id = position
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, listing_id__lt=listing_id))
+    # fetch one extra row to learn whether there is a next page without counting
+    return queryset[:per_page + 1], cursor
+
+
+def keyset_result(rows, cursor, per_page):
+    if len(rows) > per_page:
+        return KeysetPage(rows[:per_page], cursor, encode_cursor(rows[per_page - 1]))
+    return KeysetPage(rows, cursor)
+
+
+def keyset_page(queryset, cursor, per_page):
+    rows, cursor = keyset_query(queryset, cursor, per_page)
+    return keyset_result(list(rows), cursor, per_page)
+
+
+async def akeyset_page(queryset, cursor, per_page):
+    rows, cursor = keyset_query(queryset, cursor, per_page)
+    return keyset_result([row async for row in rows], cursor, per_page)
+
+
+LISTING_ORDER = ('-date', '-listing_id')
+
+
+class MergedListings:
+    """Querysets of listings that share none, read as one list newest first, e.g. the closed
+    listings and the archive. It offers what paginate_listings and the keyset pages use of a
+    queryset (order_by, filter, count and slicing); a slice is read from the head of every queryset
+    and merged, so a deep page costs its depth in every table, as an OFFSET page does in one."""
+
+    def __init__(self, *querysets):
+        self.querysets = [queryset.order_by(*LISTING_ORDER) for queryset in querysets]
+
+    def order_by(self, *fields):
+        if fields != LISTING_ORDER:
+            raise ValueError("Merged listings are only ordered newest first.")
+        return self
+
+    def filter(self, *args, **kwargs):
+        return MergedListings(*(queryset.filter(*args, **kwargs) for queryset in self.querysets))
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    async def acount(self):
+        count = 0
+        for queryset in self.querysets:
+            count += await queryset.acount()
+        return count
+
+    def __getitem__(self, index):
+        return MergedSlice(self.querysets, index)
+
+
+class MergedSlice:
+    """A slice of MergedListings, fetched on first iteration, sync or async."""
+
+    def __init__(self, querysets, index):
+        self.start, self.stop = index.start or 0, index.stop
+        self.heads = [queryset[:self.stop] for queryset in querysets]
+        self.rows = None
+
+    def merge(self, heads):
+        rows = heapq.merge(*heads, key=lambda listing: (listing.date, listing.listing_id), reverse=True)
+        self.rows = list(islice(rows, self.start, self.stop))
+
+    def fetch(self):
+        if self.rows is None:
+            self.merge([list(head) for head in self.heads])
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    async def __aiter__(self):
+        if self.rows is None:
+            heads = []
+            for head in self.heads:
+                heads.append([row async for row in head])
+            self.merge(heads)
+        for row in self.rows:
+            yield row
+
+    def __len__(self):
+        return len(self.fetch())
+
+
+# page-number pagination for ?page=N, keyset pagination for ?cursor=...
+def paginate_listings(request, queryset, per_page=None):
+    per_page = per_page or settings.LISTINGS_PER_PAGE
+    queryset = queryset.order_by(*LISTING_ORDER)
+
+    if 'cursor' in request.GET:
+        return keyset_page(queryset, request.GET['cursor'], per_page)
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
+
+
+async def apaginate_listings(request, queryset, per_page=None):
+    """paginate_listings for async views: the page comes back with its rows fetched, so templates
+    rendering it make no queries."""
+    per_page = per_page or settings.LISTINGS_PER_PAGE
+    queryset = queryset.order_by(*LISTING_ORDER)
+
+    if 'cursor' in request.GET:
+        return await akeyset_page(queryset, request.GET['cursor'], per_page)
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = [listing async for listing in page.object_list]
+    return page
+
+
+# rows of each index SQLite's ANALYZE samples (analyze_tables)
+ANALYSIS_LIMIT = 1000
+
+
+def estimate_rows(queryset):
+    """Rows in the queryset's table, from the statistics of the last ANALYZE (pg_class.reltuples on
+    PostgreSQL, sqlite_stat1 on SQLite; see analyze_tables); None when there are none."""
+    table, connection = queryset.model._meta.db_table, connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1 until the table is first analyzed
+            return int(row[0]) if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # the statistics table only exists once something has been analyzed
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # a row per index (or one for a table without any), each starting with the row count
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            counts = [int(stat.split()[0]) for (stat,) in cursor.fetchall() if stat]
+            return max(counts) if counts else None
+    return None
+
+
+def analyze_tables(*models, using='default'):
+    """Refresh the statistics estimate_rows reads, e.g. after a bulk delete. SQLite samples at most
+    ANALYSIS_LIMIT rows of each index instead of reading whole tables."""
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        for model in models:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+class ApproximateCountPaginator(Paginator):
+    """A paginator for admin changelists of large tables, which Paginator would COUNT(*) on every
+    page view. A whole table past ADMIN_EXACT_COUNT_LIMIT rows is estimated (estimate_rows); a
+    filtered one, or one without statistics, is counted exactly up to the limit and pages stop
+    there, so narrow the filter to reach further. The changelist says which (`estimated`,
+    `truncated`; see templates/admin/auctions/pagination.html)."""
+
+    estimated = truncated = False
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not self.object_list.query.where:
+            estimate = estimate_rows(self.object_list)
+            if estimate is not None and estimate >= limit:
+                self.estimated = True
+                return estimate
+        # one past the limit tells a table of exactly `limit` rows from a larger one
+        count = self.object_list.order_by()[:limit + 1].count()
+        self.truncated = count > limit
+        return min(count, limit)
@@ -0,0 +1,118 @@
+import functools
+import sqlite3
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .pagecache import cacheable
+
+# Read replica routing. With REPLICA_READS on, the read-only views decorated with
+# read_from_replica run their queries against the REPLICA_ALIAS database; every write, and every
+# read elsewhere, goes to the primary ('default'). Two kinds of request stay on the primary even in
+# those views:
+#   - a client that wrote in the last REPLICA_STICKY_SECONDS, marked by a cookie that
+#     PrimaryStickinessMiddleware sets on its writes, so it reads its own changes however far the
+#     replica lags;
+#   - anonymous GETs that the page cache will store, rendered once per purge and then served to
+#     everyone, so a purge never re-caches what a lagging replica still has.
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# rows the request machinery needs to be current: sign-ins and their sessions
+PRIMARY_ONLY = {'sessions.session', 'auctions.user'}
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.label_lower not in PRIMARY_ONLY:
+            return settings.REPLICA_ALIAS
+        return 'default'
+
+    # named outright: Django would otherwise write a row back to the database it was read from
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # the replica gets its schema from the primary
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.REPLICA_ALIAS
+
+
+def pinned_to_primary(request):
+    return settings.REPLICA_STICKY_COOKIE in request.COOKIES
+
+
+def replica_allowed(request):
+    return request.method in ('GET', 'HEAD') and not pinned_to_primary(request) and not cacheable(request)
+
+
+def read_from_replica(view):
+    """Run the view's queries on the read replica when the request allows it (see above). Applied
+    inside cache_anonymous_page; async views are decorated the same way."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # the request's user is only loaded off the event loop
+            if not settings.REPLICA_READS or not await sync_to_async(replica_allowed)(request):
+                return await view(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.REPLICA_READS or not replica_allowed(request):
+                return view(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return wrapper
+
+
+class PrimaryStickinessMiddleware:
+    """Pin a client to the primary for REPLICA_STICKY_SECONDS after each write it makes (a bid, a
+    comment, a watchlist change, a sign-in). Only installed while REPLICA_READS is on."""
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_READS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    @staticmethod
+    def pin(request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def copy_sqlite(source, target):
+    """Copy one SQLite database file onto another with SQLite's online backup, which readers of
+    the target can keep using while it runs; stands in for replication in local setups."""
+    primary, replica = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        primary.backup(replica)
+    finally:
+        primary.close()
+        replica.close()
@@ -0,0 +1,184 @@
+import functools
+import re
+import sqlite3
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+
+from .genres import genre_registry
+from .models import Listing
+
+FTS_TABLE = 'auctions_listing_fts'
+LISTING_TABLE = Listing._meta.db_table
+GENRES_TABLE = Listing.genres.through._meta.db_table
+
+# An external-content FTS5 index over Listing.title/description: it stores only the index and
+# reads text back from auctions_listing, and the triggers keep it in step with every write.
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, content='{LISTING_TABLE}', content_rowid='listing_id', tokenize='porter unicode61'
+    )""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+FTS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {LISTING_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.listing_id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {LISTING_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.listing_id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON {LISTING_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.listing_id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.listing_id, new.title, new.description);
+    END""",
+]
+
+FTS_TEARDOWN = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# title matches weigh ten times description matches in the BM25 rank
+RANK = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+
+
+@functools.lru_cache(maxsize=None)
+def sqlite_has_fts5():
+    probe = sqlite3.connect(':memory:')
+    try:
+        probe.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+
+def fts_enabled(using=connection):
+    return using.vendor == 'sqlite' and sqlite_has_fts5()
+
+
+def install_search_triggers(using=connection):
+    """(Re)create the sync triggers. SQLite migrations that alter auctions_listing rebuild the table
+    and drop its triggers with it, so this runs after every migrate (see AuctionsConfig.ready)."""
+    if not fts_enabled(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return
+        for statement in FTS_TRIGGERS:
+            cursor.execute(statement)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def match_expression(terms):
+    # quote every term so user input is never parsed as FTS5 syntax, and prefix-match each one
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def fts_listing_ids(terms, genre_id=None, offset=0, limit=None):
+    sql = f"SELECT f.rowid FROM {FTS_TABLE} f"
+    params = []
+    if genre_id is not None:
+        sql += f" JOIN {GENRES_TABLE} g ON g.listing_id = f.rowid AND g.genre_id = %s"
+        params.append(genre_id)
+    sql += f" WHERE {FTS_TABLE} MATCH %s ORDER BY {RANK}, f.rowid DESC LIMIT %s OFFSET %s"
+    params += [match_expression(terms), -1 if limit is None else limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fts_genre_counts(terms):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT g.genre_id, COUNT(*) FROM {FTS_TABLE} f JOIN {GENRES_TABLE} g ON g.listing_id = f.rowid"
+            f" WHERE {FTS_TABLE} MATCH %s GROUP BY g.genre_id",
+            [match_expression(terms)],
+        )
+        return dict(cursor.fetchall())
+
+
+# fallback for databases without FTS5: every term must appear in the title or description
+def icontains_listings(terms):
+    listings = Listing.objects.all()
+    for term in terms:
+        listings = listings.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    return listings
+
+
+def icontains_listing_ids(terms, genre_id=None, offset=0, limit=None):
+    listings = icontains_listings(terms)
+    if genre_id is not None:
+        listings = listings.filter(genres=genre_id)
+    ids = listings.order_by('-date', '-listing_id').values_list('listing_id', flat=True)
+    return list(ids[offset:] if limit is None else ids[offset:offset + limit])
+
+
+def icontains_genre_counts(terms):
+    through = Listing.genres.through.objects.filter(listing__in=icontains_listings(terms))
+    return {row['genre_id']: row['count'] for row in through.values('genre_id').annotate(count=Count('pk'))}
+
+
+class SearchPage:
+    """One page of ranked keyword results, shaped like a Django Page but without the COUNT(*)."""
+
+    def __init__(self, object_list, number, has_next, facets):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self.facets = facets
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def search_listings(query, genre=None, page_number=1, per_page=None):
+    """Keyword search over listing titles and descriptions, best match first, optionally narrowed to
+    one genre. The page carries genre facet counts for the whole (un-narrowed) result set."""
+    per_page = per_page or settings.LISTINGS_PER_PAGE
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+
+    terms = search_terms(query)
+    if not terms:
+        return SearchPage([], 1, False, [])
+
+    if fts_enabled():
+        listing_ids, genre_counts = fts_listing_ids, fts_genre_counts
+    else:
+        listing_ids, genre_counts = icontains_listing_ids, icontains_genre_counts
+
+    ids = listing_ids(terms, genre.id if genre else None, (page_number - 1) * per_page, per_page + 1)
+    cards = Listing.objects.for_cards().in_bulk(ids[:per_page])
+    facets = [(genre_registry.by_id(genre_id), count) for genre_id, count in genre_counts(terms).items()]
+    facets = sorted((facet for facet in facets if facet[0] is not None), key=lambda facet: -facet[1])
+    return SearchPage([cards[pk] for pk in ids[:per_page] if pk in cards], page_number, len(ids) > per_page, facets)
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .auth import forget_user
+from .genres import genre_registry
+from .models import Genre, User
+from .pagecache import purge
+from .search import install_search_triggers
+from .watchlist import Watch, recount_watchlists
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS:
+        with connection.cursor() as cursor:
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def reinstall_search_triggers(sender, using, **kwargs):
+    install_search_triggers(connections[using])
+
+
+# drop the snapshot now and again once the change commits, so a reload that raced the
+# transaction cannot keep the old rows
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_registry(sender, using, **kwargs):
+    genre_registry.invalidate()
+    transaction.on_commit(genre_registry.invalidate, using=using)
+    purge('site')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    forget_user(instance.pk, using=using)
+
+
+# watch() and unwatch() write the link table directly; anything going through the relation (the
+# admin's user form, user.watchlist.add(), listing.user_set.remove(), ...) has its counters recounted
+@receiver(m2m_changed, sender=Watch)
+def recount_changed_watchlists(sender, instance, action, reverse, pk_set, **kwargs):
+    owner, other = ('listing', 'user') if reverse else ('user', 'listing')
+    if action == 'pre_clear':
+        # the links are gone by post_clear, which names none of them
+        instance._cleared_watch_ids = set(sender.objects.filter(**{owner: instance.pk}).values_list(f'{other}_id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_watch_ids', None)
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    if reverse:
+        recount_watchlists(user_ids=pk_set, listing_ids=[instance.pk])
+    else:
+        recount_watchlists(user_ids=[instance.pk], listing_ids=pk_set)
+        instance.refresh_from_db(fields=['watchlist_count'])
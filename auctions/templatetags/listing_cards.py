@@ -0,0 +1,19 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from auctions.cards import render_cards
+from auctions.watchlist import watched_ids
+
+register = template.Library()
+
+
+# pages that only show watched listings set `all_watched` and save the membership query
+@register.simple_tag(takes_context=True)
+def listing_cards(context, listings):
+    # async views render the cards ahead of the template (see auctions.async_views)
+    if 'cards' in context:
+        return mark_safe(''.join(context['cards']))
+    listings = list(listings)
+    ids = [listing.listing_id for listing in listings]
+    watched = set(ids) if context.get('all_watched') else watched_ids(context['request'].user, ids)
+    return mark_safe(''.join(render_cards(listings, watched)))
@@ -0,0 +1,22 @@
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class AuctionsTestRunner(DiscoverRunner):
+    """Runs the tests against a scratch bid log, so a test that closes or archives listings never
+    replays, or sets aside, the records of the real BID_BOOK_WAL."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.workdir = tempfile.mkdtemp()
+        self.bid_log = override_settings(BID_BOOK_WAL=os.path.join(self.workdir, 'bids.wal'))
+        self.bid_log.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.bid_log.disable()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1819 @@
-from django.test import TestCase
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import User, Listing, Genre, Bid, BidBookCheckpoint, BidBucket, Comment, ImageJob, ArchivedListing, ArchivedBid, ArchivedComment
+from .auth import TunablePBKDF2PasswordHasher, user_cache
+from .checks import check_auth_caches
+from .pagination import analyze_tables, encode_cursor, estimate_rows
+from .pagecache import page_cache
+from .bidbook import LoggedBid, bid_books, encode, read_records, submit_bid
+from .bidding import place_bid, bucket_start, price_chart, rebuild_bid_buckets, BidError
+from .search import search_listings, fts_enabled
+from .cards import WATCHED_BADGE, card_cache, card_stats, reset_card_stats
+from .genres import STAMP_KEY, GenreRegistry, genre_registry
+from .forms import NewListingForm
+from .images import drain, enqueue_image_job, process_job, start_image_workers, MAX_ATTEMPTS
+from .events import InProcessBroker, get_broker
+from .closing import close_expired
+from .archive import archive_closed
+from .replicas import ReplicaRouter, copy_sqlite
+from .watchlist import is_watching, watch, unwatch, watched_ids
+from .comments import comment_page
+from .instrumentation import request_stats
+from .benchmarks import seed_activity, seed_catalogue
+from .urls import read_patterns, urlpatterns as auction_urlpatterns
+from . import async_views
+from .management.commands.bench_suite import Command as BenchSuiteCommand
+
+# cached sessions and users, as with a SHARED_CACHE_URL; within the one test process the local
+# 'sessions' and 'users' caches are as good as shared
+CACHED_AUTH = {'SESSION_ENGINE': settings.SESSION_ENGINES['cached_db'],
+               'AUTHENTICATION_BACKENDS': ['auctions.auth.CachedModelBackend']}
+
+
+class ListingGridQueryCountTests(TestCase):
+    """Pin the number of queries each listing grid costs, independent of how many cards it shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        cls.genres = [Genre.objects.create(name=f'Genre {i}', slug=f'genre-{i}') for i in range(3)]
+
+    def setUp(self):
+        page_cache().clear()
+        card_cache().clear()
+        # steady state: the genre registry is already loaded
+        genre_registry.all()
+
+    def create_listings(self, count, status=True):
+        for i in range(count):
+            listing = Listing.objects.create(owner=self.owner, title=f'Game {i}', description='A game',
+                                             starting_bid=Decimal('1.00'))
+            listing.genres.set(self.genres)
+            place_bid(listing.pk, self.bidder, '2.00')
+            Listing.objects.filter(pk=listing.pk).update(status=status)
+            self.bidder.watchlist.add(listing)
+
+    def assertConstantQueries(self, num, url, login=False):
+        if login:
+            self.client.force_login(self.bidder)
+        for count in (1, 5):
+            self.create_listings(count, status=url != reverse('inactive'))
+            if login:
+                # steady state: with CACHED_AUTH the session and the user (whose watchlist count the
+                # new listings just changed) are cached from an earlier request
+                self.client.get(reverse('search'))
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_index(self):
+        # count, listings, genre links of the cards not yet cached
+        self.assertConstantQueries(3, reverse('index'))
+
+    def test_index_keyset(self):
+        self.assertConstantQueries(2, reverse('index') + '?cursor=')
+
+    def test_inactive(self):
+        # count and listings of the closed listings and of the archive, genre links of the closed
+        self.assertConstantQueries(5, reverse('inactive'))
+
+    def test_search_by_genre(self):
+        # count and listings of the live listings and of the archive, genre links
+        self.assertConstantQueries(5, reverse('search', args=['genre-0']))
+
+
+    def test_index_logged_in(self):
+        # session, user, the anonymous queries and one for the cards' watchlist badges
+        self.assertConstantQueries(6, reverse('index'), login=True)
+
+    @override_settings(**CACHED_AUTH)
+    def test_index_logged_in_with_cached_auth(self):
+        # session and user come from their caches
+        self.assertConstantQueries(4, reverse('index'), login=True)
+
+    def test_watchlist(self):
+        # session, user, count, listings, genre links; every card is watched, so no badge query
+        self.assertConstantQueries(5, reverse('watchlist'), login=True)
+
+    def test_card_shows_highest_bid_and_genres(self):
+        self.create_listings(1)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '$2.00')
+        self.assertContains(response, 'Genre 2')
+
+
+@override_settings(LISTINGS_PER_PAGE=2)
+class ListingPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.listings = [
+            Listing.objects.create(owner=owner, title=f'Game {i}', description='A game', starting_bid=Decimal('1.00'))
+            for i in range(5)
+        ]
+        # newest first
+        cls.listings.reverse()
+
+    def setUp(self):
+        page_cache().clear()
+
+    def titles(self, response):
+        return [listing.title for listing in response.context['listings']]
+
+    def test_page_numbers(self):
+        response = self.client.get(reverse('index'), {'page': 2})
+        self.assertEqual(self.titles(response), ['Game 2', 'Game 1'])
+        self.assertContains(response, '?page=3')
+
+    def test_out_of_range_page_falls_back_to_last(self):
+        response = self.client.get(reverse('index'), {'page': 99})
+        self.assertEqual(self.titles(response), ['Game 0'])
+
+    def test_keyset_walks_every_listing_once(self):
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(reverse('index'), {'cursor': cursor})
+            seen += self.titles(response)
+            cursor = response.context['page'].next_cursor
+        self.assertEqual(seen, [listing.title for listing in self.listings])
+
+    def test_keyset_breaks_date_ties_on_listing_id(self):
+        Listing.objects.update(date=self.listings[0].date)
+        cursor = encode_cursor(Listing.objects.get(pk=self.listings[1].pk))
+        response = self.client.get(reverse('index'), {'cursor': cursor})
+        self.assertEqual(self.titles(response), ['Game 2', 'Game 1'])
+
+    def test_invalid_cursor_starts_from_the_top(self):
+        response = self.client.get(reverse('index'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(self.titles(response), ['Game 4', 'Game 3'])
+
+
+class PlaceBidTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def setUp(self):
+        self.listing = Listing.objects.create(owner=self.owner, title='Game', description='A game',
+                                              starting_bid=Decimal('5.00'))
+
+    def highest(self):
+        self.listing.refresh_from_db()
+        return self.listing.highest_bid
+
+    def test_first_bid_must_meet_starting_bid(self):
+        with self.assertRaises(BidError):
+            place_bid(self.listing.pk, self.alice, '4.99')
+        self.assertEqual(place_bid(self.listing.pk, self.alice, '5.00'), (Decimal('5.00'), True))
+        self.assertEqual(self.highest().bidder, self.alice)
+
+    def test_later_bids_must_beat_highest(self):
+        place_bid(self.listing.pk, self.alice, '6.00')
+        with self.assertRaises(BidError):
+            place_bid(self.listing.pk, self.bob, '6.00')
+        place_bid(self.listing.pk, self.bob, '6.01')
+        self.assertEqual((self.highest().bidder, self.highest().bid), (self.bob, Decimal('6.01')))
+
+    def test_rebid_appends_to_the_log(self):
+        place_bid(self.listing.pk, self.alice, '6.00')
+        place_bid(self.listing.pk, self.bob, '7.00')
+        self.assertEqual(place_bid(self.listing.pk, self.alice, '8.00'), (Decimal('8.00'), False))
+        self.assertEqual(list(Bid.objects.filter(listing=self.listing).order_by('-bid').values_list('bidder__username', 'bid')),
+                         [('alice', Decimal('8.00')), ('bob', Decimal('7.00')), ('alice', Decimal('6.00'))])
+        self.assertEqual((self.highest().bidder, self.highest().bid), (self.alice, Decimal('8.00')))
+
+    def test_decimal_amounts(self):
+        place_bid(self.listing.pk, self.alice, '5.105')
+        self.assertEqual(self.highest().bid, Decimal('5.11'))
+        for bad in ('abc', '', 'nan', '-1', '0', '1000.00'):
+            with self.assertRaises(BidError):
+                place_bid(self.listing.pk, self.bob, bad)
+
+    def test_closed_listing_rejects_bids(self):
+        self.listing.status = False
+        self.listing.save()
+        with self.assertRaisesMessage(BidError, 'closed'):
+            place_bid(self.listing.pk, self.alice, '10.00')
+
+    def test_bounded_queries(self):
+        # including the savepoint pair that TestCase's wrapping transaction turns atomic() into
+        with self.assertNumQueries(8):
+            place_bid(self.listing.pk, self.alice, '6.00')
+        with self.assertNumQueries(7):
+            place_bid(self.listing.pk, self.alice, '7.00')
+
+    def test_bid_summary_columns(self):
+        place_bid(self.listing.pk, self.alice, '6.00')
+        place_bid(self.listing.pk, self.bob, '7.00')
+        place_bid(self.listing.pk, self.alice, '8.00')
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal('8.00'))
+        self.assertEqual(self.listing.highest_bidder, self.alice)
+        self.assertEqual(self.listing.bid_count, 3)
+
+    def test_bids_are_bucketed(self):
+        for amount in ('6.00', '7.00', '8.00'):
+            place_bid(self.listing.pk, self.alice, amount)
+        bucket, = BidBucket.objects.filter(listing=self.listing)
+        self.assertEqual((bucket.bids, bucket.low, bucket.high), (3, Decimal('6.00'), Decimal('8.00')))
+        self.assertEqual(bucket.start.timestamp() % settings.BID_BUCKET_SECONDS, 0)
+
+    def test_rebuild_bid_buckets(self):
+        start = bucket_start(timezone.now()) - timedelta(seconds=settings.BID_BUCKET_SECONDS * 3)
+        for minutes, amount in ((1, '6.00'), (2, '9.00'), (61, '7.50'), (190, '8.00')):
+            Bid.objects.create(listing=self.listing, bidder=self.bob, bid=Decimal(amount),
+                               created=start + timedelta(minutes=minutes))
+        rebuild_bid_buckets()
+        buckets = BidBucket.objects.filter(listing=self.listing).order_by('start')
+        self.assertEqual([(bucket.bids, bucket.low, bucket.high) for bucket in buckets],
+                         [(2, Decimal('6.00'), Decimal('9.00')), (1, Decimal('7.50'), Decimal('7.50')),
+                          (1, Decimal('8.00'), Decimal('8.00'))])
+
+    @override_settings(BID_CHART_BUCKETS=2)
+    def test_price_chart_reads_the_latest_buckets(self):
+        self.assertNotContains(self.client.get(reverse('listing', args=[self.listing.pk])), 'Price history')
+        start = bucket_start(timezone.now())
+        for n in range(5):
+            BidBucket.objects.create(listing=self.listing, start=start - timedelta(hours=n), bids=n + 1,
+                                     low=Decimal(10 - n), high=Decimal(11 - n))
+        Listing.objects.filter(pk=self.listing.pk).update(bid_count=15)
+        self.listing.refresh_from_db()
+        chart = price_chart(self.listing)
+        self.assertEqual((chart.bids, chart.low, chart.high), (3, Decimal(9), Decimal(11)))
+        self.assertEqual(chart.points, '0.0,20.0 100.0,0.0')
+        page_cache().clear()  # the buckets were written directly, without a purge
+        self.assertContains(self.client.get(reverse('listing', args=[self.listing.pk])), '3 bid(s), $9.00 to $11.00')
+
+    def test_reconcile_bids_command(self):
+        place_bid(self.listing.pk, self.alice, '6.00')
+        place_bid(self.listing.pk, self.bob, '7.00')
+        Listing.objects.filter(pk=self.listing.pk).update(current_price=None, highest_bidder=None, bid_count=0)
+        call_command('reconcile_bids', '--dry-run', stdout=StringIO())
+        self.listing.refresh_from_db()
+        self.assertIsNone(self.listing.current_price)
+        version = self.listing.version
+
+        out = StringIO()
+        call_command('reconcile_bids', stdout=out)
+        self.assertIn('fixed 1', out.getvalue())
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.current_price, self.listing.highest_bidder, self.listing.bid_count),
+                         (Decimal('7.00'), self.bob, 2))
+        # cached cards of the drifted summary are retired
+        self.assertGreater(self.listing.version, version)
+
+    def test_bid_view(self):
+        self.client.force_login(self.alice)
+        url = reverse('listing', args=[self.listing.pk])
+        response = self.client.post(url, {'bid_amount': 'Place Bid', 'bid': '9.50'}, follow=True)
+        self.assertContains(response, 'Successfully set bid to $9.50')
+        response = self.client.post(url, {'bid_amount': 'Place Bid', 'bid': '9.00'}, follow=True)
+        self.assertContains(response, 'is not higher than')
+        self.assertEqual(self.highest().bid, Decimal('9.50'))
+
+
+class BidBookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def setUp(self):
+        page_cache().clear()
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.wal = os.path.join(workdir, 'bids.wal')
+        books_settings = override_settings(BID_BOOK_WAL=self.wal, BID_BOOK_FSYNC=False, BID_BOOK_FLUSH_INTERVAL=None)
+        books_settings.enable()
+        self.addCleanup(books_settings.disable)
+        self.addCleanup(bid_books.stop, flush=False)
+        self.listing = Listing.objects.create(owner=self.owner, title='Game', description='A game',
+                                              starting_bid=Decimal('5.00'), bid_book=True)
+
+    def test_bids_are_decided_in_memory_and_written_in_one_batch(self):
+        self.assertEqual(submit_bid(self.listing, self.alice, '5.00'), (Decimal('5.00'), True))
+        with self.assertNumQueries(0):
+            self.assertEqual(submit_bid(self.listing, self.bob, '6.00'), (Decimal('6.00'), True))
+            self.assertEqual(submit_bid(self.listing, self.alice, '7.00'), (Decimal('7.00'), False))
+            with self.assertRaisesMessage(BidError, 'not higher'):
+                submit_bid(self.listing, self.bob, '7.00')
+        self.assertFalse(Bid.objects.exists())
+
+        self.assertEqual(bid_books.flush(), 3)
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.current_price, self.listing.bid_count, self.listing.highest_bidder),
+                         (Decimal('7.00'), 3, self.alice))
+        self.assertEqual(self.listing.highest_bid.bid, Decimal('7.00'))
+        bucket = BidBucket.objects.get(listing=self.listing)
+        self.assertEqual((bucket.bids, bucket.low, bucket.high), (3, Decimal('5.00'), Decimal('7.00')))
+        self.assertEqual(os.path.getsize(self.wal), 0)
+
+    def test_listing_page_shows_bids_not_yet_written(self):
+        self.client.force_login(self.bob)
+        self.client.post(reverse('listing', args=[self.listing.pk]), {'bid_amount': 'Place Bid', 'bid': '8.50'})
+        self.assertFalse(Bid.objects.exists())
+        response = self.client.get(reverse('listing', args=[self.listing.pk]))
+        self.assertContains(response, '$8.50')
+        self.assertContains(response, 'Your bid is the current highest')
+
+    def test_log_is_replayed_after_a_crash(self):
+        submit_bid(self.listing, self.alice, '5.00')
+        bid_books.flush()
+        submit_bid(self.listing, self.bob, '6.00')
+        submit_bid(self.listing, self.alice, '7.00')
+        bid_books.stop(flush=False)
+        with open(self.wal, 'ab') as wal:
+            wal.write(b'{"seq": 4, "listing": ')  # torn by the crash
+        self.assertEqual(Bid.objects.count(), 1)
+
+        self.assertTrue(bid_books.available())
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.current_price, self.listing.bid_count), (Decimal('7.00'), 3))
+        self.assertEqual(list(Bid.objects.order_by('bid').values_list('bid', flat=True)),
+                         [Decimal('5.00'), Decimal('6.00'), Decimal('7.00')])
+        self.assertEqual(BidBookCheckpoint.objects.get(log=self.wal).seq, 3)
+        # replayed records are not written twice
+        bid_books.stop(flush=False)
+        bid_books.available()
+        self.assertEqual(Bid.objects.count(), 3)
+
+    @override_settings(BID_BOOK_RETRY_INTERVAL=0)
+    def test_process_without_the_log_refuses_bids(self):
+        with open(self.wal + '.lock', 'a') as held:
+            fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with self.assertLogs('auctions.bidbook', 'WARNING'):
+                self.assertFalse(bid_books.available())
+            with self.assertRaisesMessage(BidError, 'taken elsewhere'):
+                submit_bid(self.listing, self.alice, '5.00')
+        self.assertFalse(Bid.objects.exists())
+        # the log is taken over once its holder lets go
+        self.assertEqual(submit_bid(self.listing, self.alice, '5.00'), (Decimal('5.00'), True))
+
+    def test_bids_on_a_deleted_listing_are_kept_aside(self):
+        submit_bid(self.listing, self.alice, '6.00')
+        Listing.objects.filter(pk=self.listing.pk).delete()
+        with self.assertLogs('auctions.bidbook', 'ERROR') as logs:
+            self.assertEqual(bid_books.flush(), 1)
+        self.assertIn('no listing or bidder', logs.output[0])
+        self.assertEqual([(record.listing_id, record.amount) for record in read_records(self.wal + '.unwritten')],
+                         [(self.listing.pk, Decimal('6.00'))])
+        self.assertEqual(read_records(self.wal), [])
+
+    def held_by_another_process(self, *amounts):
+        """Hold the log as another process would, with `amounts` on the listing not yet written."""
+        held = open(self.wal + '.lock', 'a')
+        self.addCleanup(held.close)
+        fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        now = timezone.now()
+        with open(self.wal, 'wb') as wal:
+            wal.writelines(encode(LoggedBid(seq, self.listing.pk, self.alice.pk, Decimal(amount), now))
+                           for seq, amount in enumerate(amounts, 1))
+        return held
+
+    def test_sweep_waits_for_another_processs_books(self):
+        Listing.objects.filter(pk=self.listing.pk).update(ends_at=timezone.now() - timedelta(minutes=1))
+        held = self.held_by_another_process('6.00')
+        self.assertEqual(close_expired(), 0)
+        # written and dropped from the log by its holder
+        open(self.wal, 'wb').close()
+        self.assertEqual(close_expired(), 1)
+        held.close()
+
+    def test_sweep_writes_what_a_stopped_holder_left(self):
+        Listing.objects.filter(pk=self.listing.pk).update(ends_at=timezone.now() - timedelta(minutes=1))
+        self.held_by_another_process('6.00', '7.00').close()
+        self.assertEqual(close_expired(), 1)
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.status, self.listing.current_price, self.listing.highest_bidder),
+                         (False, Decimal('7.00'), self.alice))
+
+    def test_sweep_gives_the_last_bids_time_to_reach_the_log(self):
+        Listing.objects.filter(pk=self.listing.pk).update(ends_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(close_expired(), 0)
+        self.assertEqual(close_expired(now=timezone.now() + timedelta(seconds=settings.BID_BOOK_CLOSE_DELAY)), 1)
+
+    @override_settings(ARCHIVE_AFTER=0)
+    def test_closed_listing_is_not_archived_before_its_bids_are_written(self):
+        Listing.objects.filter(pk=self.listing.pk).touch(status=False)
+        held = self.held_by_another_process('6.00')
+        self.assertEqual(archive_closed(), 0)
+        held.close()
+        # the holder's leftovers are written first, which counts as a change
+        self.assertEqual(archive_closed(now=timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(ArchivedListing.objects.get().current_price, Decimal('6.00'))
+
+    def test_owner_cannot_close_while_another_process_holds_the_books(self):
+        held = self.held_by_another_process('6.00')
+        self.client.force_login(self.owner)
+        with self.assertLogs('auctions.bidbook', 'WARNING'):
+            response = self.client.post(reverse('listing', args=[self.listing.pk]), {'close_listing': 'Close'})
+        self.assertContains(response, 'Please try closing it again')
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.status)
+        held.close()
+
+    def test_records_not_above_the_written_price_are_refused(self):
+        submit_bid(self.listing, self.alice, '6.00')
+        bid_books.flush()
+        # a bid the book never saw, e.g. one taken while another process held the log
+        place_bid(self.listing.pk, self.bob, '20.00')
+        submit_bid(self.listing, self.alice, '7.00')
+        with self.assertLogs('auctions.bidbook', 'ERROR') as logs:
+            bid_books.flush()
+        self.assertIn('$7.00', logs.output[0])
+        self.assertEqual(list(Bid.objects.order_by('pk').values_list('bid', flat=True)), [Decimal('6.00'), Decimal('20.00')])
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.current_price, self.listing.highest_bidder), (Decimal('20.00'), self.bob))
+        self.assertEqual(BidBucket.objects.get(listing=self.listing).high, Decimal('20.00'))
+        # the book starts again from the database
+        with self.assertRaisesMessage(BidError, 'not higher'):
+            submit_bid(self.listing, self.alice, '8.00')
+
+    def test_closing_writes_the_book_first(self):
+        submit_bid(self.listing, self.alice, '5.00')
+        submit_bid(self.listing, self.bob, '6.00')
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('listing', args=[self.listing.pk]), {'close_listing': 'Close'})
+        self.assertContains(response, 'bob won the auction')
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.status, self.listing.highest_bidder, self.listing.bid_count), (False, self.bob, 2))
+        with self.assertRaisesMessage(BidError, 'closed'):
+            submit_bid(self.listing, self.alice, '9.00')
+
+class ConcurrentBidStressTests(TransactionTestCase):
+    """Hammer one listing from many threads; the final highest bid must be the true maximum."""
+
+    threads = 8
+    bids_per_thread = 250
+
+    def test_highest_bid_is_true_maximum(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        bidders = [User.objects.create_user(f'bidder{i}', f'bidder{i}@example.com', 'password') for i in range(20)]
+        listing = Listing.objects.create(owner=owner, title='Hot game', description='Everyone wants it',
+                                         starting_bid=Decimal('1.00'))
+        amounts = [Decimal(cents) / 100 for cents in random.sample(range(100, 99999), self.threads * self.bids_per_thread)]
+        errors = []
+
+        def bid(chunk):
+            try:
+                for amount in chunk:
+                    try:
+                        place_bid(listing.pk, random.choice(bidders), amount)
+                    except BidError:
+                        pass
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=bid, args=(amounts[i::self.threads],)) for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        listing.refresh_from_db()
+        self.assertEqual(listing.highest_bid.bid, max(amounts))
+        self.assertEqual(listing.current_price, max(amounts))
+        self.assertEqual(listing.highest_bidder, listing.highest_bid.bidder)
+        self.assertEqual(listing.bid_count, Bid.objects.filter(listing=listing).count())
+        self.assertEqual(max(Bid.objects.filter(listing=listing).values_list('bid', flat=True)), max(amounts))
+
+
+class ListingSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        cls.racing = Genre.objects.create(name='Racing', slug='racing')
+
+        def create(title, description, genre):
+            listing = Listing.objects.create(owner=owner, title=title, description=description, starting_bid=Decimal('1.00'))
+            listing.genres.add(genre)
+            return listing
+
+        cls.diamond = create('Pokemon Diamond', 'Boxed with manual', cls.rpg)
+        cls.pearl = create('Pokemon Pearl', 'Cartridge only', cls.rpg)
+        cls.kart = create('Mario Kart DS', 'Comes with a pokemon sticker', cls.racing)
+
+    def setUp(self):
+        page_cache().clear()
+
+    def titles(self, page):
+        return [listing.title for listing in page]
+
+    def test_title_matches_rank_first(self):
+        titles = self.titles(search_listings('pokemon'))
+        self.assertEqual(set(titles), {'Pokemon Diamond', 'Pokemon Pearl', 'Mario Kart DS'})
+        if fts_enabled():
+            self.assertEqual(titles[-1], 'Mario Kart DS')
+
+    def test_all_terms_must_match_with_prefixes(self):
+        self.assertEqual(self.titles(search_listings('poke diam')), ['Pokemon Diamond'])
+
+    def test_genre_filter_and_facets(self):
+        page = search_listings('pokemon', self.racing)
+        self.assertEqual(self.titles(page), ['Mario Kart DS'])
+        self.assertEqual(page.facets, [(self.rpg, 2), (self.racing, 1)])
+
+    def test_icontains_fallback(self):
+        with mock.patch('auctions.search.fts_enabled', return_value=False):
+            page = search_listings('pokemon', self.rpg)
+        self.assertEqual(self.titles(page), ['Pokemon Pearl', 'Pokemon Diamond'])
+        self.assertEqual(page.facets, [(self.rpg, 2), (self.racing, 1)])
+
+    def test_syntax_is_not_interpreted(self):
+        # FTS5 operators are searched for as plain words
+        self.assertEqual(self.titles(search_listings('"pokemon" OR NEAR(')), [])
+        self.assertEqual(self.titles(search_listings('***')), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        Listing.objects.filter(pk=self.pearl.pk).update(title='Zelda Spirit Tracks')
+        self.assertEqual(self.titles(search_listings('zelda')), ['Zelda Spirit Tracks'])
+        self.diamond.delete()
+        self.assertEqual(self.titles(search_listings('manual')), [])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search', args=['rpg']), {'q': 'pokemon'})
+        self.assertEqual(set(self.titles(response.context['listings'])), {'Pokemon Diamond', 'Pokemon Pearl'})
+        self.assertContains(response, 'Results for &quot;pokemon&quot; in RPG')
+
+    @override_settings(LISTINGS_PER_PAGE=2)
+    def test_search_pages(self):
+        response = self.client.get(reverse('search'), {'q': 'pokemon'})
+        self.assertContains(response, '?q=pokemon&amp;page=2')
+        response = self.client.get(reverse('search'), {'q': 'pokemon', 'page': 2})
+        self.assertEqual(len(response.context['listings']), 1)
+
+
+class ListingCardCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password', is_staff=True)
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+
+    def setUp(self):
+        page_cache().clear()
+        card_cache().clear()
+        reset_card_stats()
+        self.listing = Listing.objects.create(owner=self.owner, title='Game', description='A game',
+                                              starting_bid=Decimal('1.00'))
+
+    def test_second_render_is_a_hit(self):
+        self.client.get(reverse('index'))
+        # a signed-in visitor skips the page cache but shares the card fragments
+        self.client.force_login(self.bidder)
+        self.client.get(reverse('index'))
+        self.assertEqual(card_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_genre_rename_retires_cached_card_in_every_process(self):
+        genre = Genre.objects.create(name='Strategy', slug='strategy')
+        self.listing.genres.add(genre)
+        self.assertContains(self.client.get(reverse('index')), 'Strategy')
+        genre.name = 'Tactics'
+        genre.save()
+        # another process, with a registry of its own, sharing the card cache
+        another = GenreRegistry()
+        with mock.patch('auctions.cards.genre_registry', another):
+            self.client.force_login(self.bidder)
+            self.assertContains(self.client.get(reverse('index')), 'Tactics')
+
+    def test_bid_retires_cached_card(self):
+        self.assertContains(self.client.get(reverse('index')), 'No biddings placed!')
+        place_bid(self.listing.pk, self.bidder, '3.00')
+        self.assertContains(self.client.get(reverse('index')), '$3.00')
+        self.assertEqual(card_stats()['misses'], 2)
+
+    def test_edit_and_close_bump_version(self):
+        version = self.listing.version
+        self.listing.title = 'Renamed'
+        self.listing.save()
+        self.client.force_login(self.owner)
+        self.client.post(reverse('listing', args=[self.listing.pk]), {'close_listing': 'Close Listing'})
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.version, version + 2)
+        self.assertFalse(self.listing.status)
+
+    def test_save_moves_past_a_concurrent_touch(self):
+        stale = Listing.objects.get(pk=self.listing.pk)
+        # a bid lands after the listing was read
+        Listing.objects.filter(pk=self.listing.pk).touch()
+        touched = Listing.objects.get(pk=self.listing.pk).version
+        stale.title = 'Renamed'
+        stale.save(update_fields=['title'])
+        self.assertEqual(stale.version, touched + 1)
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).version, touched + 1)
+
+    def test_stats_are_staff_only(self):
+        self.client.force_login(self.bidder)
+        self.assertEqual(self.client.get(reverse('card_cache_stats')).status_code, 302)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse('card_cache_stats')).json()['misses'], 0)
+
+
+class GenreRegistryTests(TestCase):
+
+    def setUp(self):
+        genre_registry.invalidate()
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+
+    def test_steady_state_costs_no_queries(self):
+        with self.assertNumQueries(1):
+            genre_registry.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(genre_registry.by_slug('rpg'), self.rpg)
+            self.assertEqual(genre_registry.by_id(self.rpg.id), self.rpg)
+            self.assertIsNone(genre_registry.by_slug('missing'))
+            self.client.get(reverse('search'))
+
+    def test_genre_changes_invalidate(self):
+        digest = genre_registry.digest()
+        racing = Genre.objects.create(name='Racing', slug='racing')
+        self.assertEqual(genre_registry.by_slug('racing'), racing)
+        self.assertNotEqual(genre_registry.digest(), digest)
+        racing.delete()
+        self.assertIsNone(genre_registry.by_slug('racing'))
+        self.assertEqual(genre_registry.digest(), digest)
+
+    @override_settings(GENRE_REGISTRY_CHECK_INTERVAL=0)
+    def test_changes_made_by_another_process(self):
+        genre_registry.all()
+        # the row written, and the stamp moved, by a process whose signals this one never sees
+        racing = Genre.objects.bulk_create([Genre(name='Racing', slug='racing')])[0]
+        with self.assertNumQueries(0):
+            self.assertIsNone(genre_registry.by_slug('racing'))
+        caches[settings.GENRE_CACHE_ALIAS].set(STAMP_KEY, 'another process', None)
+        self.assertEqual(genre_registry.by_slug('racing'), racing)
+
+    def test_listing_form_validates_against_registry(self):
+        data = {'title': 'Game', 'description': 'A game', 'starting_bid': '1.00'}
+        form = NewListingForm({**data, 'genres': [str(self.rpg.id)]})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['genres'], [self.rpg.id])
+        self.assertFalse(NewListingForm({**data, 'genres': ['999']}).is_valid())
+
+    def test_unknown_category(self):
+        response = self.client.get(reverse('search', args=['nope']))
+        self.assertContains(response, 'does not exist')
+
+
+class ImportListingsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'password')
+        cls.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        cls.racing = Genre.objects.create(name='Racing', slug='racing')
+
+    def setUp(self):
+        genre_registry.invalidate()
+
+    def run_import(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix) as source:
+            source.write(content)
+            source.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_listings', source.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        out, err = self.run_import(
+            'title,description,starting_bid,genres,owner\n'
+            'Pokemon Diamond,Boxed,9.99,rpg|Racing,\n'
+            'Mario Kart,Loose,5.00,racing,other\n',
+            '.csv', '--owner', 'seller', '--batch-size', '1',
+        )
+        self.assertIn('Imported 2 listings, skipped 0', out)
+        diamond = Listing.objects.get(title='Pokemon Diamond')
+        self.assertEqual((diamond.owner, diamond.starting_bid), (self.seller, Decimal('9.99')))
+        self.assertEqual(set(diamond.genres.all()), {self.rpg, self.racing})
+        self.assertEqual(Listing.objects.get(title='Mario Kart').owner, self.other)
+
+    def test_jsonl_rows_are_validated(self):
+        out, err = self.run_import(
+            '{"title": "Good", "description": "Fine", "starting_bid": "1.00", "genres": ["rpg"]}\n'
+            '{"title": "Cheap", "description": "Too cheap", "starting_bid": "0.00", "genres": ["rpg"]}\n'
+            '{"title": "No genre", "description": "Nope", "starting_bid": "1.00", "genres": ["puzzle"]}\n'
+            '{"title": "Nobody", "description": "Nope", "starting_bid": "1.00", "genres": ["rpg"], "owner": "ghost"}\n'
+            'not json\n',
+            '.jsonl', '--owner', 'seller',
+        )
+        self.assertIn('Imported 1 listings, skipped 4', out)
+        self.assertIn('row 2: starting_bid', err)
+        self.assertIn("row 3: unknown genre", err)
+        self.assertIn("row 4: unknown owner 'ghost'", err)
+        self.assertEqual(list(Listing.objects.values_list('title', flat=True)), ['Good'])
+
+    def test_imported_listings_are_searchable(self):
+        self.run_import('{"title": "Zelda", "description": "Cart", "starting_bid": "3", "genres": "rpg"}\n', '.jsonl', '--owner', 'seller')
+        self.assertEqual([listing.title for listing in search_listings('zelda')], ['Zelda'])
+
+    def test_batches_are_bulk_written(self):
+        rows = ''.join(f'{{"title": "Game {i}", "description": "d", "starting_bid": "1", "genres": ["rpg", "racing"]}}\n' for i in range(50))
+        # owner lookup, genre registry load, then per batch of 25: savepoint, listings, links, release
+        with self.assertNumQueries(2 + 2 * 4):
+            self.run_import(rows, '.jsonl', '--owner', 'seller', '--batch-size', '25')
+        self.assertEqual(Listing.genres.through.objects.count(), 100)
+
+    def test_create_view_links_genres(self):
+        self.client.force_login(self.seller)
+        self.client.post(reverse('create'), {'title': 'New', 'description': 'Listing', 'starting_bid': '2.00',
+                                              'genres': [self.rpg.id, self.racing.id]})
+        self.assertEqual(set(Listing.objects.get(title='New').genres.all()), {self.rpg, self.racing})
+
+
+@override_settings(IMAGE_WORKERS=0)
+class ImageVariantTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.rpg = Genre.objects.create(name='RPG', slug='rpg')
+
+    def setUp(self):
+        page_cache().clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        card_cache().clear()
+        genre_registry.invalidate()
+
+    def upload(self, content=None):
+        if content is None:
+            buffer = io.BytesIO()
+            Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG')
+            content = buffer.getvalue()
+        return SimpleUploadedFile('cover.jpg', content, content_type='image/jpeg')
+
+    def create_listing(self):
+        self.client.force_login(self.seller)
+        self.client.post(reverse('create'), {'title': 'Game', 'description': 'A game', 'starting_bid': '2.00',
+                                              'genres': [self.rpg.id], 'image': self.upload()})
+        return Listing.objects.get(title='Game')
+
+    def test_upload_queues_a_job(self):
+        listing = self.create_listing()
+        self.assertEqual(ImageJob.objects.get().listing, listing)
+        # the original stands in until the thumbnail exists
+        self.assertContains(self.client.get(reverse('index')), f'<img src="{listing.image.url}" class="card-img-top" alt="Game" loading="lazy">', html=True)
+
+    def test_job_generates_variants(self):
+        listing = self.create_listing()
+        self.assertTrue(process_job(ImageJob.objects.get().pk))
+        listing.refresh_from_db()
+        with Image.open(listing.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (300, 200))
+        with Image.open(listing.thumbnail_webp.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (300, 200)))
+        with Image.open(listing.image_webp.path) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (1200, 800)))
+        self.assertFalse(ImageJob.objects.exists())
+
+        grid = self.client.get(reverse('index')).content.decode()
+        self.assertIn(listing.thumbnail.url, grid)
+        self.assertNotIn(listing.image.url, grid)
+        self.assertContains(self.client.get(reverse('listing', args=[listing.pk])), listing.image.url)
+
+    def test_broken_image_fails_after_max_attempts(self):
+        listing = Listing.objects.create(owner=self.seller, title='Broken', description='x', starting_bid=Decimal('1.00'),
+                                         image=self.upload(b'not an image'))
+        job = enqueue_image_job(listing)
+        with self.assertLogs('auctions.images', 'ERROR'):
+            for _ in range(MAX_ATTEMPTS):
+                self.assertFalse(process_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, MAX_ATTEMPTS))
+        self.assertFalse(process_job(job.pk))
+
+    def test_drain_runs_queued_jobs_and_retries_failures(self):
+        listing = self.create_listing()
+        broken = Listing.objects.create(owner=self.seller, title='Broken', description='x', starting_bid=Decimal('1.00'),
+                                        image=self.upload(b'not an image'))
+        enqueue_image_job(broken)
+        with self.assertLogs('auctions.images', 'ERROR') as logs:
+            drain()
+        self.assertEqual(len(logs.output), MAX_ATTEMPTS)
+        listing.refresh_from_db()
+        self.assertTrue(listing.thumbnail)
+        self.assertEqual(list(ImageJob.objects.values_list('listing', 'status')), [(broken.pk, ImageJob.FAILED)])
+
+    def test_workers_start_on_the_queue(self):
+        with mock.patch('auctions.images.executor') as pool:
+            start_image_workers()
+            self.assertFalse(pool.called)
+            with override_settings(IMAGE_WORKERS=2):
+                start_image_workers()
+        self.assertEqual(pool.return_value.submit.call_count, 1)
+
+    def test_process_images_command(self):
+        listing = self.create_listing()
+        ImageJob.objects.all().delete()
+        out = StringIO()
+        call_command('process_images', '--backfill', stdout=out)
+        self.assertIn('Processed 1 image jobs', out.getvalue())
+        listing.refresh_from_db()
+        self.assertTrue(listing.thumbnail)
+
+
+class ListingEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+
+    def setUp(self):
+        self.listing = Listing.objects.create(owner=self.seller, title='Game', description='A game',
+                                              starting_bid=Decimal('5.00'))
+
+    def test_bid_is_published_after_commit(self):
+        with mock.patch('auctions.bidding.publish_listing_event') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                place_bid(self.listing.pk, self.bidder, '6.00')
+                publish.assert_not_called()
+        publish.assert_called_once_with(self.listing.pk, 'bid', amount='6.00', bidder='bidder', new_bidder=True)
+
+    def test_rejected_bid_is_not_published(self):
+        with mock.patch('auctions.bidding.publish_listing_event') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(BidError):
+                    place_bid(self.listing.pk, self.bidder, '1.00')
+        publish.assert_not_called()
+
+    def test_close_is_published(self):
+        place_bid(self.listing.pk, self.bidder, '6.00')
+        self.client.force_login(self.seller)
+        with mock.patch('auctions.views.publish_listing_event') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('listing', args=[self.listing.pk]), {'close_listing': 'Close'})
+        publish.assert_called_once_with(self.listing.pk, 'close', winner='bidder')
+
+    def test_pages_subscribe_only_when_served_over_asgi(self):
+        url = reverse('listing', args=[self.listing.pk])
+        self.client.force_login(self.bidder)
+        for live in (False, True):
+            with self.subTest(live=live), override_settings(LISTING_EVENTS=live):
+                response = self.client.get(url)
+                self.assertEqual('new EventSource' in response.content.decode(), live)
+
+
+@override_settings(LISTING_EVENTS_HEARTBEAT=0.05, LISTING_EVENTS_MAX_AGE=5)
+class ListingEventStreamTests(SimpleTestCase):
+
+    async def test_broker_delivers_events_published_from_other_threads(self):
+        broker = InProcessBroker(queue_size=2)
+        subscription = broker.subscribe(1)
+        other = broker.subscribe(2)
+        publishers = [threading.Thread(target=broker.publish, args=(1, {'event': 'bid', 'n': n})) for n in range(3)]
+        for publisher in publishers:
+            publisher.start()
+            publisher.join()
+        # the queue holds the newest two events only
+        self.assertEqual([(await subscription.get(1))['n'] for _ in range(2)], [1, 2])
+        with self.assertRaises(asyncio.TimeoutError):
+            await other.get(0.01)
+        subscription.close()
+        other.close()
+        self.assertEqual((broker.subscriber_count(1), broker.subscriber_count(2)), (0, 0))
+
+    async def test_stream_sends_events_until_close(self):
+        response = await self.async_client.get(reverse('listing_events', args=[7]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(get_broker().subscriber_count(7), 1)
+
+        chunks = response.streaming_content
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+        self.assertEqual(await anext(chunks), b': keepalive\n\n')
+        get_broker().publish(7, {'event': 'bid', 'listing_id': 7, 'amount': '6.00'})
+        get_broker().publish(7, {'event': 'close', 'listing_id': 7, 'winner': 'bidder'})
+        bid = (await anext(chunks)).decode()
+        self.assertIn('event: bid\n', bid)
+        self.assertIn('"amount": "6.00"', bid)
+        self.assertIn('event: close\n', (await anext(chunks)).decode())
+        with self.assertRaises(StopAsyncIteration):
+            await anext(chunks)
+        self.assertEqual(get_broker().subscriber_count(7), 0)
+
+    def test_wsgi_requests_are_refused(self):
+        response = self.client.get(reverse('listing_events', args=[7]))
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(get_broker().subscriber_count(7), 0)
+
+
+class ListingApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        cls.genre = Genre.objects.create(name='Strategy', slug='strategy')
+        cls.listings = [Listing.objects.create(owner=cls.seller, title=f'Game {n}', description='A game',
+                                               starting_bid=Decimal('5.00')) for n in range(5)]
+        cls.listings[0].genres.add(cls.genre)
+
+    def setUp(self):
+        genre_registry.invalidate()
+
+    def test_listings_follow_cursor(self):
+        first = self.client.get(reverse('api_listings'), {'limit': 3}).json()
+        self.assertEqual([row['id'] for row in first['results']], [listing.pk for listing in self.listings[:1:-1]])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['id'] for row in second['results']], [self.listings[1].pk, self.listings[0].pk])
+        self.assertIsNone(second['next'])
+
+        by_genre = self.client.get(reverse('api_listings'), {'genre': 'strategy'}).json()
+        self.assertEqual([row['id'] for row in by_genre['results']], [self.listings[0].pk])
+        self.assertEqual(self.client.get(reverse('api_listings'), {'status': 'sold'}).status_code, 400)
+
+    def test_detail_revalidates_until_a_bid(self):
+        url = reverse('api_listing', args=[self.listings[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['genres'], ['strategy'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        place_bid(self.listings[0].pk, self.bidder, '6.00')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['current_price'], response.json()['highest_bidder']), ('6.00', 'bidder'))
+        self.assertEqual(self.client.get(reverse('api_listing', args=[0])).status_code, 404)
+
+    def test_bid_history(self):
+        place_bid(self.listings[1].pk, self.bidder, '6.00')
+        place_bid(self.listings[1].pk, self.seller, '7.00')
+        place_bid(self.listings[1].pk, self.bidder, '8.00')
+        response = self.client.get(reverse('api_listing_bids', args=[self.listings[1].pk]))
+        self.assertEqual([(row['bidder'], row['amount']) for row in response.json()['results']],
+                         [('bidder', '8.00'), ('seller', '7.00'), ('bidder', '6.00')])
+        self.assertIn('placed', response.json()['results'][0])
+        self.assertEqual(self.client.get(response.request['PATH_INFO'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @override_settings(ARCHIVE_AFTER=0)
+    def test_archived_listings_are_still_served(self):
+        place_bid(self.listings[0].pk, self.bidder, '6.00')
+        place_bid(self.listings[0].pk, self.seller, '7.00')
+        Listing.objects.filter(pk__in=[self.listings[0].pk, self.listings[1].pk]).touch(status=False)
+        self.assertEqual(archive_closed(now=timezone.now() + timedelta(seconds=1)), 2)
+        Listing.objects.filter(pk=self.listings[2].pk).touch(status=False)
+
+        inactive = self.client.get(reverse('api_listings'), {'status': 'inactive', 'limit': 2}).json()
+        self.assertEqual([row['id'] for row in inactive['results']], [self.listings[2].pk, self.listings[1].pk])
+        rest = self.client.get(inactive['next']).json()
+        self.assertEqual(([row['id'] for row in rest['results']], rest['results'][0]['active']), ([self.listings[0].pk], False))
+        every = self.client.get(reverse('api_listings'), {'status': 'all'}).json()
+        self.assertEqual([row['id'] for row in every['results']], [listing.pk for listing in reversed(self.listings)])
+        by_genre = self.client.get(reverse('api_listings'), {'status': 'inactive', 'genre': 'strategy'}).json()
+        self.assertEqual([row['id'] for row in by_genre['results']], [self.listings[0].pk])
+
+        detail = self.client.get(reverse('api_listing', args=[self.listings[0].pk]))
+        self.assertEqual((detail.json()['highest_bidder'], detail.json()['genres']), ('seller', ['strategy']))
+        self.assertEqual(self.client.get(reverse('api_listing', args=[self.listings[0].pk]),
+                                         HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 304)
+        bids = self.client.get(reverse('api_listing_bids', args=[self.listings[0].pk]))
+        self.assertEqual([(row['bidder'], row['amount']) for row in bids.json()['results']],
+                         [('seller', '7.00'), ('bidder', '6.00')])
+        self.assertEqual(self.client.get(reverse('api_listing_bids', args=[0])).status_code, 404)
+
+    def test_watchlist_requires_login_and_tracks_membership(self):
+        self.assertEqual(self.client.get(reverse('api_watchlist')).status_code, 401)
+        self.client.force_login(self.bidder)
+        self.bidder.watchlist.add(self.listings[2])
+        response = self.client.get(reverse('api_watchlist'))
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.listings[2].pk])
+
+        self.bidder.watchlist.add(self.listings[3])
+        self.assertEqual(self.client.get(reverse('api_watchlist'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_genres_change_etag(self):
+        response = self.client.get(reverse('api_genres'))
+        self.assertEqual(response.json()['results'], [{'id': self.genre.id, 'name': 'Strategy', 'slug': 'strategy'}])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('api_genres'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        Genre.objects.create(name='Party', slug='party')
+        self.assertEqual(self.client.get(reverse('api_genres'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ListingClosingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+
+    def create_listing(self, ends_in, **fields):
+        return Listing.objects.create(owner=self.seller, title='Game', description='A game', starting_bid=Decimal('5.00'),
+                                      ends_at=timezone.now() + ends_in, **fields)
+
+    def test_sweep_leaves_the_real_bid_log_alone(self):
+        self.assertNotEqual(settings.BID_BOOK_WAL, os.path.join(settings.BASE_DIR, 'bids.wal'))
+
+    def test_sweep_closes_expired_listings_and_keeps_winner(self):
+        won = self.create_listing(timedelta(minutes=1))
+        place_bid(won.pk, self.bidder, '6.00')
+        unsold = self.create_listing(-timedelta(minutes=1))
+        running = self.create_listing(timedelta(days=1))
+        forever = Listing.objects.create(owner=self.seller, title='Game', description='A game', starting_bid=Decimal('5.00'))
+
+        with mock.patch('auctions.closing.publish_listing_event') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(close_expired(timezone.now() + timedelta(minutes=2), batch_size=1), 2)
+        publish.assert_has_calls([mock.call(won.pk, 'close', winner='bidder'),
+                                  mock.call(unsold.pk, 'close', winner=None)], any_order=True)
+
+        self.assertEqual(set(Listing.objects.inactive().values_list('pk', flat=True)), {won.pk, unsold.pk})
+        won.refresh_from_db()
+        self.assertEqual((won.highest_bidder, won.current_price), (self.bidder, Decimal('6.00')))
+        self.assertEqual(Listing.objects.filter(pk__in=[running.pk, forever.pk], status=True).count(), 2)
+
+    def test_expired_listing_refuses_bids_before_the_sweep(self):
+        listing = self.create_listing(-timedelta(seconds=1))
+        with self.assertRaisesMessage(BidError, 'closed'):
+            place_bid(listing.pk, self.bidder, '6.00')
+
+    def test_end_time_must_be_in_the_future(self):
+        form = NewListingForm({'title': 'Game', 'description': 'A game', 'starting_bid': '5.00',
+                               'ends_at': '2000-01-01T12:00'})
+        self.assertIn('ends_at', form.errors)
+
+    def test_command(self):
+        self.create_listing(-timedelta(hours=1))
+        out = StringIO()
+        call_command('close_expired_listings', stdout=out)
+        self.assertIn('Closed 1 expired listings', out.getvalue())
+        self.assertFalse(Listing.objects.active().exists())
+
+
+class DatabaseProfileTests(TestCase):
+
+    @unittest.skipUnless(connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS, "needs the sqlite-wal profile")
+    def test_pragmas_applied_to_connections(self):
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'temp_store'):
+                value = cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+                self.assertEqual(str(value).lower(), {'journal_mode': 'wal', 'synchronous': '1', 'temp_store': '2'}[pragma])
+
+
+class WatchlistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.watcher = User.objects.create_user('watcher', 'watcher@example.com', 'password')
+        cls.listings = [Listing.objects.create(owner=cls.seller, title=f'Game {n}', description='A game',
+                                               starting_bid=Decimal('5.00')) for n in range(3)]
+
+    def setUp(self):
+        page_cache().clear()
+
+    def counts(self, listing):
+        listing.refresh_from_db()
+        self.watcher.refresh_from_db()
+        return listing.watcher_count, self.watcher.watchlist_count
+
+    def test_watch_and_unwatch_keep_counts(self):
+        listing = self.listings[0]
+        self.assertTrue(watch(self.watcher, listing.pk))
+        self.assertFalse(watch(self.watcher, listing.pk))
+        self.assertEqual(self.counts(listing), (1, 1))
+        with self.assertNumQueries(1):
+            self.assertTrue(is_watching(self.watcher, listing.pk))
+
+        self.assertTrue(unwatch(self.watcher, listing.pk))
+        self.assertFalse(unwatch(self.watcher, listing.pk))
+        self.assertEqual(self.counts(listing), (0, 0))
+        self.assertFalse(is_watching(self.watcher, listing.pk))
+
+    def test_changes_through_the_relation_keep_counts(self):
+        first, second, third = self.listings
+        self.watcher.watchlist.add(first, second)
+        self.watcher.watchlist.add(second)
+        self.assertEqual(self.counts(first), (1, 2))
+        self.watcher.watchlist.remove(first, third)
+        self.assertEqual(self.counts(first), (0, 1))
+        second.user_set.add(self.seller)
+        self.assertEqual(self.counts(second), (2, 1))
+        second.user_set.clear()
+        self.assertEqual(self.counts(second), (0, 0))
+        self.watcher.watchlist.set([first, third])
+        self.assertEqual(self.counts(third), (1, 2))
+
+    def test_admin_user_form_keeps_counts(self):
+        admin = User.objects.create_superuser('staff', 'staff@example.com', 'password')
+        watch(self.watcher, self.listings[0].pk)
+        self.client.force_login(admin)
+        url = reverse('admin:auctions_user_change', args=[self.watcher.pk])
+        form = self.client.get(url).context['adminform'].form
+        skipped = ('last_login', 'date_joined', 'user_permissions', 'groups')
+        data = {name: value for name, value in form.initial.items() if value is not None and name not in skipped}
+        data.update(watchlist=f'{self.listings[1].pk},{self.listings[2].pk}',
+                    date_joined_0='2020-01-01', date_joined_1='00:00:00')
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self.counts(self.listings[0]), (0, 2))
+        self.assertEqual(self.counts(self.listings[1]), (1, 2))
+
+    def test_watched_ids(self):
+        watch(self.watcher, self.listings[1].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(watched_ids(self.watcher, [listing.pk for listing in self.listings]), {self.listings[1].pk})
+
+    def test_grid_badges_watched_cards_only(self):
+        watch(self.watcher, self.listings[1].pk)
+        self.client.force_login(self.watcher)
+        self.client.get(reverse('index'))  # warm the card cache, badges must not leak into it
+        html = self.client.get(reverse('index')).content.decode()
+        self.assertEqual(html.count('<span class="badge bg-secondary">Watchlist</span>'), 1)
+        self.assertIn('<span class="badge bg-secondary"> 1</span>', html)
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse('index')), 'badge bg-secondary">Watchlist')
+
+    def test_listing_page_add_and_remove(self):
+        url = reverse('listing', args=[self.listings[2].pk])
+        self.client.force_login(self.watcher)
+        self.assertContains(self.client.post(url, {'add_watchlist': 'Add'}, follow=True), 'Remove from Watchlist')
+        self.assertEqual(self.counts(self.listings[2]), (1, 1))
+        self.assertContains(self.client.post(url, {'remove_watchlist': 'Remove'}), 'Add to Watchlist')
+        self.assertEqual(self.counts(self.listings[2]), (0, 0))
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+@override_settings(**CACHED_AUTH)
+class SessionAndUserCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.listing = Listing.objects.create(owner=cls.seller, title='Game', description='A game',
+                                             starting_bid=Decimal('5.00'))
+
+    def setUp(self):
+        page_cache().clear()
+        user_cache().clear()
+        genre_registry.all()
+
+    def test_signed_in_request_reads_no_session_or_user_rows(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse('search'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('search')).context['user'], self.seller)
+
+    def test_watch_refreshes_cached_user(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse('search'))
+        self.client.post(reverse('listing', args=[self.listing.pk]), {'add_watchlist': 'Add'})
+        self.assertEqual(self.client.get(reverse('search')).context['user'].watchlist_count, 1)
+
+    def test_deactivated_user_is_signed_out(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse('search'))
+        self.seller.is_active = False
+        self.seller.save()
+        response = self.client.get(reverse('watchlist'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    @override_settings(SESSION_ENGINE=settings.SESSION_ENGINES['signed_cookies'])
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.context['user'], self.seller)
+        self.assertFalse(Session.objects.exists())
+
+    def test_cached_stores_need_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_auth_caches(None)], ['auctions.E001', 'auctions.E002'])
+        shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0'}
+        with override_settings(CACHES={**settings.CACHES, 'sessions': shared, 'users': shared}):
+            self.assertEqual(check_auth_caches(None), [])
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES['db'],
+                               AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']):
+            self.assertEqual(check_auth_caches(None), [])
+
+    def test_password_hash_cost_follows_setting(self):
+        self.assertTrue(self.seller.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            # signing in re-hashes the password at the new cost
+            self.assertTrue(self.client.login(username='seller', password='password'))
+            self.seller.refresh_from_db()
+            self.assertTrue(self.seller.password.startswith('pbkdf2_sha256$2000$'))
+            self.assertTrue(self.seller.check_password('password'))
+
+    def test_register_hashes_once_and_signs_in(self):
+        with mock.patch.object(TunablePBKDF2PasswordHasher, 'encode', autospec=True,
+                               side_effect=TunablePBKDF2PasswordHasher.encode) as encode:
+            response = self.client.post(reverse('register'), {'username': 'newcomer', 'email': 'new@example.com',
+                                                              'password': 'secret', 'confirmation': 'secret'})
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(self.client.get(reverse('search')).context['user'].username, 'newcomer')
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.listing = Listing.objects.create(owner=cls.seller, title='Game', description='A game', starting_bid=Decimal('5.00'))
+        commenters = [User.objects.create_user(f'fan{n}', f'fan{n}@example.com', 'password') for n in range(2)]
+        # the same timestamp on every comment leaves the id to order them
+        created = timezone.now()
+        cls.comments = Comment.objects.bulk_create(
+            Comment(listing=cls.listing, commenter=commenters[n % 2], comment=f'Comment {n}', created=created) for n in range(7)
+        )
+
+    def setUp(self):
+        page_cache().clear()
+
+    def test_pages_run_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = comment_page(self.listing.pk, cursor)
+                seen += [(comment.comment, comment.commenter.username) for comment in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [(f'Comment {n}', f'fan{n % 2}') for n in reversed(range(7))])
+
+    def test_listing_page_shows_newest_and_links_older(self):
+        response = self.client.get(reverse('listing', args=[self.listing.pk]))
+        self.assertContains(response, 'Comment 6')
+        self.assertNotContains(response, 'Comment 3')
+        self.assertContains(response, 'Load older comments')
+
+        older = self.client.get(reverse('listing_comments', args=[self.listing.pk]), {'cursor': response.context['comments'].next_cursor})
+        self.assertContains(older, 'Comment 3')
+        self.assertNotContains(older, 'Comment 4')
+        self.assertNotContains(older, '<html')
+
+
+@override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=None)
+class RequestInstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        Listing.objects.create(owner=cls.staff, title='Game', description='A game', starting_bid=Decimal('5.00'))
+
+    def setUp(self):
+        page_cache().clear()
+        request_stats.reset()
+        card_cache().clear()
+        genre_registry.all()
+
+    def test_records_timings_per_view(self):
+        response = self.client.get(reverse('index'))
+        self.assertRegex(response['Server-Timing'], r'app;dur=[\d.]+, db;dur=[\d.]+;desc="3 queries", render;dur=[\d.]+')
+
+        row, = request_stats.summary()
+        self.assertEqual((row['view'], row['requests'], row['queries']), ('index', 1, 3))
+        self.assertGreater(row['render_p95'], 0)
+        self.assertEqual(row['size'], len(response.content))
+
+    def test_logs_slow_requests_with_sql(self):
+        with override_settings(PERF_SLOW_REQUEST_MS=0), self.assertLogs('auctions.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        self.assertIn('Slow request GET / (index)', logs.output[0])
+        self.assertIn('FROM "auctions_listing"', logs.output[0])
+
+    @override_settings(PERF_INSTRUMENTATION=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+        self.assertEqual(request_stats.summary(), [])
+
+    def test_stats_page_is_staff_only(self):
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('request_timings')).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('request_timings'))
+        self.assertContains(response, '<td>index</td>', html=False)
+
+
+class BenchmarkDataTests(TestCase):
+
+    def test_seed_activity_keeps_summaries_consistent(self):
+        users = seed_catalogue(50, users=5, genres=3)
+        seed_activity(users, bids=40, comments=30, watches=20)
+
+        self.assertEqual(Comment.objects.count(), 30)
+        for listing in Listing.objects.all():
+            top = Bid.objects.filter(listing=listing).order_by('-bid').first()
+            self.assertEqual(listing.bid_count, Bid.objects.filter(listing=listing).count())
+            self.assertEqual(listing.current_price, top.bid if top else None)
+            self.assertEqual(listing.watcher_count, listing.user_set.count())
+        for user in User.objects.all():
+            self.assertEqual(user.watchlist_count, user.watchlist.count())
+
+    def test_suite_flags_regressions(self):
+        baseline = {'detail': {'p95': 10.0, 'queries_max': 3}, 'browse': {'p95': 10.0, 'queries_max': 3}}
+        results = {'detail': {'p95': 11.0, 'queries_max': 4}, 'browse': {'p95': 13.0, 'queries_max': 3},
+                   'api': {'p95': 1.0, 'queries_max': 1}}
+        self.assertEqual(BenchSuiteCommand.regressions(results, baseline, threshold=20),
+                         ['detail queries per request 3 -> 4', 'browse p95 10.00 -> 13.00 ms'])
+
+
+class AnonymousPageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+
+    def setUp(self):
+        page_cache().clear()
+        self.listing = Listing.objects.create(owner=self.seller, title='Boxed chess set', description='A game',
+                                              starting_bid=Decimal('5.00'))
+        self.url = reverse('listing', args=[self.listing.pk])
+
+    def test_repeat_requests_are_hits_without_queries(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Boxed chess set')
+
+    def test_bid_comment_and_close_purge(self):
+        self.client.get(self.url)
+        self.client.get(reverse('index'))
+
+        place_bid(self.listing.pk, self.bidder, '6.00')
+        self.assertContains(self.client.get(self.url), '$6.00')
+        self.assertContains(self.client.get(reverse('index')), '$6.00')
+
+        self.client.force_login(self.bidder)
+        self.client.post(self.url, {'comment_send': 'Send', 'comment': 'Still boxed?'})
+        self.client.logout()
+        self.assertContains(self.client.get(self.url), 'Still boxed?')
+
+        self.client.force_login(self.seller)
+        self.client.post(self.url, {'close_listing': 'Close Listing'})
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse('index')), 'Boxed chess set')
+
+    def test_stale_copy_served_while_another_request_renders(self):
+        self.client.get(self.url)
+        place_bid(self.listing.pk, self.bidder, '6.00')
+        # another request holds the re-render
+        page_cache().add(f"pagelock:{hashlib.md5(self.url.encode()).hexdigest()}", True)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, '$6.00')
+
+    @override_settings(PAGE_CACHE_STALE=0)
+    def test_no_stale_copy_outside_the_window(self):
+        self.client.get(self.url)
+        place_bid(self.listing.pk, self.bidder, '6.00')
+        page_cache().add(f"pagelock:{hashlib.md5(self.url.encode()).hexdigest()}", True)
+        time.sleep(0.01)
+        self.assertContains(self.client.get(self.url), '$6.00')
+
+    def test_signed_in_and_flash_message_requests_bypass(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(self.bidder)
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('index')))
+        self.client.logout()
+
+        # a message added for the next page is not served from, or stored in, the cache
+        missing = self.client.get(reverse('search', args=['no-such-genre']))
+        self.assertContains(missing, 'does not exist')
+        self.assertEqual(self.client.get(reverse('search', args=['no-such-genre']))['X-Page-Cache'], 'miss')
+
+
+class AsyncReadUrls:
+    # the app's routes with the async read views in front of the sync ones
+    urlpatterns = read_patterns(async_views) + auction_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncReadUrls, LISTINGS_PER_PAGE=2)
+class AsyncReadViewTests(TestCase):
+    """The test client runs async views in an event loop of their own, so any query made from the
+    loop instead of through the async ORM fails with SynchronousOnlyOperation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        cls.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        cls.listings = []
+        for title in ['Chrono Trigger', 'Secret of Mana', 'Earthbound']:
+            listing = Listing.objects.create(owner=cls.seller, title=title, description='Boxed cartridge',
+                                             starting_bid=Decimal('5.00'))
+            listing.genres.add(cls.rpg)
+            cls.listings.append(listing)
+        Comment.objects.create(listing=cls.listings[0], commenter=cls.bidder, comment='Does it save?')
+
+    def setUp(self):
+        page_cache().clear()
+        card_cache().clear()
+        genre_registry.invalidate()
+
+    def test_grids_for_visitors_and_users(self):
+        watch(self.bidder, self.listings[2].pk)
+        for login in (False, True):
+            if login:
+                self.client.force_login(self.bidder)
+            index = self.client.get(reverse('index'))
+            self.assertContains(index, 'Earthbound')
+            self.assertContains(index, 'Page 1 of 2')
+            self.assertContains(self.client.get(reverse('index'), {'page': 2}), 'Chrono Trigger')
+            self.assertContains(self.client.get(reverse('search', args=['rpg'])), 'Secret of Mana')
+            self.assertContains(self.client.get(reverse('search'), {'q': 'chrono'}), 'Chrono Trigger')
+            self.assertContains(self.client.get(reverse('search')), 'RPG')
+            self.assertEqual(self.client.get(reverse('inactive')).status_code, 200)
+        self.assertContains(index, WATCHED_BADGE, count=1)
+
+    def test_listing_page(self):
+        url = reverse('listing', args=[self.listings[0].pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Does it save?')
+        self.assertNotContains(response, 'Place Bid')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+
+        self.client.force_login(self.bidder)
+        response = self.client.get(url)
+        self.assertContains(response, 'Place Bid')
+        self.assertFalse(response.context['watching'])
+        self.assertEqual(self.client.get(reverse('listing', args=[0])).status_code, 404)
+
+    def test_listing_writes_go_through_the_sync_view(self):
+        self.client.force_login(self.bidder)
+        url = reverse('listing', args=[self.listings[0].pk])
+        self.assertRedirects(self.client.post(url, {'bid_amount': 'Place Bid', 'bid': '7.00'}), url)
+        self.assertRedirects(self.client.post(url, {'add_watchlist': 'add_watchlist'}), url)
+        self.assertEqual(Listing.objects.get(pk=self.listings[0].pk).current_price, Decimal('7.00'))
+        self.assertTrue(is_watching(self.bidder, self.listings[0].pk))
+
+    def test_watchlist(self):
+        response = self.client.get(reverse('watchlist'))
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next={reverse('watchlist')}", fetch_redirect_response=False)
+
+        watch(self.bidder, self.listings[1].pk)
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse('watchlist'))
+        self.assertContains(response, 'Secret of Mana')
+        self.assertNotContains(response, 'Earthbound')
+
+    def test_unknown_genre_flashes_a_message(self):
+        self.assertContains(self.client.get(reverse('search', args=['no-such-genre'])), 'does not exist')
+
+
+class AssetDeliveryTests(TestCase):
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        media_root = os.path.join(workdir, 'media')
+        os.makedirs(os.path.join(media_root, 'media'))
+        self.photo = bytes(range(256)) * 40
+        with open(os.path.join(media_root, 'media', 'photo.jpg'), 'wb') as file:
+            file.write(self.photo)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, STATIC_ROOT=os.path.join(workdir, 'static'),
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'auctions.assets.CompressedManifestStaticFilesStorage'}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collected_stylesheet_is_hashed_compressed_and_immutable(self):
+        hashed = staticfiles_storage.stored_name('auctions/styles.css')
+        self.assertRegex(hashed, r'^auctions/styles\.[0-9a-f]{12}\.css$')
+        self.assertContains(self.client.get(reverse('index')), f'/static/{hashed}')
+
+        with open(staticfiles_storage.path(hashed), 'rb') as file:
+            original = file.read()
+        response = self.client.get(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), original)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        plain = self.client.get(f'/static/{hashed}')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(f'/static/{hashed}', HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+        # the unhashed source is still there for anything not going through {% static %}
+        self.assertEqual(self.client.get('/static/auctions/styles.css')['Cache-Control'], 'no-cache')
+
+    def test_media_ranges(self):
+        url = '/media/media/photo.jpg'
+        whole = self.client.get(url)
+        self.assertEqual(b''.join(whole.streaming_content), self.photo)
+        self.assertEqual(whole['Accept-Ranges'], 'bytes')
+        self.assertEqual(whole['Cache-Control'], f'public, max-age={settings.MEDIA_MAX_AGE}')
+
+        for header, first, last in [('bytes=0-99', 0, 99), ('bytes=10000-', 10000, 10239), ('bytes=-40', 10200, 10239),
+                                    ('bytes=10200-99999', 10200, 10239)]:
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/{len(self.photo)}')
+            self.assertEqual(b''.join(response.streaming_content), self.photo[first:last + 1])
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20000-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE=whole['ETag']).status_code, 206)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=whole['Last-Modified']).status_code, 304)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/media/nothing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/media').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.post('/media/media/photo.jpg').status_code, 405)
+
+
+class AdminChangelistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'password')
+        cls.genre = Genre.objects.create(name='Puzzle', slug='puzzle')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('admin:index'))  # the staff user is cached from here on
+
+    def add_listings(self, count):
+        for n in range(count):
+            listing = Listing.objects.create(owner=self.staff, title=f'Game {n}', description='A game',
+                                             starting_bid=Decimal('1.00'))
+            listing.genres.add(self.genre)
+            place_bid(listing.pk, self.staff, '2.00')
+
+    def changelist_queries(self, model, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:auctions_{model}_changelist') + query)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        for model in ('listing', 'bid', 'comment', 'user'):
+            self.add_listings(2)
+            few = len(self.changelist_queries(model))
+            self.add_listings(6)
+            self.assertEqual(len(self.changelist_queries(model)), few, model)
+
+    def test_filters(self):
+        self.add_listings(2)
+        Listing.objects.filter(pk=Listing.objects.first().pk).update(status=False)
+        for query in ('?status__exact=0', f'?genres__id__exact={self.genre.pk}', '?date__gte=2000-01-01'):
+            self.assertNotIn('COUNT(*) AS "__count" FROM "auctions_listing"',
+                             ' '.join(self.changelist_queries('listing', query)))
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_large_tables_are_estimated_or_counted_up_to_the_limit(self):
+        self.add_listings(5)
+        # no statistics yet
+        response = self.client.get(reverse('admin:auctions_bid_changelist'))
+        self.assertContains(response, 'more than 3 bids')
+
+        analyze_tables(Bid)
+        queries = ' '.join(self.changelist_queries('bid'))
+        self.assertNotIn('COUNT(', queries)
+        self.assertContains(self.client.get(reverse('admin:auctions_bid_changelist')), 'about 5 bids')
+        response = self.client.get(reverse('admin:auctions_bid_changelist') + '?created__gte=2000-01-01')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertContains(response, 'more than 3 bids')
+        self.assertContains(self.client.get(reverse('admin:auctions_bid_changelist') + '?created__gte=3000-01-01'), '0 bids')
+
+    @override_settings(ARCHIVE_AFTER=0)
+    def test_estimates_follow_the_archive(self):
+        self.add_listings(5)
+        analyze_tables(Listing, Bid)
+        Listing.objects.filter(pk__in=Listing.objects.order_by('pk').values('pk')[:4]).touch(status=False)
+        self.assertEqual(archive_closed(now=timezone.now() + timedelta(seconds=1)), 4)
+        self.assertEqual((estimate_rows(Listing.objects.all()), estimate_rows(Bid.objects.all())), (1, 1))
+
+    def test_csv_export_streams(self):
+        self.add_listings(3)
+        response = self.client.post(reverse('admin:auctions_bid_changelist'), {
+            'action': 'export_csv', 'select_across': '1', 'index': '0',
+            '_selected_action': list(Bid.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,listing_id,bidder__username,bid,created')
+        self.assertEqual(len(lines), 4)
+        self.assertIn(',staff,2.00,', lines[1])
+
+
+# a TransactionTestCase: the replica (a test mirror of the primary) is another connection, which
+# would not see rows left uncommitted by a TestCase
+@override_settings(REPLICA_READS=True)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        self.listing = Listing.objects.create(owner=self.seller, title='Game', description='A game',
+                                              starting_bid=Decimal('5.00'))
+        user_cache().clear()
+        page_cache().clear()
+        card_cache().clear()
+
+    def replica_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url, data)
+        return response, [query['sql'] for query in queries]
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Listing), 'default')
+        self.assertEqual(router.db_for_write(Listing), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'auctions'))
+
+    def test_signed_in_reads_go_to_the_replica(self):
+        self.client.force_login(self.bidder)
+        response, queries = self.replica_queries('get', reverse('listing', args=[self.listing.pk]))
+        self.assertContains(response, 'Place Bid')
+        self.assertTrue(any('auctions_listing' in sql for sql in queries))
+        # sessions and users stay on the primary
+        self.assertFalse([sql for sql in queries if 'django_session' in sql or 'FROM "auctions_user" ' in sql])
+
+    def test_a_bid_pins_the_client_to_the_primary(self):
+        self.client.force_login(self.bidder)
+        url = reverse('listing', args=[self.listing.pk])
+        response, queries = self.replica_queries('post', url, {'bid_amount': 'Place Bid', 'bid': '6.00'})
+        self.assertEqual(queries, [])
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[settings.REPLICA_STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        # reads its own bid
+        response, queries = self.replica_queries('get', url)
+        self.assertEqual(queries, [])
+        self.assertContains(response, '$6.00')
+
+    def test_anonymous_pages_render_on_the_primary(self):
+        # cached and served to everyone, so they must not come from a lagging replica
+        response, queries = self.replica_queries('get', reverse('index'))
+        self.assertContains(response, 'Game')
+        self.assertEqual(queries, [])
+
+    @override_settings(REPLICA_READS=False)
+    def test_off(self):
+        self.client.force_login(self.bidder)
+        _, queries = self.replica_queries('get', reverse('index'))
+        self.assertEqual(queries, [])
+
+    def test_copy_sqlite(self):
+        workdir = tempfile.mkdtemp()
+        try:
+            source, target = os.path.join(workdir, 'primary.sqlite3'), os.path.join(workdir, 'replica.sqlite3')
+            primary = sqlite3.connect(source)
+            primary.execute('CREATE TABLE bids (amount TEXT)')
+            primary.execute("INSERT INTO bids VALUES ('6.00')")
+            primary.commit()
+            primary.close()
+            copy_sqlite(source, target)
+            replica = sqlite3.connect(target)
+            self.assertEqual(replica.execute('SELECT amount FROM bids').fetchall(), [('6.00',)])
+            replica.close()
+        finally:
+            shutil.rmtree(workdir)
+
+
+@override_settings(ARCHIVE_AFTER=0)
+class ArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'password')
+        cls.genre = Genre.objects.create(name='Puzzle', slug='puzzle')
+
+    def setUp(self):
+        page_cache().clear()
+        card_cache().clear()
+        genre_registry.invalidate()
+
+    def closed_listing(self, title='Closed game'):
+        listing = Listing.objects.create(owner=self.seller, title=title, description='A game',
+                                         starting_bid=Decimal('1.00'))
+        listing.genres.add(self.genre)
+        place_bid(listing.pk, self.bidder, '2.00')
+        Comment.objects.create(listing=listing, commenter=self.bidder, comment='Still boxed?')
+        watch(self.bidder, listing.pk)
+        Listing.objects.filter(pk=listing.pk).touch(status=False)
+        return listing
+
+    def test_moves_closed_listings_with_their_rows(self):
+        closed = self.closed_listing()
+        open_listing = Listing.objects.create(owner=self.seller, title='Open game', description='A game',
+                                              starting_bid=Decimal('1.00'))
+        self.assertEqual(archive_closed(), 1)
+
+        self.assertEqual(list(Listing.objects.values_list('pk', flat=True)), [open_listing.pk])
+        self.assertFalse(Bid.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        archived = ArchivedListing.objects.get(pk=closed.pk)
+        self.assertEqual((archived.current_price, archived.bid_count, archived.highest_bidder), (Decimal('2.00'), 1, self.bidder))
+        self.assertEqual(archived.genre_ids, [self.genre.pk])
+        self.assertEqual(list(ArchivedBid.objects.values_list('listing', 'bid')), [(closed.pk, Decimal('2.00'))])
+        self.assertEqual(list(ArchivedComment.objects.values_list('comment', flat=True)), ['Still boxed?'])
+        self.bidder.refresh_from_db()
+        self.assertEqual(self.bidder.watchlist_count, 0)
+        self.assertEqual(archive_closed(), 0)
+
+    @override_settings(ARCHIVE_AFTER=3600)
+    def test_waits_for_archive_after(self):
+        self.closed_listing()
+        self.assertEqual(archive_closed(), 0)
+        self.assertEqual(archive_closed(now=timezone.now() + timedelta(hours=2)), 1)
+
+    def test_inactive_grid_and_listing_page(self):
+        closed = self.closed_listing()
+        self.client.get(reverse('inactive'))  # cached before the move
+        archive_closed()
+        response = self.client.get(reverse('inactive'))
+        self.assertContains(response, 'Closed game')
+        self.assertContains(response, 'Puzzle')
+
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse('listing', args=[closed.pk]))
+        self.assertTemplateUsed(response, 'auctions/archived_listing.html')
+        self.assertContains(response, 'You won this bid')
+        self.assertContains(response, 'Still boxed?')
+        self.assertNotContains(response, 'Place Bid')
+        self.assertEqual(self.client.get(reverse('listing', args=[closed.pk + 1])).status_code, 404)
+
+    @override_settings(LISTINGS_PER_PAGE=2)
+    def test_grids_list_closed_and_archived_listings_newest_first(self):
+        titles = ['Archived 1', 'Closed 2', 'Archived 3', 'Closed 4', 'Archived 5']
+        listings = [self.closed_listing(title) for title in titles]
+        archive_closed()
+        for listing, title in zip(listings, titles):
+            if title.startswith('Closed'):
+                # back out of the archive, as if closed since the last pass
+                restored = Listing.objects.create(pk=listing.pk, owner=self.seller, title=title, description='A game',
+                                                  starting_bid=Decimal('1.00'), status=False)
+                restored.genres.add(self.genre)
+                Listing.objects.filter(pk=listing.pk).update(date=listing.date)
+                ArchivedListing.objects.filter(pk=listing.pk).delete()
+
+        def pages(url, **params):
+            response = self.client.get(url, params)
+            return [listing.title for listing in response.context['listings']], response.context['page']
+
+        for url in (reverse('inactive'), reverse('search', args=['puzzle'])):
+            self.assertEqual(pages(url)[0], ['Archived 5', 'Closed 4'])
+            self.assertEqual(pages(url, page=3)[0], ['Archived 1'])
+            first, page = pages(url, cursor='')
+            second, page = pages(url, cursor=page.next_cursor)
+            self.assertEqual(first + second, ['Archived 5', 'Closed 4', 'Archived 3', 'Closed 2'])
+
+    @override_settings(ROOT_URLCONF=AsyncReadUrls)
+    def test_async_views(self):
+        closed = self.closed_listing()
+        self.assertContains(self.client.get(reverse('inactive')), 'Closed game')
+        archive_closed()
+        self.assertContains(self.client.get(reverse('inactive')), 'Closed game')
+        self.assertContains(self.client.get(reverse('search', args=['puzzle'])), 'Closed game')
+        self.assertContains(self.client.get(reverse('listing', args=[closed.pk])), 'This listing is closed and archived')
@@ -1,16 +1,35 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
 
-urlpatterns = [
-    path("", views.index, name="index"),
-    path("inactive", views.inactive, name="inactive"),
+
+# the read views, from auctions.async_views when ASYNC_READ_VIEWS is on
+def read_patterns(reads):
+    return [
+        path("", reads.index, name="index"),
+        path("inactive", reads.inactive, name="inactive"),
+        path("listing/<int:listing_id>", reads.listing, name="listing"),
+        path("watchlist", reads.watchlist, name="watchlist"),
+        path("search", reads.search, name="search"),
+        path("search/<slug:slug>", reads.search, name="search"),
+    ]
+
+
+urlpatterns = read_patterns(async_views if settings.ASYNC_READ_VIEWS else views) + [
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("create", views.create, name="create"),
-    path("listing/<int:listing_id>", views.listing, name="listing"),
-    path("watchlist", views.watchlist, name="watchlist"),
-    path("search", views.search, name="search"),
-    path("search/<slug:slug>", views.search, name="search")
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
+    path("listing/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
+    path("stats/cards", views.card_cache_stats, name="card_cache_stats"),
+    path("stats/requests", views.request_timings, name="request_timings"),
+
+    # JSON read API (auctions.api)
+    path("api/v1/listings", api.listings, name="api_listings"),
+    path("api/v1/listings/<int:listing_id>", api.listing, name="api_listing"),
+    path("api/v1/listings/<int:listing_id>/bids", api.listing_bids, name="api_listing_bids"),
+    path("api/v1/watchlist", api.watchlist, name="api_watchlist"),
+    path("api/v1/genres", api.genres, name="api_genres")
 ]
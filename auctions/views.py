@@ -1,27 +1,54 @@
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotFound
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 
-from .models import User, Listing, Genre, Bid, Comment
+from .models import User, Listing, Comment, ArchivedListing
 from .forms import NewListingForm, BidForm, CommentForm
+from .pagination import MergedListings, paginate_listings
+from .bidding import price_chart, BidError
+from .bidbook import bid_books, submit_bid
+from .search import search_listings
+from .cards import card_stats
+from .genres import genre_registry
+from .images import enqueue_image_job
+from .events import get_broker, publish_listing_event, format_event
+from .watchlist import is_watching, watch, unwatch
+from .comments import comment_page
+from .instrumentation import request_stats
+from .pagecache import cache_anonymous_page, purge, purge_listing
+from .replicas import read_from_replica
 
 # index page
+@cache_anonymous_page('grids')
+@read_from_replica
 def index(request):
-    active_listings = Listing.objects.filter(status=True)
+    page = paginate_listings(request, Listing.objects.active().for_cards())
     return render(request, "auctions/index.html", {
-        "listings": active_listings,
+        "listings": page.object_list,
+        "page": page,
         "title": 'Active Listings'
     })
 
-# inactive listings page
+# inactive listings page: the closed listings, then those moved to the archive (auctions.archive)
+@cache_anonymous_page('grids')
+@read_from_replica
 def inactive(request):
-    inactive_listings = Listing.objects.filter(status=False)
+    page = paginate_listings(request, MergedListings(Listing.objects.inactive().for_cards(),
+                                                     ArchivedListing.objects.select_related('owner')))
     return render(request, "auctions/inactive.html", {
-        "listings": inactive_listings,
+        "listings": page.object_list,
+        "page": page,
         "title": 'Inactive Listings'
     })
 
@@ -33,14 +60,13 @@ def create(request):
         
         if form.is_valid():
             
-            genres = request.POST.getlist('genres')
             instance = form.save(commit=False)
             instance.owner = request.user
             instance.save()
-        
-            latest_listing = Listing.objects.latest('listing_id')
-            for genres_id in genres:
-                latest_listing.genres.add(genres_id)
+            form.save_m2m()
+            purge('grids')
+            if instance.image:
+                enqueue_image_job(instance)
                 
             messages.success(request, 'Successfully added listing.')
             return HttpResponseRedirect(reverse('index'))
@@ -54,133 +80,208 @@ def create(request):
     })
 
 # listing item information
+@cache_anonymous_page('listing:{listing_id}')
+@read_from_replica
 def listing(request, listing_id):
     try:
-        listing = Listing.objects.get(pk=listing_id)
-    except:
-        messages.error(request, 'Sorry, directing you to this listing item lead to an error. Perhaps it was deleted?')
+        listing = Listing.objects.for_cards().get(pk=listing_id)
+        bid_books.show(listing)
+    except Listing.DoesNotExist:
+        return archived_listing(request, listing_id)
     
     if not request.user.is_authenticated:
         return render(request, "auctions/listing.html", {
             'listing': listing,
-            'comments': Comment.objects.filter(listing=listing_id)
+            'comments': comment_page(listing_id),
+            'price_chart': price_chart(listing),
+            'live_events': settings.LISTING_EVENTS
         })   
     else:
         
-        user = User.objects.get(pk=request.user.id)
-        
         if request.method == "POST":
             
             # bid logic
             if 'bid_amount' in request.POST:
-                bid_form = BidForm(request.POST)
-                user_bid_input = float(request.POST['bid'])
-                bidder_for_listing = Bid.objects.filter(bidder=request.user.id).filter(listing=listing_id)
-                
-                # place first bid
-                if listing.highest_bid is None and user_bid_input >= float(listing.starting_bid):
-                    instance = bid_form.save(commit=False)
-                    instance.bidder = request.user
-                    instance.listing = listing
-                    instance.bid = user_bid_input
-                    instance.save()
-                    
-                    listing.highest_bid = Bid.objects.filter(listing=listing_id).latest('bidder')
-                    listing.save()
-                    messages.success(request, f'Successfully set bid to ${listing.highest_bid.bid:.2f}')
-                
-                # place any higher bidding
-                elif listing.highest_bid is not None and user_bid_input >= listing.highest_bid.bid:
-                    # create new instance for new user
-                    if not bidder_for_listing.exists():
-                        new_bidder = Bid.objects.create(bidder=request.user, listing=listing, bid=user_bid_input)
-                        listing.highest_bid = new_bidder
-                        listing.save()
-                        messages.success(request, f'Hello {new_bidder.bidder}, you have now set the bid to ${listing.highest_bid.bid:.2f}')
-                    # updates previous bid amount
-                    else:
-                        bidder_for_listing.update(bid=user_bid_input)
-                        listing.highest_bid = bidder_for_listing[0]
-                        listing.save()
-                        messages.success(request, f'Successfully updated bid to ${listing.highest_bid.bid:.2f}')
-
-                # error handling for bad bids
+                try:
+                    amount, created = submit_bid(listing, request.user, request.POST.get('bid'))
+                except BidError as error:
+                    messages.error(request, str(error))
                 else:
-                    messages.error(request, f'Unable to update highest bid. ${user_bid_input:.2f} is not higher than starting bid or current highest bid') 
+                    if created:
+                        messages.success(request, f'Successfully set bid to ${amount:.2f}')
+                    else:
+                        messages.success(request, f'Successfully updated bid to ${amount:.2f}')
+                    return HttpResponseRedirect(reverse('listing', args=[listing_id]))
         
             # add listing to watchlist
             elif 'add_watchlist' in request.POST:
-                
-                if not User.objects.filter(pk=request.user.id).filter(watchlist=listing).exists():
-                        user.watchlist.add(listing)
-                        user.save()
-                        messages.success(request, 'Successfully added listing to watchlist')
-                        return HttpResponseRedirect(reverse('listing', args=[listing.listing_id]))
+                if watch(request.user, listing_id):
+                    messages.success(request, 'Successfully added listing to watchlist')
+                    return HttpResponseRedirect(reverse('listing', args=[listing.listing_id]))
                 else:
                     messages.error(request, 'Listing already exists on watchlist')
          
             # remove listing from watchlist
             elif 'remove_watchlist' in request.POST:
-                try: 
-                    user.watchlist.remove(listing)
-                except:
+                if unwatch(request.user, listing_id):
+                    messages.success(request, 'Successfully removed item from Watchlist')
+                else:
                     messages.error(request, 'Sorry unable to remove listing from watchlist')
-                messages.success(request, 'Successfully removed item from Watchlist')
             
             # close listing
+            elif 'close_listing' in request.POST and listing.bid_book and not bid_books.available() and bid_books.held_elsewhere():
+               # the process holding the books has bids of its own to write before a winner is known
+               messages.error(request, 'Sorry, this listing is taking bids elsewhere right now. Please try closing it again.')
+
             elif 'close_listing' in request.POST:
-               listing.status = False
-               listing.save()
-               messages.success(request, f'Successfully closed listing. {listing.highest_bid.bidder} won the auction.')
+               if listing.bid_book:
+                   # its last bids decide the winner, and the flush moves the version on
+                   bid_books.retire(listing_id)
+               # closed in the database, so a bid placed since the listing was read is counted too
+               Listing.objects.filter(pk=listing_id).touch(status=False)
+               listing.refresh_from_db(fields=['status', 'current_price', 'bid_count', 'highest_bidder', 'highest_bid', 'version'])
+               winner = listing.highest_bidder.username if listing.highest_bidder else None
+               transaction.on_commit(lambda: publish_listing_event(listing_id, 'close', winner=winner))
+               purge_listing(listing_id)
+               if listing.highest_bidder is None:
+                   messages.success(request, 'Successfully closed listing. There were no bids.')
+               else:
+                   messages.success(request, f'Successfully closed listing. {listing.highest_bidder} won the auction.')
         
             # comments
             elif 'comment_send' in request.POST:
-                comment = Comment.objects.create(listing=listing, commenter=request.user, comment=request.POST['comment'])
-                comment.save()
+                Comment.objects.create(listing=listing, commenter=request.user, comment=request.POST['comment'])
+                Listing.objects.filter(pk=listing_id).touch()
+                purge_listing(listing_id, grids=False)
             
                 
         return render(request, "auctions/listing.html", {
             "listing": listing,
-            "bids": Bid.objects.filter(listing=listing_id),
             "bid_form": BidForm(),
             "comment_form": CommentForm(),
-            "user": user,
-            "watchlist": user.watchlist.all(),
-            "comments": Comment.objects.filter(listing=listing_id)
+            "watching": is_watching(request.user, listing_id),
+            "comments": comment_page(listing_id),
+            "price_chart": price_chart(listing),
+            "live_events": settings.LISTING_EVENTS
         })
 
+# a closed listing moved to the archive: read-only, with its latest comments
+def archived_listing(request, listing_id):
+    try:
+        listing = ArchivedListing.objects.select_related('owner', 'highest_bidder').get(pk=listing_id)
+    except ArchivedListing.DoesNotExist:
+        raise Http404('No such listing.')
+    genres = (genre_registry.by_id(genre_id) for genre_id in listing.genre_ids)
+    return render(request, "auctions/archived_listing.html", {
+        'listing': listing,
+        'genres': sorted(filter(None, genres), key=lambda genre: genre.name),
+        'comments': listing.comments.select_related('commenter').order_by('-created')[:settings.COMMENTS_PER_PAGE],
+    })
+
+# older comments of a listing, as a fragment for the listing page's "Load older comments" button
+@cache_anonymous_page('listing:{listing_id}')
+def listing_comments(request, listing_id):
+    return render(request, "auctions/comments.html", {
+        'comments': comment_page(listing_id, request.GET.get('cursor')),
+        'listing_id': listing_id
+    })
+
 # watchlist page
 @login_required
 def watchlist(request):
-    user = User.objects.get(pk=request.user.id)
-    watchlist = user.watchlist.all()
+    page = paginate_listings(request, request.user.watchlist.for_cards())
             
     return render(request, "auctions/watchlist.html", {
-        "listings": watchlist,
+        "listings": page.object_list,
+        "page": page,
+        "all_watched": True,
         "title": "Watchlist"
     })
 
-# search by category (genres)
+# search by category (genres) and/or keyword (?q=)
+@cache_anonymous_page('grids')
+@read_from_replica
 def search(request, slug=None):
-    genres = Genre.objects.all()
+    genre = genre_registry.by_slug(slug) if slug is not None else None
+    query = request.GET.get('q', '').strip()
     
     # check if slug url exists 
-    if not genres.filter(slug=slug).exists() and slug is not None:
+    if genre is None and slug is not None:
         messages.error(request, 'Sorry this category/genre does not exist in the database. Please select the below options.')
-    else:
+    elif query:
+        page = search_listings(query, genre, request.GET.get('page'))
+        return render(request, "auctions/index.html", {
+            'listings': page.object_list,
+            'page': page,
+            'page_query': urlencode({'q': query}) + '&',
+            'query': query,
+            'facets': page.facets,
+            'title': f'Results for "{query}"' + (f' in {genre}' if genre else '')
+        })
+    elif genre is not None:
     # match slug to available listings
-        listings = Listing.objects.all()
-        if slug is not None:
-            listings_searched = listings.filter(genres=genres.filter(slug=slug)[0].id)
-            return render(request, "auctions/index.html", {
-                'listings': listings_searched
-            })
+        page = paginate_listings(request, MergedListings(Listing.objects.for_cards().filter(genres=genre.id),
+                                                         ArchivedListing.objects.select_related('owner').in_genre(genre.id)))
+        return render(request, "auctions/index.html", {
+            'listings': page.object_list,
+            'page': page,
+            'title': genre.name
+        })
             
     return render(request, "auctions/search.html", {
-        'genres': genres
+        'genres': genre_registry.all()
     })
     
     
+# hit/miss counters of the listing card cache
+@staff_member_required
+def card_cache_stats(request):
+    return JsonResponse(card_stats())
+
+
+# rolling per-view timings collected by auctions.instrumentation
+@staff_member_required
+def request_timings(request):
+    if request.method == "POST":
+        request_stats.reset()
+        return HttpResponseRedirect(reverse('request_timings'))
+    return render(request, "auctions/request_timings.html", {
+        'enabled': settings.PERF_INSTRUMENTATION,
+        'rows': request_stats.summary(),
+        'window': settings.PERF_WINDOW
+    })
+
+
+# live bid and close events for a listing page, as Server-Sent Events; needs an ASGI server, since
+# Django's WSGI handler buffers an async stream until it ends
+async def listing_events(request, listing_id):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Live listing events are only served over ASGI.', status=501, content_type='text/plain')
+    subscription = get_broker().subscribe(listing_id)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            # streams end after a while and EventSource reconnects, so a stream whose client has
+            # gone away is not held open for long
+            closes_at = time.monotonic() + settings.LISTING_EVENTS_MAX_AGE
+            while time.monotonic() < closes_at:
+                try:
+                    event = await subscription.get(timeout=settings.LISTING_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                else:
+                    yield format_event(event)
+                    if event['event'] == 'close':
+                        break
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 
 def login_view(request):
     if request.method == "POST":
@@ -225,7 +326,6 @@ def register(request):
         # Attempt to create new user
         try:
             user = User.objects.create_user(username, email, password)
-            user.save()
         except IntegrityError:
             return render(request, "auctions/register.html", {
                 "message": "Username already taken."
@@ -0,0 +1,89 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .auth import forget_all_users, forget_user
+from .models import User, Listing
+from .pagecache import purge_listing
+
+# the watchlist link table; Django gives it a unique (user_id, listing_id) index
+Watch = User.watchlist.through
+
+
+def is_watching(user, listing_id):
+    return user.is_authenticated and Watch.objects.filter(user_id=user.pk, listing_id=listing_id).exists()
+
+
+async def ais_watching(user, listing_id):
+    return user.is_authenticated and await Watch.objects.filter(user_id=user.pk, listing_id=listing_id).aexists()
+
+
+def watched_ids(user, listing_ids):
+    """The subset of `listing_ids` on the user's watchlist, in one query."""
+    if not user.is_authenticated or not listing_ids:
+        return set()
+    return set(Watch.objects.filter(user_id=user.pk, listing_id__in=listing_ids).values_list('listing_id', flat=True))
+
+
+async def awatched_ids(user, listing_ids):
+    if not user.is_authenticated or not listing_ids:
+        return set()
+    links = Watch.objects.filter(user_id=user.pk, listing_id__in=listing_ids).values_list('listing_id', flat=True)
+    return {listing_id async for listing_id in links}
+
+
+# Both add and remove keep Listing.watcher_count and User.watchlist_count in step with the link
+# table, so nothing has to count it to show them. Changes made through the relation instead (the
+# admin's user form, user.watchlist.add() and the like) recount the rows they touch
+# (auctions.signals).
+
+def watch(user, listing_id):
+    """Put a listing on the user's watchlist; returns False if it was already there."""
+    try:
+        with transaction.atomic():
+            Watch.objects.create(user_id=user.pk, listing_id=listing_id)
+            Listing.objects.filter(pk=listing_id).update(watcher_count=F('watcher_count') + 1)
+            User.objects.filter(pk=user.pk).update(watchlist_count=F('watchlist_count') + 1)
+            forget_user(user.pk)
+            purge_listing(listing_id, grids=False)
+    except IntegrityError:
+        return False
+    user.watchlist_count += 1
+    return True
+
+
+def unwatch(user, listing_id):
+    """Take a listing off the user's watchlist; returns False if it was not on it."""
+    with transaction.atomic():
+        removed, _ = Watch.objects.filter(user_id=user.pk, listing_id=listing_id).delete()
+        if removed:
+            Listing.objects.filter(pk=listing_id).update(watcher_count=F('watcher_count') - 1)
+            User.objects.filter(pk=user.pk).update(watchlist_count=F('watchlist_count') - 1)
+            forget_user(user.pk)
+            purge_listing(listing_id, grids=False)
+    if removed:
+        user.watchlist_count -= 1
+    return bool(removed)
+
+
+def recount_watchlists(user_ids=None, listing_ids=None):
+    """Recompute both counters from the link table: everyone's, after loads that bypass watch(), or
+    only those of the given users and listings."""
+    def count(**link):
+        field, = link
+        counts = Watch.objects.filter(**link).values(field).annotate(count=Count('*')).values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    if user_ids is None and listing_ids is None:
+        User.objects.update(watchlist_count=count(user=OuterRef('pk')))
+        Listing.objects.update(watcher_count=count(listing=OuterRef('pk')))
+        forget_all_users()
+        return
+
+    user_ids, listing_ids = user_ids or (), listing_ids or ()
+    User.objects.filter(pk__in=user_ids).update(watchlist_count=count(user=OuterRef('pk')))
+    Listing.objects.filter(pk__in=listing_ids).update(watcher_count=count(listing=OuterRef('pk')))
+    for user_id in user_ids:
+        forget_user(user_id)
+    for listing_id in listing_ids:
+        purge_listing(listing_id, grids=False)
@@ -3,6 +3,11 @@ ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live listing event streams (auctions.views.listing_events) are long-lived async responses and
+need to be served through this entry point, e.g. ``uvicorn commerce.asgi:application``, which
+turns on LISTING_EVENTS so listing pages subscribe to them. It also serves the async versions of
+the read views (ASYNC_READ_VIEWS) unless the environment sets ASYNC_READ_VIEWS=0.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
@@ -12,5 +17,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+os.environ.setdefault('LISTING_EVENTS', '1')
 
 application = get_asgi_application()
+
+# image variant jobs queued before this process started (auctions.images)
+from auctions.images import start_image_workers  # noqa: E402
+
+start_image_workers()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -41,8 +43,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings cover the rest of the chain
+    'auctions.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # only while REPLICA_READS is on
+    'auctions.replicas.PrimaryStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -54,7 +60,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for auctions.instrumentation
+        'BACKEND': 'auctions.instrumentation.TimedTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,15 +80,177 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
+# Pick a profile with the DATABASE_PROFILE environment variable:
+#   sqlite-wal (default)  db.sqlite3 (or SQLITE_PATH) in WAL mode, with SQLITE_PRAGMAS applied to every new connection
+#   sqlite                db.sqlite3 (or SQLITE_PATH) with SQLite's defaults (rollback journal)
+#   postgres              PostgreSQL from the POSTGRES_* variables below (needs psycopg installed)
+# Connections are kept open between requests for DATABASE_CONN_MAX_AGE seconds (0 closes them
+# after every request, None keeps them forever).
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite-wal')
+CONN_MAX_AGE = os.environ.get('DATABASE_CONN_MAX_AGE', '600')
+CONN_MAX_AGE = None if CONN_MAX_AGE.lower() == 'none' else int(CONN_MAX_AGE)
+
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'commerce'),
+            'USER': os.environ.get('POSTGRES_USER', 'commerce'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # a persistent connection that the server dropped is replaced instead of failing a request
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif DATABASE_PROFILE in ('sqlite', 'sqlite-wal'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # wait for the write lock under concurrent bidding instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 20},
+            # a file rather than shared-cache memory, so threaded tests get real locking
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DATABASE_PROFILE {DATABASE_PROFILE!r}")
+
+# Read replica (auctions.replicas): with DATABASE_REPLICA=1, signed-in GETs of the read-only views
+# (grids, search, listing pages) read from the 'replica' alias, and a client that has just written
+# reads from the primary for REPLICA_STICKY_SECONDS. For the SQLite profiles the replica is the file
+# SQLITE_REPLICA_PATH, refreshed from the primary by `manage.py sync_replica`; for postgres it is
+# the server at POSTGRES_REPLICA_HOST. Tests point it at the test database.
+REPLICA_ALIAS = 'replica'
+REPLICA_READS = os.environ.get('DATABASE_REPLICA') == '1'
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'read_primary'
+
+DATABASES[REPLICA_ALIAS] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+if DATABASE_PROFILE == 'postgres':
+    DATABASES[REPLICA_ALIAS]['HOST'] = os.environ.get('POSTGRES_REPLICA_HOST', DATABASES['default']['HOST'])
+else:
+    DATABASES[REPLICA_ALIAS]['NAME'] = os.environ.get('SQLITE_REPLICA_PATH', os.path.join(BASE_DIR, 'db.replica.sqlite3'))
+DATABASE_ROUTERS = ['auctions.replicas.ReplicaRouter']
+
+# Run on each new SQLite connection (auctions.signals). In WAL mode readers no longer block the
+# writer or each other, and with synchronous=NORMAL a commit does not wait for an fsync; the rest
+# keep more of the database in memory.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,  # KiB
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+} if DATABASE_PROFILE == 'sqlite-wal' else {}
+
+AUTH_USER_MODEL = 'auctions.User'
 
-DATABASES = {
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Rendered listing cards live in their own cache; for a cache shared between worker processes use
+# 'django.core.cache.backends.filebased.FileBasedCache' with a directory as LOCATION.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'cards': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'listing-cards',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # purges are recorded in this cache too, so every worker process has to share it
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'anonymous-pages',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # with SESSION_BACKEND=cache this is the only copy of a session, so it has to be shared and
+    # must not evict (SHARED_CACHE_URL below)
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'users',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
-AUTH_USER_MODEL = 'auctions.User'
+# The caches every worker process has to see the same way: the page cache's purges, and the
+# cached sessions and users that a sign-out, password change or deactivation evicts. Set
+# SHARED_CACHE_URL to a Redis server (redis://host:6379/0) to keep them there; without one they are
+# private to each process, and the session and user caches stay off (auctions.checks refuses them).
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL')
+if SHARED_CACHE_URL:
+    for alias in ('pages', 'sessions', 'users'):
+        CACHES[alias] = {**CACHES[alias], 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                         'LOCATION': SHARED_CACHE_URL, 'KEY_PREFIX': CACHES[alias]['LOCATION']}
+
+CARD_CACHE_ALIAS = 'cards'
+
+# Anonymous full-page cache (auctions.pagecache): seconds a page is served without re-rendering,
+# and the window after it goes stale or is purged in which one request re-renders it while the
+# rest are served the stale copy
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE = 10
+
+# The genre registry (auctions.genres) is a per-process snapshot; a change to the genres is
+# announced through this shared cache, which each process checks at most this many seconds apart
+GENRE_CACHE_ALIAS = 'pages'
+GENRE_REGISTRY_CHECK_INTERVAL = 5
+
+# Sessions: pick the store with the SESSION_BACKEND environment variable:
+#   cached_db            the database, read through the 'sessions' cache (the default with a
+#                        SHARED_CACHE_URL)
+#   db                   the database, read on every signed-in request (the default without one)
+#   cache                the 'sessions' cache alone; sign-ins do not survive losing it
+#   signed_cookies       the cookie itself, signed with SECRET_KEY: no server-side state, which
+#                        also means signing out cannot revoke a copied cookie before it expires
+# With USER_CACHE (on by default with a SHARED_CACHE_URL) the signed-in user is then loaded through
+# auctions.auth.CachedModelBackend, from the 'users' cache for up to USER_CACHE_TIMEOUT seconds.
+# The cache-backed choices need the shared cache: a system check fails them on a per-process one.
+
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if SHARED_CACHE_URL else 'db')
+if SESSION_BACKEND not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r}")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+
+USER_CACHE = os.environ.get('USER_CACHE', '1' if SHARED_CACHE_URL else '0') == '1'
+AUTHENTICATION_BACKENDS = ['auctions.auth.CachedModelBackend' if USER_CACHE else 'django.contrib.auth.backends.ModelBackend']
+USER_CACHE_ALIAS = 'users'
+USER_CACHE_TIMEOUT = 5 * 60
+
+# Password hashing: new passwords are hashed with PBKDF2 at PASSWORD_HASH_ITERATIONS rounds (Django
+# 4.2's default is 600000), which is most of the cost of registering and signing in; measure the
+# trade-off with `manage.py bench_auth`. Stored hashes keep working at any setting and are
+# re-hashed at the current cost on their owner's next sign-in.
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '600000'))
+
+PASSWORD_HASHERS = [
+    'auctions.auth.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -120,8 +289,88 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+# collectstatic's target, served by auctions.assets (or a front-end server) when DEBUG is off
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT  = os.path.join(BASE_DIR, 'auctions/media')
+# seconds browsers reuse an upload or image variant before revalidating it
+MEDIA_MAX_AGE = 24 * 60 * 60
 
+# Static files get content-hashed names and pre-compressed variants at collectstatic time once
+# DEBUG is off; the development server serves the sources as they are
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'auctions.assets.CompressedManifestStaticFilesStorage'),
+    },
+}
 
+# Number of listing cards per page on the listing grids
+LISTINGS_PER_PAGE = 24
+
+# Admin changelists (auctions.admin) count filtered rows up to this many ("more than" past it), and
+# estimate whole tables larger than it from the database's statistics, instead of counting every
+# row on each page view
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Comments shown on a listing page, and loaded per "older comments" request
+COMMENTS_PER_PAGE = 20
+
+# Bid price history (auctions.bidding): seconds each bucket covers, and how many of a listing's
+# latest buckets its price chart shows
+BID_BUCKET_SECONDS = 60 * 60
+BID_CHART_BUCKETS = 48
+
+# Bid books (auctions.bidbook) for listings marked bid_book: bids are accepted in memory and
+# written to the database in batches, every BID_BOOK_FLUSH_INTERVAL seconds (None: only when a
+# listing closes or the process exits) or sooner once BID_BOOK_BATCH_SIZE are waiting. Each
+# accepted bid is first appended, and with BID_BOOK_FSYNC fsynced, to the write-ahead file
+# BID_BOOK_WAL, replayed after a crash. One process at a time holds the file, and the others
+# refuse bids on bid book listings, trying for the file again every BID_BOOK_RETRY_INTERVAL
+# seconds; None turns books off.
+BID_BOOK_WAL = os.path.join(BASE_DIR, 'bids.wal')
+# the tests get a scratch BID_BOOK_WAL of their own
+TEST_RUNNER = 'auctions.testrunner.AuctionsTestRunner'
+BID_BOOK_FSYNC = True
+BID_BOOK_FLUSH_INTERVAL = 0.2
+BID_BOOK_BATCH_SIZE = 500
+BID_BOOK_RETRY_INTERVAL = 1
+# seconds past its end time before the close sweep (auctions.closing) closes a bid book listing,
+# for bids accepted just before the end to reach the log
+BID_BOOK_CLOSE_DELAY = 5
+
+# Closed listings move to the archive tables (auctions.archive) this many seconds after closing,
+# on the next pass of `manage.py archive_listings --loop`; the inactive grid lists both tables
+ARCHIVE_AFTER = 60 * 60
+
+# Listing image variants (auctions.images): background worker threads per server process, which
+# take new uploads and drain the queued jobs at startup (0 leaves jobs to `manage.py
+# process_images`), and the bounding box of grid thumbnails
+IMAGE_WORKERS = 2
+LISTING_THUMBNAIL_SIZE = (300, 300)
+
+# Live listing updates (auctions.events): the broker class fanning bid/close events out to listing
+# pages, and the keepalive interval and maximum lifetime (seconds) of each event stream
+LISTING_EVENT_BROKER = 'auctions.events.InProcessBroker'
+LISTING_EVENTS_HEARTBEAT = 15
+LISTING_EVENTS_MAX_AGE = 300
+# whether listing pages open an event stream at all: only when served over ASGI, which
+# commerce.asgi turns on (under WSGI a stream would hold a worker thread and deliver nothing)
+LISTING_EVENTS = os.environ.get('LISTING_EVENTS') == '1'
+
+# Request instrumentation (auctions.instrumentation), off unless PERF_INSTRUMENTATION=1 is set in
+# the environment: per-view timings in Server-Timing headers and on /stats/requests, samples kept
+# per view, and the wall time (ms) above which a request is logged with its SQL (None to never)
+PERF_INSTRUMENTATION = os.environ.get('PERF_INSTRUMENTATION') == '1'
+PERF_WINDOW = 1000
+PERF_SLOW_REQUEST_MS = 500
+
+# Route the read views (grids, search, watchlist, listing pages) to their async versions in
+# auctions.async_views. commerce.asgi turns this on; under WSGI every async view would run in an
+# event loop of its own, so the sync views are the better fit there. PERF_INSTRUMENTATION's
+# middleware is sync-only and puts a thread back under each request while it is on.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
@@ -15,12 +15,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
-from django.conf.urls.static import static
 from django.conf import settings
 
+from auctions import assets
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path(f"{settings.STATIC_URL.lstrip('/')}<path:path>", assets.serve_static, name="static_file"),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", assets.serve_media, name="media_file"),
     path("", include("auctions.urls")),
-]
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
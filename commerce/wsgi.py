@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
 application = get_wsgi_application()
+
+# image variant jobs queued before this process started (auctions.images)
+from auctions.images import start_image_workers  # noqa: E402
+
+start_image_workers()